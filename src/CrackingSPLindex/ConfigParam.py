@@ -16,6 +16,28 @@ class Config(object):
             self.threshold = 11.5
             self.max_depth = 300
 
+            # params for interval cracking ("columnar" or "list" storage of cluster intervals)
+            self.cracking_storage = "columnar"
+            self.cracking_policy = "standard"    # "standard", "dd1r", "ddr", "dd1c" or "ddc" (see crackingPolicy.py)
+            self.cracking_max_entries = 128      # stop-cracking threshold, or "auto" to calibrate it (see autoTuning.py)
+            self.cracking_long_interval_length = "auto"    # intervals longer than this skip cracking (see longIntervals.py)
+            self.cluster_memory_budget = None    # bytes of cluster indexes kept in memory, None keeps all (see indexCache.py)
+            self.cluster_eviction_policy = "lru"    # "lru" or "lfu", which cluster index is evicted first
+            self.cluster_spill_dir = None    # evicted cluster indexes are saved here and reloaded, None drops them
+            self.cluster_store_path = None    # out-of-core mode: intervals of the clusters memory-mapped from this file
+
+            # params for Z-addresses (grid of 1 / morton_scale_factor degrees, 16 or 32 bits per axis, see ZAdress.py)
+            self.space_filling_curve = "morton"    # "morton" or "hilbert" keys (see spaceFillingCurve.py)
+            self.morton_scale_factor = 100
+            self.morton_bits = 16
+            self.query_max_ranges = 1    # Z-ranges a query rectangle is split into, 1 keeps one (see MortonCode.decompose_query)
+            self.query_batch_size = None    # Queries answered together by the batch API, None answers them one by one
+            self.collect_query_stats = False    # Record per-query counters in CrackingSPLindex.stats (see queryStats.py)
+            self.trace_queries = False    # Time the phases of every query in CrackingSPLindex.tracer (see tracing.py)
+            self.trace_max_events = 1000000    # Spans kept for the Chrome trace, the phase histograms count all of them
+            self.result_cache_bytes = None    # Byte budget of the query result cache, None disables it (see resultCache.py)
+            self.index_path = None    # Restore the cracked index from this file and save it back after the queries (see persistence.py)
+
             # Data path
             filename = "data/"
             self.water_query_range_path = os.path.join(filename, "query_ranges_water_100k.npy")
@@ -1,7 +1,21 @@
 
+import heapq
+
+import numpy as np
+
+
 class MortonCode:
-    def __init__(self, scaleFactor=100):
+    def __init__(self, scaleFactor=100, bits=16):
+        # Coordinates are rounded to a grid of 1 / scaleFactor degrees and every axis takes `bits` bits:
+        # 16 bits interleave to 32-bit codes (z_order_index_to_int), 32 bits to 64-bit codes (z_order_index_to_long)
+        if bits not in (16, 32):
+            raise ValueError(f"bits must be 16 or 32, got {bits}")
+        if round(360 * scaleFactor) >= 2 ** bits:
+            raise ValueError(f"A scaleFactor of {scaleFactor} needs more than {bits} bits per axis")
         self.scaleFactor = scaleFactor
+        self.bits = bits
+        self.levels = bits    # the grid is a quadtree of 2 ** levels cells per axis
+        self.z_order_index = self.z_order_index_to_int if bits == 16 else self.z_order_index_to_long
 
     def z_order_index_to_int(self, x, y):
         x = (x | (x << 16)) & 0x0000FFFF
@@ -37,8 +51,16 @@ class MortonCode:
         return xx | (yy << 1)
 
     def interleave_latlng(self, lat, lng):
+        x, y = self.grid_coordinates(lat, lng)
+        morton_code = self.z_order_index(x, y)  #The order of x and y is important
+        return morton_code
+
+    def grid_coordinates(self, lat, lng):
         # Latitude = y-coordinate
         # Longitude = x-coordinate
+        if self.bits == 32:
+            # Finer grids than float32 coordinates can resolve are computed in double precision
+            lat, lng = float(lat), float(lng)
         if lng > 180:
             x = (lng % 180) + 180.0
         elif lng < -180:
@@ -54,6 +76,93 @@ class MortonCode:
 
         x = round(x * self.scaleFactor)
         y = round(y * self.scaleFactor)
+        return x, y
 
-        morton_code = self.z_order_index_to_int(x, y)  #The order of x and y is important
-        return morton_code
+    def interleave_latlng_array(self, lat, lng):
+        # Same encoding as interleave_latlng for NumPy columns of latitudes and longitudes,
+        # z_order_index interleaves the bits of whole int64 arrays as it does for ints
+        x, y = self.grid_coordinates_array(lat, lng)
+        return self.z_order_index(x, y)
+
+    def grid_coordinates_array(self, lat, lng):
+        dtype = np.float64 if self.bits == 32 else None
+        lat, lng = np.asarray(lat, dtype=dtype), np.asarray(lng, dtype=dtype)
+        x = np.where(lng > 180, (lng % 180) + 180.0, np.where(lng < -180, (-((-lng) % 180)) + 180.0, lng + 180.0))
+        y = np.where(lat > 90, (lat % 90) + 90.0, np.where(lat < -90, (-((-lat) % 90)) + 90.0, lat + 90.0))
+
+        x = np.rint(x * self.scaleFactor).astype(np.int64)
+        y = np.rint(y * self.scaleFactor).astype(np.int64)
+        return x, y
+
+    def mbr_z_intervals(self, mbrs):
+        # Z-intervals (zmin, zmax) of an (n, 4) array of MBRs (minx, miny, maxx, maxy)
+        mbrs = np.asarray(mbrs).reshape(-1, 4)
+        z_low = self.interleave_latlng_array(mbrs[:, 1], mbrs[:, 0])    # miny, minx
+        z_high = self.interleave_latlng_array(mbrs[:, 3], mbrs[:, 2])   # maxy, maxx
+        # Ensure zmin is always less than zmax
+        return np.minimum(z_low, z_high), np.maximum(z_low, z_high)
+
+    def mbr_z_interval(self, mbr):
+        # Z-interval (zmin, zmax) of one MBR or query rectangle (minx, miny, maxx, maxy)
+        z_low = self.interleave_latlng(mbr[1], mbr[0])
+        z_high = self.interleave_latlng(mbr[3], mbr[2])
+        return min(z_low, z_high), max(z_low, z_high)
+
+    def decompose_query(self, query, max_ranges=8):
+        """
+           Splits the Z-interval of a query rectangle (xmin, ymin, xmax, ymax) into at most max_ranges disjoint
+           Z-ranges that together cover every grid cell of the rectangle.
+
+           The single interval between the Z-addresses of the corners also covers every cell of the curve that runs
+           outside the rectangle. Like BIGMIN/LITMAX, the decomposition walks the quadrants of the grid: the largest
+           quadrants crossing the rectangle are split first, quadrants outside it are dropped and quadrants inside it
+           become ranges. Adjacent ranges are joined, and the closest ranges are merged until max_ranges are left.
+
+           :return: A list of (zmin, zmax) ranges in ascending order
+        """
+        xmin, ymin, xmax, ymax = query
+        x_low, y_low = self.grid_coordinates(ymin, xmin)
+        x_high, y_high = self.grid_coordinates(ymax, xmax)
+        z_low, z_high = self.mbr_z_interval(query)
+        if max_ranges <= 1 or x_low > x_high or y_low > y_high:
+            return [(z_low, z_high)]
+
+        # Quadrants are (level, x, y), covering the grid cells [x << level, (x + 1) << level) on both axes
+        inside = []
+        crossing = [(-self.levels, 0, 0)]   # heap, largest quadrants first
+        while crossing and len(inside) + len(crossing) < 4 * max_ranges:
+            level, qx, qy = heapq.heappop(crossing)
+            level = -level - 1
+            for x in (2 * qx, 2 * qx + 1):
+                for y in (2 * qy, 2 * qy + 1):
+                    cell_x_low, cell_x_high = x << level, ((x + 1) << level) - 1
+                    cell_y_low, cell_y_high = y << level, ((y + 1) << level) - 1
+                    if cell_x_high < x_low or cell_x_low > x_high or cell_y_high < y_low or cell_y_low > y_high:
+                        continue
+                    if x_low <= cell_x_low and cell_x_high <= x_high and y_low <= cell_y_low and cell_y_high <= y_high:
+                        inside.append((level, x, y))
+                    else:
+                        heapq.heappush(crossing, (-level, x, y))
+
+        # Z-ranges of the quadrants (every quadrant is one run of the curve), clipped to the Z-interval of the query
+        z_ranges = []
+        for level, x, y in inside + [(-level, x, y) for level, x, y in crossing]:
+            z_start = (self.z_order_index(x << level, y << level) >> (2 * level)) << (2 * level)
+            z_ranges.append((max(z_start, z_low), min(z_start + (1 << (2 * level)) - 1, z_high)))
+        z_ranges.sort()
+
+        merged = [z_ranges[0]]
+        for z_start, z_end in z_ranges[1:]:
+            if z_start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], z_end))
+            else:
+                merged.append((z_start, z_end))
+
+        # Keep the max_ranges - 1 widest gaps between the ranges, and merge the ranges across all other gaps
+        if len(merged) > max_ranges:
+            gaps = sorted(range(1, len(merged)), key=lambda i: merged[i][0] - merged[i - 1][1], reverse=True)
+            splits = sorted(gaps[:max_ranges - 1])
+            starts = [0] + splits
+            ends = [split - 1 for split in splits] + [len(merged) - 1]
+            merged = [(merged[start][0], merged[end][1]) for start, end in zip(starts, ends)]
+        return merged
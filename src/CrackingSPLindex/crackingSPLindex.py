@@ -14,6 +14,58 @@
     3- Reusing the Tree Structure:
      - For subsequent queries on the same cluster, the code checks if the cluster_id already exists in SPLindex.cluster_indices.
      - If it exists, it retrieves the IntervalCracking instance (which contains the Interval-tree) and uses it to perform the query, instead of building the tree from scratch.
+
+    4- Cracking Storage:
+     - Config().cracking_storage selects how the intervals of a cluster are stored: "columnar" keeps them in NumPy
+       arrays (ColumnarIntervalCracking) and "list" keeps them as a list of (Interval, data) tuples (IntervalCracking).
+
+    5- Query Decomposition:
+     - The Z-interval between the corners of a query rectangle also covers the parts of the Z-curve that run outside it.
+       queryAdaptiveSPLindex splits it into up to Config().query_max_ranges disjoint Z-ranges (MortonCode.decompose_query),
+       predicts the clusters of every range and cracks each predicted cluster on all of them (adaptiveSearchRanges).
+       adaptiveCount / adaptiveExists and queryAdaptiveSPLindexBatch decompose their queries the same way
+       (adaptiveCountRanges, adaptiveSearchBatchRanges).
+
+    6- Space-Filling Curve:
+     - Config().space_filling_curve selects the keys of MBRs, clusters and queries: "morton" (Z-order) or "hilbert"
+       (see spaceFillingCurve.py). The cluster sorting, the learned model and the cracking indexes work on either key.
+
+    7- Query Stats:
+     - With Config().collect_query_stats, CrackingSPLindex.stats (a QueryStats shared by all cluster indexes) records
+       the counters of every query: tree nodes, cracks, scanned and refined entries, results, and the clusters the
+       model predicted against the ones that returned results. stats.toNumpy() / stats.toCSV(path) export them.
+       queryAdaptiveSPLindexBatch records every query of a batch too, sharing the work done for several queries.
+
+    8- Query Tracing:
+     - With Config().trace_queries, CrackingSPLindex.tracer (a Tracer shared by all cluster indexes) times the phases
+       of every query: query encoding, cluster prediction, first-touch index construction, partitioning, child
+       construction and refinement. tracer.toChromeTrace(path) exports the spans for chrome://tracing or Perfetto,
+       and tracer.summary() gives the duration percentiles of every phase over a whole replay.
+
+    9- Memory Budget:
+     - With Config().cluster_memory_budget, cluster_indices is an IndexCache (see IntervalCracking/indexCache.py) that
+       measures the cluster indexes and evicts the least recently (or frequently) used ones once they exceed the
+       budget. An evicted index is rebuilt from all_mbr_z_intervals when its cluster is queried again, or, with
+       Config().cluster_spill_dir, saved with its cracks and memory-mapped back.
+
+    10- Out-of-Core Clusters:
+     - With Config().cluster_store_path, getClusters no longer keeps the clusters in memory. buildClusterStore writes
+       the intervals of every cluster, sorted by cluster, to a file at that path, and returns a ClusterIntervals
+       that memory-maps it in place of the all_mbr_z_intervals dict: a cluster is read from disk only when
+       predClusterIdsRangeQuery first predicts it. Only X (16 bytes per MBR) and the indexes of the clusters queried
+       so far (bounded by Config().cluster_memory_budget) stay in memory.
+
+    11- Result Cache:
+     - With Config().result_cache_bytes, queryAdaptiveSPLindex keeps the results of recent queries in a
+       QueryResultCache (see resultCache.py). A repeated query returns the cached results, and a query inside a
+       cached rectangle filters them, both without predicting or cracking clusters. result_cache counts the exact
+       hits, containment hits, misses and evictions.
+
+    12- Saving and Restoring:
+     - CrackingSPLindex.save(path, model, all_mbr_z_intervals) writes the learned model, the cracking index of every
+       cluster queried so far (pieces, trees, sorted leaves) and the intervals of the other clusters to one versioned
+       file (see IntervalCracking/persistence.py). CrackingSPLindex.load(path) maps it back without clustering or
+       cracking anything, so a restarted process answers queries at the latency the saved one had reached.
 """
 
 
@@ -21,6 +73,7 @@
 import os
 import sys
 import logging
+from collections.abc import Mapping
 import numpy as np
 from sklearn.cluster import Birch
 
@@ -30,11 +83,19 @@ sys.path.append(parent_dir)
 
 from IntervalCracking.interval_structures import Interval
 from IntervalCracking.intervalCracking import IntervalCracking
+from IntervalCracking.columnarIntervalCracking import ColumnarIntervalCracking
+from IntervalCracking.queryStats import QueryStats
+from IntervalCracking.tracing import Tracer
+from IntervalCracking.persistence import writeArrays, createArrays, readArrays, indexArrays, indexFromArrays
+from IntervalCracking.indexCache import IndexCache
 
 #from IntervalCracking.improvedIntervalCracking import IntervalCracking, Interval
 from ConfigParam import Config
-from ZAdress import MortonCode
+from spaceFillingCurve import getCurveEncoder, HilbertCode
+from treeModel import treeModelArrays, treeModelFromArrays
+from resultCache import QueryResultCache
 from helpers import calculate_bounding_box
+from datasetStore import polygonMBRs
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -54,9 +115,16 @@ class CrackingSPLindex:
         if not hasattr(self, 'initialized'):
             self.polygons = polygons
             self.config = Config()
-            self.morton_encoder = MortonCode()
-            self.X = np.array([self.getMBR(polygon) for polygon in self.polygons], dtype=np.float32)
+            self.curve_encoder = getCurveEncoder(self.config.space_filling_curve, self.config.morton_scale_factor,
+                                                 self.config.morton_bits)
+            # An (n, 4) array of MBRs (from datasetStore.py or syntheticData.py) stands in for the polygons
+            self.X = polygonMBRs(polygons).astype(np.float32)
             self.clusters, self.cluster_labels = self.getClusters()
+            self.stats = QueryStats() if self.config.collect_query_stats else None
+            self.tracer = Tracer(self.config.trace_max_events) if self.config.trace_queries else None
+            if self.config.cluster_memory_budget is not None:
+                CrackingSPLindex.cluster_indices = self.newClusterIndices()
+            self.result_cache = QueryResultCache(self.config.result_cache_bytes) if self.config.result_cache_bytes else None
             self.initialized = True
 
     def getMBR(self, polygon):
@@ -69,6 +137,10 @@ class CrackingSPLindex:
         self.cluster_labels = birch.labels_
         self.num_clusters = len(set(self.cluster_labels))
         print('Number of clusters:', self.num_clusters)
+        if self.config.cluster_store_path is not None:
+            # Out-of-core mode: the clusters are only materialized in the cluster store (see buildClusterStore)
+            self.clusters = None
+            return self.clusters, self.cluster_labels
         self.clusters = [
             [(polygon, rectangle) for polygon, rectangle in
              zip(self.polygons[self.cluster_labels == n], self.X[self.cluster_labels == n])] for n in
@@ -78,19 +150,71 @@ class CrackingSPLindex:
     def getZAddressesForMBRsInCluster(self, sorted_clusters):
         all_mbr_z_intervals = {}
         for j, cluster in enumerate(sorted_clusters):
-            mbr_z_intervals = []
-            for (original_polygon, mbr) in cluster:  # minimum bounding region (minx, miny, maxx, maxy)
-                zmin = MortonCode().interleave_latlng(mbr[1], mbr[0])  # miny, minx
-                zmax = MortonCode().interleave_latlng(mbr[3], mbr[2])  # maxy, maxx
-                # Ensure zmin is always less than zmax
-                if zmin > zmax:
-                    zmin, zmax = zmax, zmin
-                mbr_z_intervals.append([(zmin, zmax), mbr])
-            all_mbr_z_intervals[j] = mbr_z_intervals
+            mbrs = [mbr for (original_polygon, mbr) in cluster]  # minimum bounding region (minx, miny, maxx, maxy)
+            zmin, zmax = self.curve_encoder.mbr_z_intervals(mbrs)
+            all_mbr_z_intervals[j] = [[(z_low, z_high), mbr] for z_low, z_high, mbr in zip(zmin.tolist(), zmax.tolist(), mbrs)]
 
         return all_mbr_z_intervals
 
 
+    def buildClusterStore(self, path, chunk_size=1_000_000):
+        """
+           Out-of-core counterpart of sortClustersZaddress and getZAddressesForMBRsInCluster: the intervals of the
+           clusters are written chunk by chunk to a cluster-partitioned file at path (zmin, zmax and MBR columns with
+           the intervals of each cluster in one contiguous range), instead of Python lists of all clusters.
+
+           :return: (z_ranges_sorted, sorted_clusters_IDs, all_mbr_z_intervals), where all_mbr_z_intervals is a
+                    ClusterIntervals memory-mapping the file, which reads a cluster only when it is first queried
+        """
+        labels = np.asarray(self.cluster_labels)
+        n_labels = int(labels.max()) + 1 if len(labels) else 0
+
+        # Bounding box of every cluster, in the dtype of X as in calculate_bounding_box
+        lower = np.full((n_labels, 2), np.inf, dtype=self.X.dtype)
+        upper = np.full((n_labels, 2), -np.inf, dtype=self.X.dtype)
+        for start in range(0, len(labels), chunk_size):
+            np.minimum.at(lower, labels[start:start + chunk_size], self.X[start:start + chunk_size, :2])
+            np.maximum.at(upper, labels[start:start + chunk_size], self.X[start:start + chunk_size, 2:])
+
+        # Clusters sorted by the Z-address of their bounding box, the position in that order is the cluster id
+        finite = np.flatnonzero(np.isfinite(lower).all(axis=1) & np.isfinite(upper).all(axis=1)).tolist()
+        z_ranges = {label: list(self.curve_encoder.mbr_z_interval((lower[label, 0], lower[label, 1], upper[label, 0],
+                                                                  upper[label, 1]))) for label in finite}
+        sorted_labels = sorted(finite, key=lambda label: z_ranges[label][0])
+        z_ranges_sorted = [z_ranges[label] for label in sorted_labels]
+        sorted_clusters_IDs = list(range(len(sorted_labels)))
+
+        # Rows ordered by cluster id, the rows of clusters without a finite bounding box are left out
+        cluster_ids = np.full(n_labels, -1, dtype=np.int64)
+        cluster_ids[sorted_labels] = sorted_clusters_IDs
+        row_clusters = cluster_ids[labels]
+        order = np.argsort(row_clusters, kind="stable")[np.count_nonzero(row_clusters < 0):]
+        offsets = np.zeros(len(sorted_labels) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_clusters[order], minlength=len(sorted_labels)), out=offsets[1:])
+
+        store = createArrays(path, {"cluster_ids": (np.int64, (len(sorted_labels),)),
+                                    "offsets": (np.int64, offsets.shape),
+                                    "zmin": (np.int64, (len(order),)), "zmax": (np.int64, (len(order),)),
+                                    "mbrs": (self.X.dtype, (len(order), 4))})
+        store["cluster_ids"][:] = sorted_clusters_IDs
+        store["offsets"][:] = offsets
+        for start in range(0, len(order), chunk_size):
+            mbrs = self.X[order[start:start + chunk_size]]
+            store["mbrs"][start:start + len(mbrs)] = mbrs
+            store["zmin"][start:start + len(mbrs)], store["zmax"][start:start + len(mbrs)] = \
+                self.curve_encoder.mbr_z_intervals(mbrs)
+        store["mbrs"].flush()
+        del store
+
+        return z_ranges_sorted, sorted_clusters_IDs, self.openClusterStore(path)
+
+    @staticmethod
+    def openClusterStore(path):
+        """The all_mbr_z_intervals of a cluster store written by buildClusterStore, memory-mapped."""
+        store, _ = readArrays(path, mmap=True)
+        return ClusterIntervals(store["cluster_ids"], store["offsets"], store["zmin"], store["zmax"], store["mbrs"])
+
+
     def sortClustersZaddress(self, clusters):
         MBR_clusters = []
         for i, cluster in enumerate(clusters):
@@ -100,8 +224,7 @@ class CrackingSPLindex:
 
         self.all_z_addresses = []
         for mbr in MBR_clusters:
-            z_addresses = [(MortonCode().interleave_latlng(mbr[0][1], mbr[0][0])),
-                           (MortonCode().interleave_latlng(mbr[1][1], mbr[1][0]))]
+            z_addresses = list(self.curve_encoder.mbr_z_interval((mbr[0][0], mbr[0][1], mbr[1][0], mbr[1][1])))
             self.all_z_addresses.append(z_addresses)
 
         z_ranges_sorted = sorted(self.all_z_addresses, key=lambda x: x[0])
@@ -136,6 +259,25 @@ class CrackingSPLindex:
                     yield from self.predClusterIdsRangeQuery(node.right_child, z_range)
 
 
+    def newClusterIndices(self):
+        """A dict for the cluster indexes, or an IndexCache evicting cold ones with Config().cluster_memory_budget."""
+        if self.config.cluster_memory_budget is None:
+            return {}
+        return IndexCache(self.config.cluster_memory_budget, self.config.cluster_eviction_policy,
+                          self.config.cluster_spill_dir)
+
+    def buildClusterIndex(self, pred_cluster):
+        index_class = ColumnarIntervalCracking if self.config.cracking_storage == "columnar" else IntervalCracking
+        # An "auto" threshold is calibrated on the first cluster that gets indexed and reused for the others
+        max_entries = getattr(self, 'tuned_max_entries', self.config.cracking_max_entries)
+        adaptive_index = index_class(pred_cluster, max_entries=max_entries, cracking_policy=self.config.cracking_policy,
+                                     long_interval_length=self.config.cracking_long_interval_length,
+                                     stats=self.stats, tracer=self.tracer)
+        if adaptive_index.calibration is not None:
+            self.tuned_max_entries = adaptive_index.max_entries
+        return adaptive_index
+
+
     def queryAdaptiveSPLindex(self, all_mbr_z_intervals, model, query):
         """
            This function takes a query and then predict clusters and crack them.
@@ -160,36 +302,294 @@ class CrackingSPLindex:
 
             * NOTE: The in-memory tree structure (IntervalCracking instances) already captures the current state and is more efficient to use for queries.
         """
-        
-        xmin, ymin, xmax, ymax = query
-        # Calculate the Z-interval of the range query
-        zmin = MortonCode().interleave_latlng(ymin, xmin)
-        zmax = MortonCode().interleave_latlng(ymax, xmax)
-        queryZaddress = [zmin, zmax]
-
-        # Step 1 - Filtering step to predict cluster IDs
-        predicted_labels = self.predClusterIdsRangeQuery(model, queryZaddress)
+        tracer = self.tracer
+        if tracer is not None:
+            query_start = span_start = tracer.startSpan()
+        if self.stats is not None:
+            self.stats.beginQuery()
+
+        # Step 0 - Repeated and nested queries are answered from the result cache
+        if self.result_cache is not None:
+            query_results = self.result_cache.lookup(query)
+            if tracer is not None:
+                tracer.endSpan("cache_lookup", span_start)
+                span_start = tracer.startSpan()
+            if query_results is not None:
+                if self.stats is not None:
+                    self.stats.endQuery(len(query_results))
+                if tracer is not None:
+                    tracer.endSpan("query", query_start)
+                return query_results
+
+        # Calculate the Z-ranges of the range query
+        query_rects = self.getQueryIntervals(query)
+        if tracer is not None:
+            tracer.endSpan("encode_query", span_start)
+            span_start = tracer.startSpan()
+
+        # Step 1 - Filtering step to predict cluster IDs, with the Z-ranges each cluster was predicted for
+        predicted_labels = self.predClusterRanges(model, query_rects)
+        if tracer is not None:
+            tracer.endSpan("predict_clusters", span_start)
 
         # Step 2 - Cracking the predicted clusters
-        query_rect = Interval(zmin, zmax)
         query_results = []
-        for cluster_id, _ in predicted_labels:
-            # Check if the cluster has been indexed already
-            if cluster_id not in CrackingSPLindex.cluster_indices:
-                # Load the intervals for the cluster only once
-                pred_cluster = all_mbr_z_intervals.get(cluster_id)
-                if not pred_cluster:
-                    continue       # Skip if no cluster found
-                    
-                 # Store the IntervalCracking instance for this cluster   
-                CrackingSPLindex.cluster_indices[cluster_id] = IntervalCracking(pred_cluster)
-            
-            # Use the already initialized IntervalCracking for this cluster
-            adaptive_index = CrackingSPLindex.cluster_indices[cluster_id]
+        for cluster_id, cluster_rects in predicted_labels.items():
+            adaptive_index = self.getClusterIndex(all_mbr_z_intervals, cluster_id)
+            if adaptive_index is None:
+                continue       # Skip if no cluster found
+
             # Perform adaptive search and cracking
-            query_result = adaptive_index.adaptiveSearch(query_rect, query)
+            query_result = adaptive_index.adaptiveSearchRanges(cluster_rects, query)
             query_results.extend(query_result)
+            if self.stats is not None and query_result:
+                self.stats.clusters_nonempty += 1
+
+        if self.stats is not None:
+            self.stats.clusters_predicted += len(predicted_labels)
+            # The cluster indexes already added their results to this record
+            self.stats.endQuery()
+        if self.result_cache is not None:
+            self.result_cache.insert(query, query_results)
+        if tracer is not None:
+            tracer.endSpan("query", query_start)
         return query_results
 
 
+    def queryAdaptiveSPLindexBatch(self, all_mbr_z_intervals, model, queries):
+        """
+           Batch counterpart of queryAdaptiveSPLindex: the queries of the batch are grouped by the clusters predicted for
+           their Z-ranges, and every predicted cluster is searched and cracked once for all of its queries on the ranges
+           it was predicted for (adaptiveSearchBatchRanges).
+
+          - Parameters:
+            1- all_mbr_z_intervals: is a dictionary that holds the initial intervals for each cluster.
+            2- model: the learned index model (SPLindex)
+            3- queries: an array of query rectangles (xmin, ymin, xmax, ymax)
+
+          - Returns a list with the results of every query, in the order of the batch.
+
+          - Stats: one record per query (see QueryStats.beginBatch). The work on a cluster is charged to the queries
+            predicted in it by its cluster index.
+        """
+        stats = self.stats
+        queries = np.asarray(queries)
+        if stats is not None:
+            stats.beginBatch(len(queries))
+        cluster_queries = {}    # cluster_id -> ([query index], [Z-ranges of the query predicted in the cluster])
+        for i, query in enumerate(queries):
+            if stats is not None:
+                stats.chargeQuery(i)
+            # Calculate the Z-ranges of the range query
+            query_rects = self.getQueryIntervals(query)
+
+            # Step 1 - Filtering step to predict cluster IDs, grouping the queries by cluster
+            predicted_labels = self.predClusterRanges(model, query_rects)
+            for cluster_id, cluster_rects in predicted_labels.items():
+                query_ids, query_ranges = cluster_queries.setdefault(cluster_id, ([], []))
+                query_ids.append(i)
+                query_ranges.append(cluster_rects)
+            if stats is not None:
+                stats.clusters_predicted += len(predicted_labels)
+
+        # Step 2 - Cracking every predicted cluster once for all of its queries
+        batch_results = [[] for _ in range(len(queries))]
+        for cluster_id, (query_ids, query_ranges) in cluster_queries.items():
+            if stats is not None:
+                stats.mapBatch(query_ids)
+            adaptive_index = self.getClusterIndex(all_mbr_z_intervals, cluster_id)
+            if adaptive_index is None:
+                continue
+
+            cluster_results = adaptive_index.adaptiveSearchBatchRanges(query_ranges, queries[query_ids])
+            for i, query_result in zip(query_ids, cluster_results):
+                batch_results[i].extend(query_result)
+            if stats is not None:
+                stats.mapBatch(None)
+                for i, query_result in zip(query_ids, cluster_results):
+                    if query_result:
+                        stats.chargeQuery(i)
+                        stats.clusters_nonempty += 1
+
+        if stats is not None:
+            # The cluster indexes already added their results to the records
+            stats.mapBatch(None)
+            stats.endBatch()
+        return batch_results
+
+
+    def adaptiveCount(self, all_mbr_z_intervals, model, query, limit=None):
+        """
+           Counts the results of a query without materializing them: the predicted clusters are cracked on the Z-ranges
+           of the query like in queryAdaptiveSPLindex, but each cluster only reports its count
+           (IntervalCracking.adaptiveCountRanges).
 
+           :param limit: Stop counting once this many results are found
+        """
+        if self.stats is not None:
+            self.stats.beginQuery()
+        count = 0
+        for cluster_id, cluster_rects in self.predClusterRanges(model, self.getQueryIntervals(query)).items():
+            adaptive_index = self.getClusterIndex(all_mbr_z_intervals, cluster_id)
+            if self.stats is not None:
+                self.stats.clusters_predicted += 1
+            if adaptive_index is None:
+                continue
+            cluster_count = adaptive_index.adaptiveCountRanges(cluster_rects, query,
+                                                               None if limit is None else limit - count)
+            count += cluster_count
+            if self.stats is not None and cluster_count:
+                self.stats.clusters_nonempty += 1
+            if limit is not None and count >= limit:
+                break
+
+        if self.stats is not None:
+            self.stats.endQuery()
+        return count
+
+    def adaptiveExists(self, all_mbr_z_intervals, model, query):
+        return self.adaptiveCount(all_mbr_z_intervals, model, query, limit=1) > 0
+
+
+    def getQueryInterval(self, query):
+        return Interval(*self.curve_encoder.mbr_z_interval(query))
+
+    def getQueryIntervals(self, query):
+        """Splits the Z-interval of a query into at most Config().query_max_ranges disjoint Z-ranges."""
+        return [Interval(z_start, z_end) for z_start, z_end in
+                self.curve_encoder.decompose_query(query, self.config.query_max_ranges)]
+
+    def predClusterRanges(self, model, query_rects):
+        """Predicts the clusters of the Z-ranges of a query, as cluster_id -> the Z-ranges it was predicted for."""
+        predicted_labels = {}
+        for query_rect in query_rects:
+            for cluster_id, _ in self.predClusterIdsRangeQuery(model, [query_rect.min_val, query_rect.max_val]):
+                cluster_rects = predicted_labels.setdefault(cluster_id, [])
+                if not cluster_rects or cluster_rects[-1] is not query_rect:
+                    cluster_rects.append(query_rect)
+        return predicted_labels
+
+    def getClusterIndex(self, all_mbr_z_intervals, cluster_id):
+        """Returns the IntervalCracking of a cluster, building it on the first query, or None for an empty cluster."""
+        # Check if the cluster has been indexed already
+        if cluster_id not in CrackingSPLindex.cluster_indices:
+            # Load the intervals for the cluster only once
+            pred_cluster = all_mbr_z_intervals.get(cluster_id)
+            if not pred_cluster:
+                return None
+
+            # Store the IntervalCracking instance for this cluster
+            if self.tracer is not None:
+                span_start = self.tracer.startSpan()
+            CrackingSPLindex.cluster_indices[cluster_id] = self.buildClusterIndex(pred_cluster)
+            if self.tracer is not None:
+                self.tracer.endSpan("build_index", span_start)
+
+        # Use the already initialized IntervalCracking for this cluster
+        return CrackingSPLindex.cluster_indices[cluster_id]
+
+
+
+    def save(self, path, model, all_mbr_z_intervals):
+        """
+           Saves the index to path: the learned model, the cracking index of every cluster built so far with its
+           cracks, and the intervals of every cluster (to rebuild the indexes an IndexCache drops).
+        """
+        arrays = {"X": self.X, "cluster_labels": np.asarray(self.cluster_labels)}
+        arrays.update({f"model/{name}": array for name, array in treeModelArrays(model).items()})
+
+        cluster_metadata = []
+        for cluster_id in list(CrackingSPLindex.cluster_indices):
+            index_arrays, index_metadata = indexArrays(CrackingSPLindex.cluster_indices[cluster_id])
+            arrays.update({f"clusters/{cluster_id}/{name}": array for name, array in index_arrays.items()})
+            cluster_metadata.append([int(cluster_id), index_metadata])
+
+        # The intervals are stored one cluster after the other
+        interval_arrays = all_mbr_z_intervals.arrays() if isinstance(all_mbr_z_intervals, ClusterIntervals) else \
+            self.intervalArrays(all_mbr_z_intervals)
+        arrays.update({f"intervals/{name}": array for name, array in interval_arrays.items()})
+
+        curve = "hilbert" if isinstance(self.curve_encoder, HilbertCode) else "morton"
+        metadata = {"space_filling_curve": curve, "morton_scale_factor": self.curve_encoder.scaleFactor,
+                    "morton_bits": self.curve_encoder.bits, "num_clusters": int(self.num_clusters),
+                    "tuned_max_entries": getattr(self, 'tuned_max_entries', None), "clusters": cluster_metadata}
+        return writeArrays(path, arrays, metadata)
+
+    def intervalArrays(self, all_mbr_z_intervals):
+        """The columns of ClusterIntervals for the intervals of a dict of clusters."""
+        cluster_ids = list(all_mbr_z_intervals)
+        intervals = [interval for cluster_id in cluster_ids for interval in all_mbr_z_intervals[cluster_id]]
+        return {"cluster_ids": np.array(cluster_ids, dtype=np.int64),
+                "offsets": np.cumsum([0] + [len(all_mbr_z_intervals[cluster_id]) for cluster_id in cluster_ids]),
+                "zmin": np.array([interval[0][0] for interval in intervals], dtype=np.int64),
+                "zmax": np.array([interval[0][1] for interval in intervals], dtype=np.int64),
+                "mbrs": np.asarray([interval[1] for interval in intervals], dtype=self.X.dtype).reshape(-1, 4)}
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+           Restores an index saved by save, in place of the current instance and cluster indexes. The polygons are not
+           saved, only their MBRs (X), and the curve settings of the file replace those of Config().
+
+           :param mmap: Map the arrays from the file (copy-on-write) instead of reading them
+           :return: (spli, model, all_mbr_z_intervals), as built by main.index_construction
+        """
+        arrays, metadata = readArrays(path, mmap)
+        groups = {}
+        for name, array in arrays.items():
+            group, _, key = name.rpartition("/")
+            groups.setdefault(group, {})[key] = array
+
+        cls._instance = None
+        spli = cls.__new__(cls)
+        spli.polygons = None
+        spli.config = Config()
+        spli.curve_encoder = getCurveEncoder(metadata["space_filling_curve"], metadata["morton_scale_factor"],
+                                             metadata["morton_bits"])
+        spli.X, spli.cluster_labels = groups[""]["X"], groups[""]["cluster_labels"]
+        spli.clusters, spli.num_clusters = None, metadata["num_clusters"]
+        if metadata["tuned_max_entries"] is not None:
+            spli.tuned_max_entries = metadata["tuned_max_entries"]
+        spli.stats = QueryStats() if spli.config.collect_query_stats else None
+        spli.tracer = Tracer(spli.config.trace_max_events) if spli.config.trace_queries else None
+        spli.result_cache = QueryResultCache(spli.config.result_cache_bytes) if spli.config.result_cache_bytes else None
+        spli.initialized = True
+
+        cls.cluster_indices = spli.newClusterIndices()
+        for cluster_id, index_metadata in metadata["clusters"]:
+            cls.cluster_indices[cluster_id] = indexFromArrays(groups[f"clusters/{cluster_id}"], index_metadata,
+                                                              spli.stats, spli.tracer)
+        intervals = groups["intervals"]
+        all_mbr_z_intervals = ClusterIntervals(intervals["cluster_ids"], intervals["offsets"], intervals["zmin"],
+                                               intervals["zmax"], intervals["mbrs"])
+        return spli, treeModelFromArrays(groups["model"]), all_mbr_z_intervals
+
+
+
+class ClusterIntervals(Mapping):
+    """
+       The all_mbr_z_intervals of a loaded index or of a cluster store: the [(z_low, z_high), mbr] intervals of a
+       cluster are built from the (memory-mapped) arrays when the cluster is looked up, so that only the clusters
+       queries reach are ever read and materialized.
+    """
+    def __init__(self, cluster_ids, offsets, zmin, zmax, mbrs):
+        self.cluster_ids = cluster_ids
+        self.positions = {cluster_id: position for position, cluster_id in enumerate(cluster_ids.tolist())}
+        self.offsets = offsets.tolist()
+        self.zmin, self.zmax, self.mbrs = zmin, zmax, mbrs
+
+    def arrays(self):
+        return {"cluster_ids": self.cluster_ids, "offsets": np.array(self.offsets, dtype=np.int64),
+                "zmin": self.zmin, "zmax": self.zmax, "mbrs": self.mbrs}
+
+    def __getitem__(self, cluster_id):
+        position = self.positions[cluster_id]
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return [[(z_low, z_high), mbr] for z_low, z_high, mbr in
+                zip(self.zmin[start:end].tolist(), self.zmax[start:end].tolist(), self.mbrs[start:end])]
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def __len__(self):
+        return len(self.positions)
@@ -10,13 +10,15 @@ sys.path.append('../')
 from ConfigParam import Config
 from treeModel import TreeBuilder
 from crackingSPLindex import CrackingSPLindex
+from datasetStore import loadDatasetMBRs
 
 
 
 def load_data(data_dir):
     # Read data
     polygons_path = os.path.join(data_dir, Config().water_polygon_name)
-    polygons = np.load(polygons_path, allow_pickle=True)
+    # Memory-mapped MBRs of the polygons, converted from the pickled polygons on the first run (see datasetStore.py)
+    polygons = loadDatasetMBRs(polygons_path)
     print(len(polygons))
     return polygons
 
@@ -29,8 +31,12 @@ def index_construction():
     print("-------- SPLindex building ---------")
     spli = CrackingSPLindex(polygons)
     clusters, cluster_labels = spli.clusters, spli.cluster_labels
-    z_ranges_sorted, sorted_clusters_IDs, sorted_clusters = spli.sortClustersZaddress(clusters)
-    all_mbr_z_intervals = spli.getZAddressesForMBRsInCluster(sorted_clusters)
+    if Config().cluster_store_path is not None:
+        # The intervals of the clusters stay on disk, memory-mapped
+        z_ranges_sorted, sorted_clusters_IDs, all_mbr_z_intervals = spli.buildClusterStore(Config().cluster_store_path)
+    else:
+        z_ranges_sorted, sorted_clusters_IDs, sorted_clusters = spli.sortClustersZaddress(clusters)
+        all_mbr_z_intervals = spli.getZAddressesForMBRsInCluster(sorted_clusters)
     # Build the tree model
     tree = TreeBuilder(global_percentage=0.05, capacity_node=100)
     tree_model = tree.buildTreeModel(z_ranges_sorted, sorted_clusters_IDs)
@@ -47,19 +53,53 @@ def splindexRangeQuery(spli, tree_model, all_mbr_z_intervals, query_ranges):
         print(f"Final query result: {len(query_results)}")
 
 
+def splindexRangeQueryBatch(spli, tree_model, all_mbr_z_intervals, query_ranges, batch_size=1000):
+    print("-------- Batch Range Query ---------")
+    for start in range(0, len(query_ranges), batch_size):
+        batch = query_ranges[start:start + batch_size]
+        batch_results = spli.queryAdaptiveSPLindexBatch(all_mbr_z_intervals, tree_model, batch)
+        print(f"Queries {start + 1}-{start + len(batch)}: {sum(len(results) for results in batch_results)} results")
+
+
 def main():
     range_query_path = "./"
     query_path = os.path.join(range_query_path, Config().water_query_range_path)
     query_ranges = np.load(query_path, allow_pickle=True)
     ######## Building SPLindex ##########
-    spli, tree_model, all_mbr_z_intervals = index_construction()
+    index_path = Config().index_path
+    if index_path and os.path.exists(index_path):
+        # Resume with the cracks of the last run
+        spli, tree_model, all_mbr_z_intervals = CrackingSPLindex.load(index_path)
+        print(f"-------- SPLindex restored from {index_path} ---------")
+    else:
+        spli, tree_model, all_mbr_z_intervals = index_construction()
 
     ######## Range Query ##########
     start_cpu_time = time.time()
-    splindexRangeQuery(spli, tree_model, all_mbr_z_intervals, query_ranges)
+    batch_size = Config().query_batch_size
+    if batch_size:
+        splindexRangeQueryBatch(spli, tree_model, all_mbr_z_intervals, query_ranges, batch_size)
+    else:
+        splindexRangeQuery(spli, tree_model, all_mbr_z_intervals, query_ranges)
     end_cpu_time = time.time()
     cpu_time = end_cpu_time - start_cpu_time
     print("CPU time for CrackingSPLindex =", cpu_time, "seconds")
+    if spli.result_cache is not None:
+        print(spli.result_cache)
+    if Config().cluster_memory_budget is not None:
+        cache = CrackingSPLindex.cluster_indices
+        print(f"Cluster indexes: {cache.memory} bytes in memory, {cache.evictions} evictions, {cache.reloads} reloads")
+    if index_path:
+        spli.save(index_path, tree_model, all_mbr_z_intervals)
+        print(f"Cracked index of {len(CrackingSPLindex.cluster_indices)} clusters saved to {index_path}")
+    if spli.stats is not None:
+        spli.stats.toCSV("query_stats.csv")
+        print(f"Per-query stats of {len(spli.stats)} queries written to query_stats.csv")
+    if spli.tracer is not None:
+        spli.tracer.toChromeTrace("query_trace.json")
+        for phase, summary in spli.tracer.summary().items():
+            print(f"{phase}: {summary['count']} spans, mean {summary['mean'] * 1e6:.1f}us, "
+                  f"p99 {summary['p99'] * 1e6:.1f}us, max {summary['max'] * 1e6:.1f}us")
 
 
 if __name__ == "__main__":
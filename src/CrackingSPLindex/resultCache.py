@@ -0,0 +1,98 @@
+"""
+    Result cache of CrackingSPLindex.queryAdaptiveSPLindex, for workloads that repeat the same or nested query rectangles.
+
+    1- Exact hits: the results are kept as an (n, 4) array of MBRs keyed by the query rectangle, a repeated query
+       returns them without predicting clusters, traversing trees or refining candidates.
+
+    2- Containment hits: a query inside a cached rectangle (xmin, ymin, xmax, ymax) is answered by filtering the cached
+       MBRs with the query rectangle. Every MBR overlapping the query also overlaps the larger cached rectangle, so the
+       filter returns what the index would. Only the containment_scan most recently used entries are checked, and the
+       one with the fewest results is filtered.
+
+    3- Eviction: the entries are kept within max_bytes (their arrays plus a fixed overhead per entry), evicting the
+       least recently used ones. Results larger than the whole budget are not cached.
+
+    hits, containment_hits, misses and evictions count the lookups and evictions.
+"""
+
+
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Bytes of an entry besides its results: the key tuple and its floats, the array header and the slot of the dict
+ENTRY_BYTES = sys.getsizeof((0.0,) * 4) + 4 * sys.getsizeof(0.0) + sys.getsizeof(np.empty((0, 4))) + 100
+
+
+
+class QueryResultCache:
+    def __init__(self, max_bytes, containment_scan=64):
+        """
+           :param max_bytes: Byte budget of the cached results
+           :param containment_scan: Most recently used entries checked for a rectangle containing a query
+        """
+        self.max_bytes = max_bytes
+        self.containment_scan = containment_scan
+        self.entries = OrderedDict()    # query rectangle -> (n, 4) array of results, from the least to the most recent
+        self.bytes = 0
+        self.hits = 0
+        self.containment_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, query):
+        """Returns the results of a query rectangle from the cache, or None if it has to go to the index."""
+        key = tuple(float(bound) for bound in query)
+        results = self.entries.get(key)
+        if results is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return list(results)
+
+        xmin, ymin, xmax, ymax = key
+        containing = None
+        for position, (cached, results) in enumerate(reversed(self.entries.items())):
+            if position >= self.containment_scan:
+                break
+            if cached[0] <= xmin and cached[1] <= ymin and cached[2] >= xmax and cached[3] >= ymax and \
+                    (containing is None or len(results) < len(self.entries[containing])):
+                containing = cached
+        if containing is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(containing)
+        self.containment_hits += 1
+        results = self.entries[containing]
+        matches = (results[:, 2] > xmin) & (results[:, 0] < xmax) & (results[:, 3] > ymin) & (results[:, 1] < ymax)
+        return list(results[matches])
+
+    def insert(self, query, results):
+        """Caches the results (MBRs) of a query rectangle, evicting the least recently used entries over the budget."""
+        key = tuple(float(bound) for bound in query)
+        results = np.asarray(results).reshape(-1, 4)
+        size = results.nbytes + ENTRY_BYTES
+        if size > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key).nbytes + ENTRY_BYTES
+        self.entries[key] = results
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= evicted.nbytes + ENTRY_BYTES
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f'QueryResultCache(Entries={len(self.entries)}, Bytes={self.bytes}, Hits={self.hits}, ' \
+               f'ContainmentHits={self.containment_hits}, Misses={self.misses}, Evictions={self.evictions})'
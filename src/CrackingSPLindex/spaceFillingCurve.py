@@ -0,0 +1,125 @@
+"""
+    Space-filling curves mapping MBRs and query rectangles to the one-dimensional keys (intervals) that SPLindex
+    sorts its clusters on and that the cluster indexes crack on.
+
+    1- Morton (Z-order) curve: MortonCode in ZAdress.py. A Z-address grows with both coordinates, so the interval of
+       a rectangle is the pair of Z-addresses of its lower-left and upper-right corners.
+
+    2- Hilbert curve: HilbertCode below. Consecutive keys are always neighbouring cells, so a rectangle is covered by
+       fewer and shorter runs of the curve than with Z-order. Keys do not grow with the coordinates, so the interval
+       of a rectangle is the smallest and the largest key of its cells, found by walking down the quadrants of the
+       grid in curve order. Both are vectorized over arrays of rectangles.
+
+    Every aligned quadrant of the grid is one run of either curve, so query decomposition (decompose_query) and the
+    rest of the pipeline work on the keys of both curves unchanged.
+"""
+
+
+import numpy as np
+
+from ZAdress import MortonCode
+
+
+# Quadrant (rx, ry) in the frame of the current level, by rank along the Hilbert curve
+HILBERT_QUADRANTS = ((0, 0), (0, 1), (1, 1), (1, 0))
+
+
+def getCurveEncoder(curve="morton", scaleFactor=100, bits=16):
+    if curve == "morton":
+        return MortonCode(scaleFactor, bits)
+    if curve == "hilbert":
+        return HilbertCode(scaleFactor, bits)
+    raise ValueError(f"Unknown space-filling curve {curve!r}, expected 'morton' or 'hilbert'")
+
+
+# ----------------------------------------------------------------------- #
+#                             Hilbert Code Class
+# ----------------------------------------------------------------------- #
+
+class HilbertCode(MortonCode):
+    def __init__(self, scaleFactor=100, bits=16):
+        super().__init__(scaleFactor, bits)
+        # The curve has the fewest levels covering the grid, so that keys stay below 2^62 for 32-bit grids
+        self.levels = round(360 * scaleFactor).bit_length()
+        if self.levels > 31:
+            raise ValueError(f"A scaleFactor of {scaleFactor} needs more than 31 bits per axis on a Hilbert curve")
+        self.z_order_index = self.hilbert_index
+
+    def hilbert_index(self, x, y):
+        """
+           Position of the grid cell (x, y) along the Hilbert curve, for ints or int64 arrays.
+
+           At every level the quadrant of the cell is read in the frame of its parent quadrant: the frame is the
+           parent's, flipped (both axes) and/or transposed, which is tracked in (flip, swap).
+        """
+        key = flip = swap = 0
+        for level in range(self.levels - 1, -1, -1):
+            qx, qy = ((x >> level) & 1) ^ flip, ((y >> level) & 1) ^ flip
+            rx, ry = qx ^ ((qx ^ qy) & swap), qy ^ ((qx ^ qy) & swap)
+            key = (key << 2) | ((3 * rx) ^ ry)
+            flip, swap = flip ^ ((1 - ry) & rx), swap ^ (1 - ry)
+        return key
+
+    def mbr_z_intervals(self, mbrs):
+        # Smallest and largest Hilbert keys of the grid cells of an (n, 4) array of MBRs (minx, miny, maxx, maxy)
+        mbrs = np.asarray(mbrs).reshape(-1, 4)
+        x_a, y_a = self.grid_coordinates_array(mbrs[:, 1], mbrs[:, 0])
+        x_b, y_b = self.grid_coordinates_array(mbrs[:, 3], mbrs[:, 2])
+        rect = (np.minimum(x_a, x_b), np.minimum(y_a, y_b), np.maximum(x_a, x_b), np.maximum(y_a, y_b))
+        return self.extreme_keys(rect, HILBERT_QUADRANTS), self.extreme_keys(rect, HILBERT_QUADRANTS[::-1])
+
+    def mbr_z_interval(self, mbr):
+        # Smallest and largest Hilbert keys of the grid cells of one MBR or query rectangle (minx, miny, maxx, maxy)
+        x_a, y_a = self.grid_coordinates(mbr[1], mbr[0])
+        x_b, y_b = self.grid_coordinates(mbr[3], mbr[2])
+        rect = (min(x_a, x_b), min(y_a, y_b), max(x_a, x_b), max(y_a, y_b))
+        return self.extreme_key(rect, HILBERT_QUADRANTS), self.extreme_key(rect, HILBERT_QUADRANTS[::-1])
+
+    def extreme_key(self, rect, quadrants):
+        """
+           Walks down from the whole grid to one cell of the rectangle (x_low, y_low, x_high, y_high), always entering
+           the first child quadrant (in the order of quadrants) that the rectangle overlaps. Curve order gives the
+           smallest key, reverse curve order the largest.
+        """
+        x_low, y_low, x_high, y_high = rect
+        cell_x = cell_y = key = flip = swap = 0
+        for level in range(self.levels - 1, -1, -1):
+            for rx, ry in quadrants:
+                # Back from the frame of the level to grid axes
+                qx, qy = (ry if swap else rx) ^ flip, (rx if swap else ry) ^ flip
+                child_x, child_y = (2 * cell_x + qx) << level, (2 * cell_y + qy) << level
+                if child_x <= x_high and child_x + (1 << level) > x_low and \
+                        child_y <= y_high and child_y + (1 << level) > y_low:
+                    break
+            cell_x, cell_y = 2 * cell_x + qx, 2 * cell_y + qy
+            key = (key << 2) | ((3 * rx) ^ ry)
+            flip, swap = flip ^ ((1 - ry) & rx), swap ^ (1 - ry)
+        return key
+
+    def extreme_keys(self, rect, quadrants):
+        # extreme_key for int64 arrays of rectangles, the first overlapping child of every rectangle is kept
+        x_low, y_low, x_high, y_high = rect
+        n = len(x_low)
+        cell_x, cell_y = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+        key, flip, swap = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+
+        for level in range(self.levels - 1, -1, -1):
+            chosen_rx, chosen_ry = np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)
+            undecided = np.ones(n, dtype=bool)
+            for rx, ry in quadrants:
+                qx, qy = (rx ^ ((rx ^ ry) & swap)) ^ flip, (ry ^ ((rx ^ ry) & swap)) ^ flip
+                child_x, child_y = (2 * cell_x + qx) << level, (2 * cell_y + qy) << level
+                overlaps = undecided & (child_x <= x_high) & (child_x + (1 << level) > x_low) & \
+                           (child_y <= y_high) & (child_y + (1 << level) > y_low)
+                chosen_rx[overlaps], chosen_ry[overlaps] = rx, ry
+                undecided &= ~overlaps
+
+            rx, ry = chosen_rx, chosen_ry
+            cell_x = 2 * cell_x + ((rx ^ ((rx ^ ry) & swap)) ^ flip)
+            cell_y = 2 * cell_y + ((ry ^ ((rx ^ ry) & swap)) ^ flip)
+            key = (key << 2) | ((3 * rx) ^ ry)
+            flip, swap = flip ^ ((1 - ry) & rx), swap ^ (1 - ry)
+        return key
+
+    def __repr__(self):
+        return f'HilbertCode(ScaleFactor={self.scaleFactor}, Levels={self.levels})'
@@ -141,3 +141,73 @@ class TreeBuilder:
         global_max_z = max(z_ranges, key=lambda x: x[1])[1]
         global_range = global_max_z - global_min_z
         return global_range * self.global_percentage
+
+
+
+# ----------------------------------------------------------------------- #
+#          Flat arrays of a tree model (CrackingSPLindex.save / load)
+# ----------------------------------------------------------------------- #
+
+def treeModelArrays(root):
+    """
+       Flattens a tree model (pre-order) into numeric arrays. The z-ranges, clusters, labels and cdfs of the nodes are
+       concatenated with one offsets array each, and the regressions are kept as their coefficients and intercept.
+    """
+    nodes = []
+    stack = [root] if root is not None else []
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(child for child in (node.right_child, node.left_child) if child is not None)
+    positions = {id(node): position for position, node in enumerate(nodes)}
+
+    arrays = {"left_child": np.array([positions.get(id(node.left_child), -1) for node in nodes], dtype=np.int64),
+              "right_child": np.array([positions.get(id(node.right_child), -1) for node in nodes], dtype=np.int64),
+              "z_ranges": np.array([z_range for node in nodes for z_range in node.z_ranges], dtype=np.int64).reshape(-1, 2),
+              "clusters": np.array([cluster for node in nodes for cluster in node.clusters], dtype=np.int64),
+              "range_offsets": np.cumsum([0] + [len(node.clusters) for node in nodes]).astype(np.int64),
+              "labels": np.array([label for node in nodes for label in node.labels], dtype=np.int64),
+              "label_offsets": np.cumsum([0] + [len(node.labels) for node in nodes]).astype(np.int64),
+              "cdfs": np.array([cdf for node in nodes for cdf in node.cdfs or []], dtype=np.float64),
+              "cdf_offsets": np.cumsum([0] + [len(node.cdfs or []) for node in nodes]).astype(np.int64),
+              "has_cdfs": np.array([node.cdfs is not None for node in nodes], dtype=np.bool_)}
+    for model_name in ("internal_model", "leaf_model"):
+        models = [getattr(node, model_name) for node in nodes]
+        arrays[f"has_{model_name}"] = np.array([model is not None for model in models], dtype=np.bool_)
+        arrays[f"{model_name}_coef"] = np.array([np.zeros(2) if model is None else model.coef_ for model in models],
+                                                dtype=np.float64).reshape(-1, 2)
+        arrays[f"{model_name}_intercept"] = np.array([0.0 if model is None else model.intercept_ for model in models],
+                                                     dtype=np.float64)
+    return arrays
+
+
+def treeModelFromArrays(arrays):
+    """Rebuilds the tree model flattened by treeModelArrays, returns its root (None for an empty model)."""
+    range_offsets, label_offsets = arrays["range_offsets"].tolist(), arrays["label_offsets"].tolist()
+    cdf_offsets = arrays["cdf_offsets"].tolist()
+    z_ranges, clusters = arrays["z_ranges"].tolist(), arrays["clusters"].tolist()
+    labels, cdfs = arrays["labels"].tolist(), arrays["cdfs"].tolist()
+
+    nodes = []
+    for position, has_cdfs in enumerate(arrays["has_cdfs"].tolist()):
+        start, end = range_offsets[position], range_offsets[position + 1]
+        node = Node(z_ranges[start:end], clusters[start:end])
+        node.labels = labels[label_offsets[position]:label_offsets[position + 1]]
+        if has_cdfs:
+            node.cdfs = cdfs[cdf_offsets[position]:cdf_offsets[position + 1]]
+        for model_name in ("internal_model", "leaf_model"):
+            if arrays[f"has_{model_name}"][position]:
+                setattr(node, model_name, fittedRegression(arrays[f"{model_name}_coef"][position],
+                                                           arrays[f"{model_name}_intercept"][position]))
+        nodes.append(node)
+
+    for node, left, right in zip(nodes, arrays["left_child"].tolist(), arrays["right_child"].tolist()):
+        node.left_child = nodes[left] if left >= 0 else None
+        node.right_child = nodes[right] if right >= 0 else None
+    return nodes[0] if nodes else None
+
+
+def fittedRegression(coef, intercept):
+    model = LinearRegression()
+    model.coef_, model.intercept_, model.n_features_in_ = np.array(coef), float(intercept), len(coef)
+    return model
@@ -2,3 +2,8 @@
 
 from .interval_structures import Interval, IntervalTree, IntervalTreeNode, IntervalTreeEntry
 from .intervalCracking import IntervalCracking
+from .columnarIntervalCracking import ColumnarIntervalCracking
+from .queryStats import QueryStats
+from .tracing import Tracer
+from .persistence import saveIndex, loadIndex
+from .indexCache import IndexCache, indexMemory
@@ -0,0 +1,73 @@
+"""
+    Auto-tuning of the stop-cracking threshold (max_entries) of an interval cracking index.
+
+    The best threshold depends on the data and on the index implementation: a crack has a fixed overhead (creating
+    nodes, and for the columnar index a handful of NumPy calls), while a scan pays per element (an MBR check in Python).
+    Cracking a piece only pays off when scanning it costs more than the fixed overhead of a crack, so:
+
+        1- Scan cost and crack cost are measured on samples of the index's own intervals for a few piece sizes,
+           and a line (fixed + per element cost) is fitted to each.
+        2- max_entries = fixed crack cost / per element scan cost, clamped to [MIN_MAX_ENTRIES, MAX_MAX_ENTRIES].
+"""
+
+
+import time
+import random
+
+import numpy as np
+
+from .interval_structures import Interval
+
+
+MIN_MAX_ENTRIES = 16
+MAX_MAX_ENTRIES = 4096
+DEFAULT_MAX_ENTRIES = 128
+
+
+def calibrateMaxEntries(index_class, intervals, sizes=(128, 512, 2048), repeats=3, seed=None):
+    """
+       Measures scan and crack costs of index_class on samples of intervals and returns the stop-cracking threshold.
+
+       :param index_class: IntervalCracking or ColumnarIntervalCracking
+       :param intervals: The [(zmin, zmax), mbr] pairs the index is built on
+       :return: (max_entries, costs), where costs holds the fitted (fixed, per element) scan and crack costs in seconds
+    """
+    sizes = [size for size in sizes if size <= len(intervals)]
+    if len(sizes) < 2:
+        return DEFAULT_MAX_ENTRIES, None
+
+    rng = random.Random(seed)
+    scan_times, crack_times = [], []
+    for size in sizes:
+        sample = rng.sample(intervals, size)
+        # Query with the z-interval and MBR of the median interval of the sample, so a crack splits the piece
+        (zmin, zmax), query = sorted(sample, key=lambda interval: interval[0][0])[size // 2]
+        query_interval = Interval(zmin, zmax)
+
+        scan_times.append(min(timeScan(index_class, sample, query_interval, query) for _ in range(repeats)))
+        crack_times.append(min(timeCrack(index_class, sample, query_interval) for _ in range(repeats)))
+
+    scan_per_entry, scan_fixed = np.polyfit(sizes, scan_times, 1)
+    crack_per_entry, crack_fixed = np.polyfit(sizes, crack_times, 1)
+    costs = {"scan": (float(scan_fixed), float(scan_per_entry)), "crack": (float(crack_fixed), float(crack_per_entry))}
+
+    if scan_per_entry <= 0 or crack_fixed <= 0:
+        return DEFAULT_MAX_ENTRIES, costs
+    max_entries = int(min(max(crack_fixed / scan_per_entry, MIN_MAX_ENTRIES), MAX_MAX_ENTRIES))
+    return max_entries, costs
+
+
+def timeScan(index_class, sample, query_interval, query):
+    index = index_class(sample, max_entries=len(sample), hybrid_sort=False, long_interval_length=None)
+    leaf = index.tree.root.entries[0].child
+    start_time = time.perf_counter()
+    index.searchAndCrack(query_interval, query, leaf)
+    return time.perf_counter() - start_time
+
+
+def timeCrack(index_class, sample, query_interval):
+    index = index_class(sample, max_entries=1, hybrid_sort=False, long_interval_length=None)
+    leaf = index.tree.root.entries[0].child
+    start_time = time.perf_counter()
+    index.crackPiece(leaf, query_interval)
+    return time.perf_counter() - start_time
@@ -0,0 +1,674 @@
+"""
+    Columnar Interval Cracking keeps the z-intervals of an index in contiguous NumPy arrays
+    instead of a Python list of (Interval, data) tuples.
+
+    1- Columnar Storage (cracker arrays):
+
+        - zmin, zmax: int64 columns holding the z-interval of every MBR.
+        - row_ids:    int64 column pointing back into the original data (the MBRs), so the
+                      data itself is never moved around while cracking.
+        - There is exactly one set of columns per index. Cracking reorders them in place and every
+          leaf of the tree only records the [start, end) offsets of its piece in these columns.
+
+    2- Vectorized Cracking:
+
+        - A crack is a three-way partition of a piece (left / overlapped / right) computed with
+          boolean masks over the zmin/zmax columns, instead of an interpreted loop over tuples.
+          The piece is rewritten in place as [left | overlapped | right].
+        - The bounding interval of every new piece is a min/max reduction over the same columns.
+        - The MBRs are kept in a float matrix indexed by row id, so the candidates of a piece are refined against
+          the query MBR with one boolean mask over their rows.
+        - The tree structure (internal nodes and their bounding intervals) is the same as in
+          IntervalCracking, so both indexes can be used interchangeably by CrackingSPLindex.
+
+    3- Batch Queries:
+
+        - adaptiveSearchBatch sorts a batch of queries by their z-intervals and traverses the tree once, carrying
+          down to every child only the queries that overlap it.
+        - A large piece touched by several queries is cracked once on all their boundaries: intervals lying between
+          two consecutive boundaries form one piece each, and intervals crossing a boundary form one more piece.
+
+    4- Hybrid Crack-Sort:
+
+        - Every scan of a leaf that does not crack it (a small piece, or one no query can split) is counted.
+        - Once the scans of a leaf have cost as much as sorting it (log2(size) hits), its piece is sorted by zmin and
+          a zmax order is kept next to it. From then on the leaf is answered with binary searches instead of scans.
+
+    5- Counting:
+
+        - adaptiveCount / adaptiveExists crack like adaptiveSearch but never build result lists. The size of a piece is
+          its offset range, and the MBR bounds of a leaf tell whether all or none of its MBRs overlap a query, so such
+          pieces are counted without touching their entries. adaptiveExists stops at the first result.
+
+    6- Long Intervals:
+
+        - Intervals longer than the z-range of an average piece cross the bounds of most cracks and would pile up in
+          the overlapped pieces. They are kept out of the cracker columns, in a LongIntervalStore partitioned by
+          length class (see longIntervals.py), which every query searches next to the tree.
+"""
+
+
+import math
+from collections import deque
+
+import numpy as np
+
+from .interval_structures import Interval, IntervalTree, IntervalTreeEntry, IntervalTreeNode
+from .crackingPolicy import CrackingPolicy
+from .autoTuning import calibrateMaxEntries
+from .longIntervals import LongIntervalStore, selectLongIntervals
+from .queryStats import QueryStats
+from .tracing import Tracer
+
+
+
+# ----------------------------------------------------------------------- #
+#                       Columnar Interval Cracking Class
+# ----------------------------------------------------------------------- #
+
+class ColumnarIntervalCracking:
+    def __init__(self, intervals, max_entries=128, min_entries=None, FIRST_INIT=21474836, END_INIT=-21474836,
+                 cracking_policy="standard", hybrid_sort=True, sort_after_hits=None, long_interval_length="auto",
+                 stats=None, tracer=None):
+        # max_entries="auto" calibrates the stop-cracking threshold on the intervals (see autoTuning.py)
+        self.calibration = None
+        if max_entries == "auto":
+            max_entries, self.calibration = calibrateMaxEntries(type(self), intervals)
+        self.max_entries = max_entries
+        self.min_entries = min_entries or math.ceil(max_entries / 2)
+        self.FIRST_INIT = FIRST_INIT
+        self.END_INIT = END_INIT
+        self.policy = cracking_policy if isinstance(cracking_policy, CrackingPolicy) else CrackingPolicy(cracking_policy)
+        self.hybrid_sort = hybrid_sort
+        self.sort_after_hits = sort_after_hits    # None: sort a leaf after log2(size) hits
+        self.stats = QueryStats() if stats is True else stats    # optional per-query counters (see queryStats.py)
+        self.tracer = Tracer() if tracer is True else tracer     # optional phase timing spans (see tracing.py)
+        self.tree = IntervalTree()
+        root_node = self.tree.root
+
+        # Split the [(zmin, zmax), mbr] pairs into the cracker columns and the data they point to (any sequence indexed
+        # by row id: a restored index keeps the (n, 4) array of its file, see persistence.py)
+        self.data = [interval[1] for interval in intervals]
+        self.mbrs = np.asarray(self.data, dtype=np.float64).reshape(len(self.data), 4)
+        self.zmin = np.fromiter((interval[0][0] for interval in intervals), dtype=np.int64, count=len(intervals))
+        self.zmax = np.fromiter((interval[0][1] for interval in intervals), dtype=np.int64, count=len(intervals))
+        self.row_ids = np.arange(len(intervals), dtype=np.int64)
+
+        # Move the long intervals out of the cracker columns into their own store
+        self.long_store = None
+        is_long = selectLongIntervals(self.zmin, self.zmax, max_entries, long_interval_length)
+        if is_long is not None:
+            self.long_store = LongIntervalStore(self.zmin[is_long], self.zmax[is_long], self.row_ids[is_long])
+            self.zmin, self.zmax, self.row_ids = self.zmin[~is_long], self.zmax[~is_long], self.row_ids[~is_long]
+
+        # Create a root node that includes all intervals as the initial tree structure
+        root_node.entries.append(IntervalTreeEntry(self.calculate_bounding_interval(0, len(self.row_ids))))
+        root_node.is_leaf = False
+
+        # Create the first level of children nodes, a single piece covering the whole cracker columns
+        initial_node = IntervalTreeNode(is_leaf=True, parent=root_node, level=1)
+        initial_node.start, initial_node.end = 0, len(self.row_ids)
+        root_node.entries[0].child = initial_node
+
+
+    def adaptiveSearch(self, query_interval, query):
+        stats = self.stats
+        if stats is not None:
+            stats.beginQuery()
+        queue = deque([self.tree.root])
+        query_results = self.searchLongIntervals(query_interval, query)
+
+        while queue:
+            node = queue.popleft()
+            if stats is not None:
+                stats.nodes_visited += 1
+
+            if node.is_leaf:
+                results = self.searchAndCrack(query_interval, query, node)
+                if results:
+                    query_results.extend(results)
+            else:
+                for entry in node.entries:
+                    if entry.child and self.intervals_overlap(entry.interval, query_interval):
+                        queue.append(entry.child)
+
+        if stats is not None:
+            stats.endQuery(len(query_results))
+        return query_results
+
+
+    def adaptiveSearchBatch(self, query_intervals, queries, max_boundaries=16):
+        """
+           Answers a batch of queries with one traversal of the tree, cracking every touched piece once
+           on the boundaries of the queries that reach it.
+
+           :param query_intervals: The z-intervals of the queries
+           :param queries: The query MBRs (xmin, ymin, xmax, ymax), one per z-interval
+           :param max_boundaries: Maximum number of query boundaries a piece is cracked on at once (at most 65533)
+           :return: A list with the results of every query, in the order of the batch
+        """
+        query_min = np.fromiter((interval.min_val for interval in query_intervals), dtype=np.int64,
+                                count=len(query_intervals))
+        query_max = np.fromiter((interval.max_val for interval in query_intervals), dtype=np.int64,
+                                count=len(query_intervals))
+        stats = self.stats
+        if stats is not None:
+            # One record per query, the work of a node is charged to the queries reaching it
+            stats.beginBatch(len(query_intervals))
+        batch_results = []
+        for query_id, (query_interval, query) in enumerate(zip(query_intervals, queries)):
+            if stats is not None:
+                stats.chargeQuery(query_id)
+            batch_results.append(self.searchLongIntervals(query_interval, query))
+
+        queue = deque([(self.tree.root, np.argsort(query_min, kind="stable"))])
+        while queue:
+            node, query_ids = queue.popleft()
+            if stats is not None:
+                stats.chargeQueries(query_ids)
+                stats.nodes_visited += 1
+
+            if not node.is_leaf:
+                for entry in node.entries:
+                    overlapping = (query_min[query_ids] <= entry.interval.max_val) & \
+                                  (query_max[query_ids] >= entry.interval.min_val)
+                    if entry.child and overlapping.any():
+                        queue.append((entry.child, query_ids[overlapping]))
+                continue
+
+            if len(query_ids) > 1 and node.end - node.start > self.max_entries and node.max_order is None:
+                boundaries = np.unique(np.concatenate((query_min[query_ids], query_max[query_ids])))
+                if len(boundaries) > max_boundaries:
+                    boundaries = boundaries[np.linspace(0, len(boundaries) - 1, max_boundaries).astype(np.int64)]
+                if self.crackPieceOnBoundaries(node, boundaries):
+                    queue.append((node, query_ids))
+                    continue
+
+            # Small or unsplittable piece: answer the queries one by one, the first crack hands the rest back
+            for position, query_id in enumerate(query_ids):
+                if stats is not None:
+                    stats.chargeQuery(query_id)
+                batch_results[query_id].extend(
+                    self.searchAndCrack(query_intervals[query_id], queries[query_id], node))
+                if not node.is_leaf:
+                    queue.append((node, query_ids[position + 1:]))
+                    break
+
+        if stats is not None:
+            stats.endBatch([len(query_results) for query_results in batch_results])
+        return batch_results
+
+
+    def adaptiveSearchBatchRanges(self, query_ranges, queries, max_boundaries=16):
+        """
+           Batch counterpart of adaptiveSearchRanges: the z-ranges of all the queries traverse the tree together like
+           the queries of adaptiveSearchBatch, cracking every touched piece once on their boundaries. The candidates
+           of every query are refined once, so an interval overlapping several of its ranges is reported once.
+
+           :param query_ranges: The z-ranges of every query, lists of Interval (see MortonCode.decompose_query)
+           :param queries: The query MBRs (xmin, ymin, xmax, ymax), one per list of z-ranges
+           :param max_boundaries: Maximum number of range boundaries a piece is cracked on at once (at most 65533)
+           :return: A list with the results of every query, in the order of the batch
+        """
+        if all(len(ranges) == 1 for ranges in query_ranges):
+            return self.adaptiveSearchBatch([ranges[0] for ranges in query_ranges], queries, max_boundaries)
+
+        range_intervals = [interval for ranges in query_ranges for interval in ranges]
+        range_queries = np.repeat(np.arange(len(query_ranges)), [len(ranges) for ranges in query_ranges])
+        range_min = np.fromiter((interval.min_val for interval in range_intervals), dtype=np.int64,
+                                count=len(range_intervals))
+        range_max = np.fromiter((interval.max_val for interval in range_intervals), dtype=np.int64,
+                                count=len(range_intervals))
+        stats = self.stats
+        if stats is not None:
+            # One record per query, like adaptiveSearchBatch
+            stats.beginBatch(len(query_ranges))
+        # Long intervals are few, they are searched once per query with the range covering all its z-ranges
+        batch_candidates = [[] if self.long_store is None else
+                            [self.long_store.search(Interval(min(interval.min_val for interval in ranges),
+                                                             max(interval.max_val for interval in ranges)))]
+                            for ranges in query_ranges]
+
+        queue = deque([(self.tree.root, np.argsort(range_min, kind="stable"))])
+        while queue:
+            node, range_ids = queue.popleft()
+            if stats is not None:
+                stats.chargeQueries(range_queries[range_ids])
+                stats.nodes_visited += 1
+
+            if not node.is_leaf:
+                for entry in node.entries:
+                    overlapping = (range_min[range_ids] <= entry.interval.max_val) & \
+                                  (range_max[range_ids] >= entry.interval.min_val)
+                    if entry.child and overlapping.any():
+                        queue.append((entry.child, range_ids[overlapping]))
+                continue
+
+            if len(range_ids) > 1 and node.end - node.start > self.max_entries and node.max_order is None:
+                boundaries = np.unique(np.concatenate((range_min[range_ids], range_max[range_ids])))
+                if len(boundaries) > max_boundaries:
+                    boundaries = boundaries[np.linspace(0, len(boundaries) - 1, max_boundaries).astype(np.int64)]
+                if self.crackPieceOnBoundaries(node, boundaries):
+                    queue.append((node, range_ids))
+                    continue
+
+            # A small or sorted leaf is filtered once for every query reaching it, with one mask over its piece on the
+            # ranges of the query (like rangeCandidates)
+            if node.end - node.start <= self.max_entries or node.max_order is not None:
+                reaching_queries = range_queries[range_ids]
+                for query_id in np.unique(reaching_queries).tolist():
+                    if stats is not None:
+                        stats.chargeQuery(query_id)
+                    query_range_ids = range_ids[reaching_queries == query_id]
+                    zmin, zmax = self.zmin[node.start:node.end, None], self.zmax[node.start:node.end, None]
+                    overlapping = ((zmin <= range_max[query_range_ids]) &
+                                   (zmax >= range_min[query_range_ids])).any(axis=1)
+                    batch_candidates[query_id].append(self.row_ids[node.start:node.end][overlapping])
+                    if node.max_order is None:
+                        self.recordScan(node)
+                continue
+
+            # Unsplittable piece: take the candidates of the ranges one by one, the first crack hands the rest back
+            # (copy the blocks, the next ranges may reorder the pieces they point to)
+            for position, range_id in enumerate(range_ids):
+                if stats is not None:
+                    stats.chargeQuery(range_queries[range_id])
+                batch_candidates[range_queries[range_id]].extend(
+                    row_ids.copy() for _, row_ids in self.crackLeaf(range_intervals[range_id], node))
+                if not node.is_leaf:
+                    queue.append((node, range_ids[position + 1:]))
+                    break
+
+        batch_results = []
+        for query_id, (candidates, query) in enumerate(zip(batch_candidates, queries)):
+            if stats is not None:
+                stats.chargeQuery(query_id)
+            batch_results.append(self.refine(np.unique(np.concatenate(candidates)), query) if candidates else [])
+        if stats is not None:
+            stats.endBatch([len(query_results) for query_results in batch_results])
+        return batch_results
+
+
+    def adaptiveSearchRanges(self, query_intervals, query):
+        """
+           Answers a query whose z-interval is decomposed into several disjoint z-ranges (see MortonCode.decompose_query).
+           The ranges traverse the tree together, a small or sorted leaf is filtered once on all the ranges reaching
+           it and a large piece is cracked on them one by one. The union of the candidates is refined once, so an
+           interval overlapping several ranges is reported once.
+        """
+        if len(query_intervals) == 1:
+            return self.adaptiveSearch(query_intervals[0], query)
+
+        stats = self.stats
+        if stats is not None:
+            stats.beginQuery()
+        candidates = self.rangeCandidates(query_intervals)
+        query_results = self.refine(candidates, query) if len(candidates) else []
+        if stats is not None:
+            stats.endQuery(len(query_results))
+        return query_results
+
+    def adaptiveCountRanges(self, query_intervals, query, limit=None):
+        """
+           Counts the results of a query decomposed into several z-ranges, cracking like adaptiveSearchRanges. With a
+           single range the pieces are counted like in adaptiveCount, otherwise the union of the candidates is.
+        """
+        if len(query_intervals) == 1:
+            return self.adaptiveCount(query_intervals[0], query, limit)
+
+        if self.stats is not None:
+            self.stats.beginQuery()
+        candidates = self.rangeCandidates(query_intervals)
+        count = self.countRows(candidates, query) if len(candidates) else 0
+        if self.stats is not None:
+            self.stats.endQuery(count)
+        return count
+
+    def rangeCandidates(self, query_intervals):
+        """Cracks the tree on several z-ranges of a query and returns the row ids of their candidates, each once."""
+        stats = self.stats
+        range_min = np.array([interval.min_val for interval in query_intervals], dtype=np.int64)
+        range_max = np.array([interval.max_val for interval in query_intervals], dtype=np.int64)
+        # Long intervals are few, they are searched once with the range covering all the z-ranges
+        candidates = [] if self.long_store is None else \
+            [self.long_store.search(Interval(int(range_min.min()), int(range_max.max())))]
+
+        queue = deque([(self.tree.root, np.arange(len(query_intervals)))])
+        while queue:
+            node, range_ids = queue.popleft()
+            if stats is not None:
+                stats.nodes_visited += 1
+
+            if not node.is_leaf:
+                for entry in node.entries:
+                    overlapping = (range_min[range_ids] <= entry.interval.max_val) & \
+                                  (range_max[range_ids] >= entry.interval.min_val)
+                    if entry.child and overlapping.any():
+                        queue.append((entry.child, range_ids[overlapping]))
+                continue
+
+            # A small or sorted leaf is filtered on all the ranges reaching it with one mask over its piece
+            if node.end - node.start <= self.max_entries or node.max_order is not None:
+                zmin, zmax = self.zmin[node.start:node.end, None], self.zmax[node.start:node.end, None]
+                overlapping = ((zmin <= range_max[range_ids]) & (zmax >= range_min[range_ids])).any(axis=1)
+                candidates.append(self.row_ids[node.start:node.end][overlapping])
+                if node.max_order is None:
+                    self.recordScan(node)
+                continue
+
+            # Large piece: crack it on the first range and hand the others back, to the new pieces if it was cracked
+            # (copy the blocks, the next ranges may reorder the pieces they point to)
+            candidates.extend(row_ids.copy() for _, row_ids in self.crackLeaf(query_intervals[range_ids[0]], node))
+            if len(range_ids) > 1:
+                queue.append((node, range_ids[1:]))
+
+        return np.unique(np.concatenate(candidates)) if candidates else self.row_ids[:0]
+
+    def adaptiveCount(self, query_interval, query, limit=None):
+        """
+           Counts the results of a query without materializing them. Pieces are cracked like in adaptiveSearch,
+           a whole piece whose MBRs all overlap the query is counted by its size and one whose MBRs all miss the query
+           is skipped, both without touching its entries.
+
+           :param limit: Stop counting once this many results are found
+        """
+        if self.stats is not None:
+            self.stats.beginQuery()
+        count = 0
+        if self.long_store is not None:
+            count = self.countRows(self.long_store.search(query_interval), query)
+
+        if limit is None or count < limit:
+            for leaf, row_ids in self.crackTree(query_interval):
+                count += self.countMatches(leaf, row_ids, query)
+                if limit is not None and count >= limit:
+                    break
+
+        if self.stats is not None:
+            self.stats.endQuery(count)
+        return count
+
+    def adaptiveExists(self, query_interval, query):
+        return self.adaptiveCount(query_interval, query, limit=1) > 0
+
+
+    def crackTree(self, query_interval):
+        """Cracks every leaf the query interval reaches, yielding the candidate blocks (leaf, row_ids) of crackLeaf."""
+        stats = self.stats
+        queue = deque([self.tree.root])
+        while queue:
+            node = queue.popleft()
+            if stats is not None:
+                stats.nodes_visited += 1
+
+            if node.is_leaf:
+                yield from self.crackLeaf(query_interval, node)
+            else:
+                for entry in node.entries:
+                    if entry.child and self.intervals_overlap(entry.interval, query_interval):
+                        queue.append(entry.child)
+
+    def searchAndCrack(self, query_interval, query, node, data_driven=True):
+        """
+           Cracks the piece of a leaf in place into left, overlapped and right pieces with one
+           vectorized pass over its columns, then refines the overlapped intervals against the query MBR.
+        """
+        query_results = []
+        for _, row_ids in self.crackLeaf(query_interval, node, data_driven):
+            query_results.extend(self.refine(row_ids, query))
+        return query_results
+
+    def crackLeaf(self, query_interval, node, data_driven=True):
+        """
+           Cracks a leaf for a query and returns the candidates of the query as (leaf, row_ids) blocks, where row_ids
+           are the intervals of the leaf's piece that overlap the query interval.
+
+           Large pieces may first get a data-driven crack chosen by the cracking policy, and the query then
+           continues into the new pieces it overlaps (see crackingPolicy.py).
+        """
+        # A sorted leaf is answered with binary searches
+        if node.max_order is not None:
+            return [(node, self.searchSortedPiece(node, query_interval))]
+
+        # If the number of intervals is small, no need to crack, just search
+        # (sorting the piece in recordScan only permutes the rows of this whole-piece block)
+        if node.end - node.start <= self.max_entries:
+            self.recordScan(node)
+            return [(node, self.row_ids[node.start:node.end])]
+
+        if data_driven and self.policy.needsDataDrivenCrack(node.end - node.start):
+            pivot = self.policy.choosePivot(self.midpoint_at, node.start, node.end)
+            _, _, cracked = self.crackPiece(node, Interval(pivot, pivot))
+            if cracked:
+                candidates = []
+                for entry in node.entries:
+                    if self.intervals_overlap(entry.interval, query_interval):
+                        candidates.extend(self.crackLeaf(query_interval, entry.child, self.policy.recursive))
+                return candidates
+
+        crack_index_min, crack_index_max, cracked = self.crackPiece(node, query_interval)
+        if not cracked:
+            # The piece went entirely to one side, so the candidates are either all of it or none
+            self.recordScan(node)
+            return [(node, self.row_ids[crack_index_min:crack_index_max])]
+        if crack_index_min == crack_index_max:
+            return []
+        # The overlapped piece is the last child of a cracked node
+        return [(node.entries[-1].child, self.row_ids[crack_index_min:crack_index_max])]
+
+    def crackPiece(self, node, crack_interval):
+        """
+           Cracks the piece of a leaf in place as [left | overlapped | right] around crack_interval and turns
+           the leaf into an internal node with left, right and overlapped children.
+
+           :return: (crack_index_min, crack_index_max, cracked), where [crack_index_min, crack_index_max) holds
+                    the intervals overlapping crack_interval and cracked tells whether the piece was split
+        """
+        tracer = self.tracer
+        if tracer is not None:
+            span_start = tracer.startSpan()
+        start, end = node.start, node.end
+        zmin, zmax = self.zmin[start:end], self.zmax[start:end]
+        left_mask = zmax < crack_interval.min_val
+        right_mask = zmin > crack_interval.max_val
+        overlapped_mask = ~(left_mask | right_mask)
+
+        left_positions = np.flatnonzero(left_mask)
+        overlapped_positions = np.flatnonzero(overlapped_mask)
+        right_positions = np.flatnonzero(right_mask)
+        left_end = start + len(left_positions)
+        overlapped_end = left_end + len(overlapped_positions)
+
+        if self.stats is not None:
+            self.stats.entries_partitioned += end - start
+        # A crack that does not split the piece would only add an identical child
+        if max(len(left_positions), len(overlapped_positions), len(right_positions)) == end - start:
+            if tracer is not None:
+                tracer.endSpan("partition", span_start)
+            return left_end, overlapped_end, False
+        if self.stats is not None:
+            self.stats.pieces_cracked += 1
+
+        # Reorder the piece in place as [left | overlapped | right]
+        order = np.concatenate((left_positions, overlapped_positions, right_positions))
+        for column in (self.zmin, self.zmax, self.row_ids):
+            column[start:end] = column[start:end][order]
+        if tracer is not None:
+            tracer.endSpan("partition", span_start)
+            span_start = tracer.startSpan()
+
+        node.is_leaf = False
+        node.start = node.end = None
+        for piece_start, piece_end in ((start, left_end), (overlapped_end, end), (left_end, overlapped_end)):
+            if piece_start < piece_end:
+                child = IntervalTreeNode(is_leaf=True, parent=node, level=node.level + 1)
+                child.start, child.end = piece_start, piece_end
+                bounding_interval = self.calculate_bounding_interval(piece_start, piece_end)
+                node.entries.append(IntervalTreeEntry(bounding_interval, child=child))
+        if tracer is not None:
+            tracer.endSpan("build_children", span_start)
+        return left_end, overlapped_end, True
+
+    def crackPieceOnBoundaries(self, node, boundaries):
+        """
+           Cracks the piece of a leaf in place on several sorted boundaries at once. Intervals lying between
+           two consecutive boundaries form one child each and intervals crossing a boundary form the last child.
+
+           :return: Whether the piece was split
+        """
+        tracer = self.tracer
+        if tracer is not None:
+            span_start = tracer.startSpan()
+        start, end = node.start, node.end
+        gaps = np.searchsorted(boundaries, self.zmin[start:end])
+        crossing = gaps != np.searchsorted(boundaries, self.zmax[start:end])
+        keys = np.where(crossing, len(boundaries) + 1, gaps).astype(np.uint16)
+        piece_sizes = np.bincount(keys, minlength=len(boundaries) + 2)
+        if self.stats is not None:
+            self.stats.entries_partitioned += end - start
+        if piece_sizes.max() == end - start:
+            if tracer is not None:
+                tracer.endSpan("partition", span_start)
+            return False
+        if self.stats is not None:
+            self.stats.pieces_cracked += 1
+
+        # Grouping by key is a stable sort of 16-bit keys, which NumPy does with a linear radix sort
+        order = np.argsort(keys, kind="stable")
+        for column in (self.zmin, self.zmax, self.row_ids):
+            column[start:end] = column[start:end][order]
+        if tracer is not None:
+            tracer.endSpan("partition", span_start)
+            span_start = tracer.startSpan()
+
+        offsets = (start + np.concatenate(([0], np.cumsum(piece_sizes)))).tolist()
+        node.is_leaf = False
+        node.start = node.end = None
+        for key in np.flatnonzero(piece_sizes).tolist():
+            child = IntervalTreeNode(is_leaf=True, parent=node, level=node.level + 1)
+            child.start, child.end = offsets[key], offsets[key + 1]
+            bounding_interval = self.calculate_bounding_interval(child.start, child.end)
+            node.entries.append(IntervalTreeEntry(bounding_interval, child=child))
+        if tracer is not None:
+            tracer.endSpan("build_children", span_start)
+        return True
+
+    def midpoint_at(self, i):
+        return (int(self.zmin[i]) + int(self.zmax[i])) // 2
+
+
+    def recordScan(self, node):
+        """Counts a scan of a leaf that was not cracked, and sorts its piece once it has been hit often enough."""
+        node.hits += 1
+        size = node.end - node.start
+        if self.stats is not None:
+            self.stats.entries_scanned += size
+        if not self.hybrid_sort:
+            return
+        sort_after_hits = self.sort_after_hits or max(1, math.ceil(math.log2(size)))
+        if node.hits >= sort_after_hits:
+            self.sortPiece(node)
+
+    def sortPiece(self, node):
+        start, end = node.start, node.end
+        order = np.argsort(self.zmin[start:end], kind="stable")
+        for column in (self.zmin, self.zmax, self.row_ids):
+            column[start:end] = column[start:end][order]
+        node.min_sorted = self.zmin[start:end]
+        node.max_order = np.argsort(self.zmax[start:end], kind="stable")
+        node.max_sorted = self.zmax[start:end][node.max_order]
+
+    def searchSortedPiece(self, node, query_interval):
+        """
+           Finds the row ids of the intervals of a sorted leaf that overlap the query interval. Binary searches give
+           the prefix with zmin <= query max and the suffix (in zmax order) with zmax >= query min; the smaller one
+           is filtered on the other bound.
+        """
+        start, size = node.start, node.end - node.start
+        zmin_before_max = int(np.searchsorted(node.min_sorted, query_interval.max_val, side="right"))
+        zmax_before_min = int(np.searchsorted(node.max_sorted, query_interval.min_val, side="left"))
+
+        if zmin_before_max == size and zmax_before_min == 0:
+            return self.row_ids[start:start + size]
+        if self.stats is not None:
+            self.stats.entries_scanned += min(zmin_before_max, size - zmax_before_min)
+        if zmin_before_max <= size - zmax_before_min:
+            positions = np.flatnonzero(self.zmax[start:start + zmin_before_max] >= query_interval.min_val)
+        else:
+            positions = node.max_order[zmax_before_min:]
+            positions = positions[node.min_sorted[positions] <= query_interval.max_val]
+        return self.row_ids[start + positions]
+
+    def countMatches(self, leaf, row_ids, query):
+        xmin, ymin, xmax, ymax = query
+        if len(row_ids) == leaf.end - leaf.start > 0:
+            (outer_xmin, outer_ymin, outer_xmax, outer_ymax), (inner_xmin, inner_ymin, inner_xmax, inner_ymax) = \
+                self.pieceMBRBounds(leaf)
+            if inner_xmax > xmin and inner_xmin < xmax and inner_ymax > ymin and inner_ymin < ymax:
+                return len(row_ids)
+            if not (outer_xmax > xmin and outer_xmin < xmax and outer_ymax > ymin and outer_ymin < ymax):
+                return 0
+
+        return self.countRows(row_ids, query)
+
+    def countRows(self, row_ids, query):
+        return int(np.count_nonzero(self.matchMBRs(row_ids, query)))
+
+    def pieceMBRBounds(self, leaf):
+        """
+           Returns the outer bounds of the MBRs of a leaf's piece (min xmin, min ymin, max xmax, max ymax) and
+           their inner bounds (max xmin, max ymin, min xmax, min ymax), computed once per leaf.
+        """
+        if leaf.mbr_bounds is None:
+            mbrs = self.mbrs[self.row_ids[leaf.start:leaf.end]]
+            outer = (*mbrs[:, :2].min(axis=0).tolist(), *mbrs[:, 2:].max(axis=0).tolist())
+            inner = (*mbrs[:, :2].max(axis=0).tolist(), *mbrs[:, 2:].min(axis=0).tolist())
+            leaf.mbr_bounds = (outer, inner)
+        return leaf.mbr_bounds
+
+    def searchLongIntervals(self, query_interval, query):
+        if self.long_store is None:
+            return []
+        return self.refine(self.long_store.search(query_interval), query)
+
+    def refine(self, row_ids, query):
+        """Returns the MBRs of the candidate rows that overlap the query MBR, checked with one mask over the block."""
+        data = self.data
+        return [data[row_id] for row_id in row_ids[self.matchMBRs(row_ids, query)].tolist()]
+
+    def matchMBRs(self, row_ids, query):
+        if self.stats is not None:
+            self.stats.candidates_refined += len(row_ids)
+        if self.tracer is not None:
+            span_start = self.tracer.startSpan()
+        xmin, ymin, xmax, ymax = query
+        mbrs = self.mbrs[row_ids]
+        matches = (mbrs[:, 2] > xmin) & (mbrs[:, 0] < xmax) & (mbrs[:, 3] > ymin) & (mbrs[:, 1] < ymax)
+        if self.tracer is not None:
+            self.tracer.endSpan("refine", span_start)
+        return matches
+
+    def calculate_bounding_interval(self, start, end):
+        if start >= end:
+            return Interval(self.FIRST_INIT, self.END_INIT)
+        return Interval(int(self.zmin[start:end].min()), int(self.zmax[start:end].max()))
+
+    def intervals_overlap(self, interval1, interval2):
+        return not (interval1.max_val < interval2.min_val or interval1.min_val > interval2.max_val)
+
+
+    def print_tree(self, node=None, level=0):
+        if node is None:
+            node = self.tree.root
+
+        result = []
+        queue = deque([(node, level)])
+        while queue:
+            node, level = queue.popleft()
+            if node.is_leaf:
+                result.append(' ' * 4 * level + f'Leaf {level}: Piece = [{node.start}, {node.end})')
+                continue
+            for entry in node.entries:
+                result.append(' ' * 4 * level + f'Node {level}: Interval = {entry.interval}')
+                queue.append((entry.child, level + 1))
+        return result
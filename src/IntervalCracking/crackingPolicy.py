@@ -0,0 +1,59 @@
+"""
+    Cracking policies decide whether a piece gets extra data-driven cracks before it is cracked on the query bounds
+    (Stochastic Database Cracking, Halim et al.).
+
+    Plain query-driven cracking only cracks on query bounds. When queries arrive in sorted order (a sequential sweep over
+    the Z-ranges) or keep hitting the same area, every crack only cuts a sliver off a big piece, and that big piece is
+    scanned again by the next query. Data-driven cracks split large pieces independently of the query bounds:
+
+        - "standard": query-driven cracking only.
+        - "dd1r":     one crack on a random pivot in each large piece a query touches, then crack on the query bounds.
+        - "ddr":      crack the touched pieces on random pivots recursively until they are small, then on the query bounds.
+        - "dd1c":     like "dd1r", but the pivot is the (sampled) median of the piece.
+        - "ddc":      like "ddr", but the pivot is the (sampled) median of the piece.
+
+    A crack on a pivot splits a piece into intervals that end before the pivot, intervals that start after it, and the
+    intervals that contain it. Pivots are midpoints of intervals from the piece, so they always follow the data.
+"""
+
+
+import random
+
+
+CRACKING_POLICIES = {
+    # policy: (pivot, recursive)
+    "standard": (None, False),
+    "dd1r": ("random", False),
+    "ddr": ("random", True),
+    "dd1c": ("center", False),
+    "ddc": ("center", True),
+}
+
+
+class CrackingPolicy:
+    def __init__(self, name="standard", piece_threshold=1024, sample_size=64, seed=None):
+        if name not in CRACKING_POLICIES:
+            raise ValueError(f"Unknown cracking policy {name!r}, expected one of {sorted(CRACKING_POLICIES)}")
+        self.name = name
+        self.pivot, self.recursive = CRACKING_POLICIES[name]
+        self.piece_threshold = piece_threshold
+        self.sample_size = sample_size
+        self.rng = random.Random(seed)
+
+    def needsDataDrivenCrack(self, piece_size):
+        return self.pivot is not None and piece_size > self.piece_threshold
+
+    def choosePivot(self, midpoint_at, start, end):
+        """
+           Picks a pivot for the piece [start, end).
+
+           :param midpoint_at: Function returning the midpoint of the interval at a given offset of the cracker array
+        """
+        if self.pivot == "random":
+            return midpoint_at(self.rng.randrange(start, end))
+
+        sample = sorted(midpoint_at(self.rng.randrange(start, end)) for _ in range(self.sample_size))
+        return sample[len(sample) // 2]
+
+    def __repr__(self):
+        return f'CrackingPolicy({self.name}, PieceThreshold={self.piece_threshold})'
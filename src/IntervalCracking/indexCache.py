@@ -0,0 +1,176 @@
+"""
+    A memory budget for a set of cracking indexes (the cluster indexes of CrackingSPLindex), evicting the cold ones.
+
+    1- Size Accounting:
+
+        - indexMemory estimates the bytes of an index: its cracker columns or list of entries, the tree nodes and
+          entries, the sort orders of the sorted leaves and the long interval store.
+        - An index is measured when it is added and again every measure_every lookups, since cracking and sorting
+          make it grow. IndexCache.memory is the sum of the last measures.
+
+    2- Eviction:
+
+        - Once the indexes exceed the budget, the coldest ones are evicted until they fit again: the least recently
+          used one ("lru"), or the least frequently used one ("lfu", the least recent among equally frequent ones).
+        - The index just added or looked up is never evicted, even if it alone exceeds the budget.
+
+    3- Spilling:
+
+        - Without spill_dir an evicted index is dropped, and its owner rebuilds it from its intervals on the next lookup.
+        - With spill_dir it is saved there with its cracks (see persistence.py) and memory-mapped back on its next
+          lookup, so a cluster evicted while hot comes back as refined as it left.
+"""
+
+
+import os
+import sys
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+
+from .interval_structures import Interval, IntervalTreeEntry, IntervalTreeNode
+from .columnarIntervalCracking import ColumnarIntervalCracking
+from .persistence import saveIndex, loadIndex
+
+
+EVICTION_POLICIES = ("lru", "lfu")
+
+# Bytes of the Python objects of a tree node and of an internal entry (entry, interval and its two bounds)
+NODE_BYTES = sys.getsizeof(IntervalTreeNode()) + sys.getsizeof([])
+ENTRY_BYTES = sys.getsizeof(IntervalTreeEntry(None)) + sys.getsizeof(Interval(0, 0)) + 2 * sys.getsizeof(2 ** 40) + 8
+
+
+
+def indexMemory(index):
+    """Estimated bytes held by an IntervalCracking or ColumnarIntervalCracking index."""
+    size = sorted_entries = 0
+    queue = deque([index.tree.root])
+    while queue:
+        node = queue.popleft()
+        size += NODE_BYTES + len(node.entries) * ENTRY_BYTES
+        if node.max_order is not None:
+            sorted_entries += node.end - node.start
+        queue.extend(entry.child for entry in node.entries if entry.child)
+
+    if isinstance(index, ColumnarIntervalCracking):
+        # The columns, and the list of data objects returned as results (a restored index returns rows of mbrs)
+        size += index.zmin.nbytes + index.zmax.nbytes + index.row_ids.nbytes + index.mbrs.nbytes
+        if index.data is not index.mbrs:
+            size += sys.getsizeof(index.data) + (sys.getsizeof(index.data[0]) * len(index.data) if index.data else 0)
+        # The zmax order and the sorted zmax of the sorted leaves, their zmin is a view of the column
+        size += sorted_entries * 2 * index.zmax.itemsize
+    else:
+        # One (Interval, mbr) tuple per entry, and three lists of sorted values per entry of a sorted leaf
+        for entries in (index.intervals, index.long_intervals):
+            if entries:
+                interval, mbr = entries[0]
+                entry_bytes = sys.getsizeof(entries[0]) + sys.getsizeof(interval) + sys.getsizeof(mbr) + \
+                    sys.getsizeof(interval.min_val) + sys.getsizeof(interval.max_val)
+                size += sys.getsizeof(entries) + entry_bytes * len(entries)
+        size += sorted_entries * 3 * (8 + sys.getsizeof(2 ** 40))
+
+    if index.long_store is not None:
+        size += sum(zmin.nbytes + zmax.nbytes + ids.nbytes for _, zmin, zmax, ids in index.long_store.classes)
+    return size
+
+
+
+# ----------------------------------------------------------------------- #
+#                             Index Cache Class
+# ----------------------------------------------------------------------- #
+
+class IndexCache(MutableMapping):
+    def __init__(self, memory_budget, policy="lru", spill_dir=None, measure_every=64):
+        """
+           A dict of indexes (e.g. cluster_id -> index) that keeps their estimated memory within memory_budget.
+
+           :param memory_budget: Bytes the indexes may hold
+           :param policy: "lru" or "lfu", which index is evicted first
+           :param spill_dir: Directory evicted indexes are saved to (None drops them)
+           :param measure_every: Lookups of an index between two measures of its size
+        """
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {policy!r}, expected one of {EVICTION_POLICIES}")
+        self.memory_budget = memory_budget
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.measure_every = measure_every
+        self.indexes = OrderedDict()    # key -> index, from the least to the most recently used
+        self.sizes = {}                 # key -> bytes at the last measure
+        self.lookups = {}               # key -> lookups of the index, kept across evictions (the frequency of "lfu")
+        self.spilled = {}               # key -> (path, stats, tracer) of the indexes saved to spill_dir
+        self.memory = 0
+        self.evictions = 0
+        self.reloads = 0
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __getitem__(self, key):
+        if key not in self.indexes:
+            if key not in self.spilled:
+                raise KeyError(key)
+            path, stats, tracer = self.spilled.pop(key)
+            self.reloads += 1
+            self[key] = loadIndex(path, stats=stats, tracer=tracer)
+            self.lookups[key] += 1
+            return self.indexes[key]
+
+        self.indexes.move_to_end(key)
+        self.lookups[key] += 1
+        if self.lookups[key] % self.measure_every == 0:
+            self.measure(key)
+            self.evict(keep=key)
+        return self.indexes[key]
+
+    def __setitem__(self, key, index):
+        if key in self.indexes:
+            self.memory -= self.sizes[key]
+        self.spilled.pop(key, None)
+        self.indexes[key] = index
+        self.indexes.move_to_end(key)
+        self.lookups.setdefault(key, 0)
+        self.sizes[key] = 0
+        self.measure(key)
+        self.evict(keep=key)
+
+    def __delitem__(self, key):
+        if key in self.spilled:
+            os.remove(self.spilled.pop(key)[0])
+        else:
+            del self.indexes[key]
+            self.memory -= self.sizes.pop(key)
+        del self.lookups[key]
+
+    def __contains__(self, key):
+        return key in self.indexes or key in self.spilled
+
+    def __iter__(self):
+        yield from list(self.indexes)
+        yield from list(self.spilled)
+
+    def __len__(self):
+        return len(self.indexes) + len(self.spilled)
+
+    def measure(self, key):
+        size = indexMemory(self.indexes[key])
+        self.memory += size - self.sizes[key]
+        self.sizes[key] = size
+
+    def evict(self, keep=None):
+        """Evicts the coldest indexes other than keep until the indexes fit in the memory budget."""
+        while self.memory > self.memory_budget and len(self.indexes) > (keep in self.indexes):
+            candidates = (key for key in self.indexes if key != keep)
+            if self.policy == "lru":
+                key = next(candidates)
+            else:
+                key = min(candidates, key=self.lookups.__getitem__)
+
+            index = self.indexes.pop(key)
+            self.memory -= self.sizes.pop(key)
+            self.evictions += 1
+            if self.spill_dir is not None:
+                path = os.path.join(self.spill_dir, f"index_{key}.bin")
+                self.spilled[key] = (saveIndex(path, index), index.stats, index.tracer)
+
+    def __repr__(self):
+        return f'IndexCache(InMemory={len(self.indexes)}, Spilled={len(self.spilled)}, ' \
+               f'Memory={self.memory}, Budget={self.memory_budget})'
@@ -21,13 +21,57 @@
         -Dynamic Adaptation: As more queries are processed, the data becomes increasingly partitioned in a way that
                              reflects actual query patterns, leading to more efficient retrievals.
 
+
+    3- Cracker Array:
+
+        - All intervals of an index live in one physical list (self.intervals) of (Interval, data) tuples.
+        - Cracking reorders a piece of this list in place, and every leaf of the tree only records the [start, end)
+          offsets of its piece, so a crack does not copy the piece or allocate new entries for it.
+
+
+    4- Batch Queries:
+
+        - adaptiveSearchBatch sorts a batch of queries by their intervals and traverses the tree once, carrying down to
+          every child only the queries that overlap it.
+        - A large piece touched by several queries is cracked once on all their boundaries: intervals lying between two
+          consecutive boundaries form one piece each, and intervals crossing a boundary form one more piece.
+
+
+    5- Hybrid Crack-Sort:
+
+        - Every scan of a leaf that does not crack it (a small piece, or one no query can split) is counted.
+        - Once the scans of a leaf have cost as much as sorting it (log2(size) hits), its piece is sorted by min_val and
+          a max_val order is kept next to it. From then on the leaf is answered with binary searches instead of scans.
+
+
+    6- Counting:
+
+        - adaptiveCount / adaptiveExists crack like adaptiveSearch but never build result lists. The size of a piece is its
+          offset range, and the MBR bounds of a leaf tell whether all or none of its MBRs overlap a query, so such pieces
+          are counted without touching their entries. adaptiveExists stops at the first result.
+
+
+    7- Long Intervals:
+
+        - Intervals longer than the z-range of an average piece cross the bounds of most cracks and would pile up in
+          the overlapped pieces. They are kept out of the cracker array, in a LongIntervalStore partitioned by length
+          class (see longIntervals.py), which every query searches next to the tree.
+
 """
 
 
 import math
+from bisect import bisect_left, bisect_right
 from collections import deque
 
+import numpy as np
+
 from .interval_structures import Interval, IntervalTree, IntervalTreeEntry, IntervalTreeNode
+from .crackingPolicy import CrackingPolicy
+from .autoTuning import calibrateMaxEntries
+from .longIntervals import LongIntervalStore, selectLongIntervals
+from .queryStats import QueryStats
+from .tracing import Tracer
 
 
 
@@ -36,31 +80,60 @@ from .interval_structures import Interval, IntervalTree, IntervalTreeEntry, Inte
 # ----------------------------------------------------------------------- #
 
 class IntervalCracking:
-    def __init__(self, intervals, max_entries=128, min_entries=None, FIRST_INIT=21474836, END_INIT=-21474836):
+    def __init__(self, intervals, max_entries=128, min_entries=None, FIRST_INIT=21474836, END_INIT=-21474836,
+                 cracking_policy="standard", hybrid_sort=True, sort_after_hits=None, long_interval_length="auto",
+                 stats=None, tracer=None):
+        # max_entries="auto" calibrates the stop-cracking threshold on the intervals (see autoTuning.py)
+        self.calibration = None
+        if max_entries == "auto":
+            max_entries, self.calibration = calibrateMaxEntries(type(self), intervals)
         self.max_entries = max_entries
         self.min_entries = min_entries or math.ceil(max_entries / 2)
         self.FIRST_INIT = FIRST_INIT
         self.END_INIT = END_INIT
+        self.policy = cracking_policy if isinstance(cracking_policy, CrackingPolicy) else CrackingPolicy(cracking_policy)
+        self.hybrid_sort = hybrid_sort
+        self.sort_after_hits = sort_after_hits    # None: sort a leaf after log2(size) hits
+        self.stats = QueryStats() if stats is True else stats    # optional per-query counters (see queryStats.py)
+        self.tracer = Tracer() if tracer is True else tracer     # optional phase timing spans (see tracing.py)
         self.tree = IntervalTree()
         root_node = self.tree.root
 
+        # The cracker array holding all intervals, reordered in place by cracking
+        self.intervals = [(Interval(interval[0][0], interval[0][1]), interval[1]) for interval in intervals]
+
+        # Move the long intervals out of the cracker array into their own store
+        self.long_intervals, self.long_store = [], None
+        zmin = np.fromiter((interval.min_val for interval, _ in self.intervals), dtype=np.int64, count=len(self.intervals))
+        zmax = np.fromiter((interval.max_val for interval, _ in self.intervals), dtype=np.int64, count=len(self.intervals))
+        is_long = selectLongIntervals(zmin, zmax, max_entries, long_interval_length)
+        if is_long is not None:
+            self.long_intervals = [entry for entry, long in zip(self.intervals, is_long.tolist()) if long]
+            self.intervals = [entry for entry, long in zip(self.intervals, is_long.tolist()) if not long]
+            self.long_store = LongIntervalStore(zmin[is_long], zmax[is_long], np.arange(len(self.long_intervals)))
+
         # Create a root node that includes all intervals as the initial tree structure
-        overall_interval = self.calculate_bounding_interval([(Interval(interval[0][0], interval[0][1]), interval[1]) for interval in intervals])
+        overall_interval = self.calculate_bounding_interval(self.intervals, 0, len(self.intervals))
         root_node.entries.append(IntervalTreeEntry(overall_interval))
         root_node.is_leaf = False
 
-        # Create the first level of children nodes containing the intervals
+        # Create the first level of children nodes, a single piece covering the whole cracker array
         initial_node = IntervalTreeNode(is_leaf=True, parent=root_node, level=1)
-        initial_node.entries = [IntervalTreeEntry(Interval(interval[0][0], interval[0][1]), interval[1]) for interval in intervals]
+        initial_node.start, initial_node.end = 0, len(self.intervals)
         root_node.entries[0].child = initial_node
 
 
     def adaptiveSearch(self, query_interval, query):
+        stats = self.stats
+        if stats is not None:
+            stats.beginQuery()
         queue = deque([self.tree.root])
-        query_results = []
+        query_results = self.searchLongIntervals(query_interval, query)
 
         while queue:
             node = queue.popleft()
+            if stats is not None:
+                stats.nodes_visited += 1
 
             if node.is_leaf:
                 results = self.searchAndCrack(query_interval, query, node)
@@ -71,156 +144,612 @@ class IntervalCracking:
                     if entry.child and self.intervals_overlap(entry.interval, query_interval):
                         queue.append(entry.child)
 
+        if stats is not None:
+            stats.endQuery(len(query_results))
         return query_results
 
 
-    def searchAndCrack(self, query_interval, query, node):
+    def adaptiveSearchBatch(self, query_intervals, queries, max_boundaries=16):
         """
-           Performing interval cracking and incremental build the tree data structure:
-            1- Left Node: Contains intervals strictly to the left of the query interval.
-            2- Right Node: Contains intervals strictly to the right of the query interval.
-            3- Overlapped Node: Contains intervals that overlap with the query interval.
+           Answers a batch of queries with one traversal of the tree, cracking every touched piece once
+           on the boundaries of the queries that reach it.
+
+           :param query_intervals: The intervals of the queries
+           :param queries: The query MBRs (xmin, ymin, xmax, ymax), one per interval
+           :param max_boundaries: Maximum number of query boundaries a piece is cracked on at once
+           :return: A list with the results of every query, in the order of the batch
         """
-        xmin, ymin, xmax, ymax = query
-        query_results = []
+        stats = self.stats
+        if stats is not None:
+            # One record per query, the work of a node is charged to the queries reaching it
+            stats.beginBatch(len(query_intervals))
+        batch_results = []
+        for i, (query_interval, query) in enumerate(zip(query_intervals, queries)):
+            if stats is not None:
+                stats.chargeQuery(i)
+            batch_results.append(self.searchLongIntervals(query_interval, query))
+        query_ids = sorted(range(len(query_intervals)), key=lambda i: query_intervals[i].min_val)
+
+        queue = deque([(self.tree.root, query_ids)])
+        while queue:
+            node, query_ids = queue.popleft()
+            if stats is not None:
+                stats.chargeQueries(query_ids)
+                stats.nodes_visited += 1
 
-        #if isinstance(node.entries[0], tuple):
-        #    node.entries = [IntervalTreeEntry(interval=entry[0], data=entry[1]) for entry in node.entries]
-        self.local_intervals = [(entry.interval, entry.data) for entry in node.entries]
+            if not node.is_leaf:
+                for entry in node.entries:
+                    overlapping = [i for i in query_ids if self.intervals_overlap(entry.interval, query_intervals[i])]
+                    if entry.child and overlapping:
+                        queue.append((entry.child, overlapping))
+                continue
+
+            if len(query_ids) > 1 and node.end - node.start > self.max_entries and node.max_order is None:
+                boundaries = sorted({bound for i in query_ids
+                                     for bound in (query_intervals[i].min_val, query_intervals[i].max_val)})
+                if len(boundaries) > max_boundaries:
+                    step = (len(boundaries) - 1) / max(max_boundaries - 1, 1)
+                    boundaries = [boundaries[int(k * step)] for k in range(max_boundaries)]
+                if self.crackPieceOnBoundaries(node, boundaries):
+                    queue.append((node, query_ids))
+                    continue
+
+            # Small or unsplittable piece: answer the queries one by one, the first crack hands the rest back
+            for position, i in enumerate(query_ids):
+                if stats is not None:
+                    stats.chargeQuery(i)
+                batch_results[i].extend(self.searchAndCrack(query_intervals[i], queries[i], node))
+                if not node.is_leaf:
+                    queue.append((node, query_ids[position + 1:]))
+                    break
+
+        if stats is not None:
+            stats.endBatch([len(query_results) for query_results in batch_results])
+        return batch_results
+
+
+    def adaptiveSearchBatchRanges(self, query_ranges, queries, max_boundaries=16):
+        """
+           Batch counterpart of adaptiveSearchRanges: the z-ranges of all the queries traverse the tree together like
+           the queries of adaptiveSearchBatch, cracking every touched piece once on their boundaries. The candidates
+           of every query are refined once, so an interval overlapping several of its ranges is reported once.
+
+           :param query_ranges: The z-ranges of every query, lists of Interval (see MortonCode.decompose_query)
+           :param queries: The query MBRs (xmin, ymin, xmax, ymax), one per list of z-ranges
+           :param max_boundaries: Maximum number of range boundaries a piece is cracked on at once
+           :return: A list with the results of every query, in the order of the batch
+        """
+        if all(len(ranges) == 1 for ranges in query_ranges):
+            return self.adaptiveSearchBatch([ranges[0] for ranges in query_ranges], queries, max_boundaries)
+
+        range_intervals = [interval for ranges in query_ranges for interval in ranges]
+        range_queries = [query_id for query_id, ranges in enumerate(query_ranges) for _ in ranges]
+        intervals = self.intervals
+        stats = self.stats
+        if stats is not None:
+            # One record per query, like adaptiveSearchBatch
+            stats.beginBatch(len(query_ranges))
+        # Long intervals are few, they are searched once per query with the range covering all its z-ranges
+        batch_candidates = [[] if self.long_store is None else
+                            [self.long_intervals[i] for i in self.long_store.search(
+                                Interval(min(interval.min_val for interval in ranges),
+                                         max(interval.max_val for interval in ranges))).tolist()]
+                            for ranges in query_ranges]
+        range_ids = sorted(range(len(range_intervals)), key=lambda i: range_intervals[i].min_val)
+
+        queue = deque([(self.tree.root, range_ids)])
+        while queue:
+            node, range_ids = queue.popleft()
+            if stats is not None:
+                stats.chargeQueries([range_queries[i] for i in range_ids])
+                stats.nodes_visited += 1
 
-        # If the number of intervals is small, no need to crack, just search
-        if len(node.entries) <= self.max_entries:
-            query_results.extend(
-                [entry.data for entry in node.entries if (entry.data[2] > xmin and entry.data[0] < xmax and entry.data[3] > ymin and entry.data[1] < ymax)])
-            return query_results
+            if not node.is_leaf:
+                for entry in node.entries:
+                    overlapping = [i for i in range_ids if self.intervals_overlap(entry.interval, range_intervals[i])]
+                    if entry.child and overlapping:
+                        queue.append((entry.child, overlapping))
+                continue
+
+            if len(range_ids) > 1 and node.end - node.start > self.max_entries and node.max_order is None:
+                boundaries = sorted({bound for i in range_ids
+                                     for bound in (range_intervals[i].min_val, range_intervals[i].max_val)})
+                if len(boundaries) > max_boundaries:
+                    step = (len(boundaries) - 1) / max(max_boundaries - 1, 1)
+                    boundaries = [boundaries[int(k * step)] for k in range(max_boundaries)]
+                if self.crackPieceOnBoundaries(node, boundaries):
+                    queue.append((node, range_ids))
+                    continue
+
+            # A small or sorted leaf is answered for every query reaching it like in rangeCandidates: taken whole once
+            # while unsorted, binary searched on the ranges of the query once the scans have sorted it
+            if node.end - node.start <= self.max_entries or node.max_order is not None:
+                query_ranges_ids = {}
+                for i in range_ids:
+                    query_ranges_ids.setdefault(range_queries[i], []).append(i)
+                for query_id, query_range_ids in sorted(query_ranges_ids.items()):
+                    if stats is not None:
+                        stats.chargeQuery(query_id)
+                    if node.max_order is not None:
+                        for i in query_range_ids:
+                            batch_candidates[query_id].extend(
+                                intervals[offset] for offset in self.searchSortedPiece(node, range_intervals[i]))
+                    else:
+                        batch_candidates[query_id].extend(intervals[node.start:node.end])
+                        self.recordScan(node)
+                continue
+
+            # Unsplittable piece: take the candidates of the ranges one by one, the first crack hands the rest back
+            for position, i in enumerate(range_ids):
+                if stats is not None:
+                    stats.chargeQuery(range_queries[i])
+                candidates = batch_candidates[range_queries[i]]
+                for _, offsets in self.crackLeaf(range_intervals[i], node):
+                    candidates.extend(intervals[offset] for offset in offsets)
+                if not node.is_leaf:
+                    queue.append((node, range_ids[position + 1:]))
+                    break
+
+        batch_results = []
+        for query_id, (candidates, query) in enumerate(zip(batch_candidates, queries)):
+            if stats is not None:
+                stats.chargeQuery(query_id)
+            batch_results.append(self.refineEntries(candidates, query))
+        if stats is not None:
+            stats.endBatch([len(query_results) for query_results in batch_results])
+        return batch_results
+
+
+    def adaptiveSearchRanges(self, query_intervals, query):
+        """
+           Answers a query whose z-interval is decomposed into several disjoint z-ranges (see MortonCode.decompose_query).
+           The ranges traverse the tree together: a small leaf is taken once for all the ranges reaching it, a sorted
+           one is binary searched for each of them and a large piece is cracked on them one by one. An interval overlapping several ranges is reported once.
+        """
+        if len(query_intervals) == 1:
+            return self.adaptiveSearch(query_intervals[0], query)
+
+        stats = self.stats
+        if stats is not None:
+            stats.beginQuery()
+        query_results = self.refineEntries(self.rangeCandidates(query_intervals), query)
+        if stats is not None:
+            stats.endQuery(len(query_results))
+        return query_results
 
+    def adaptiveCountRanges(self, query_intervals, query, limit=None):
+        """
+           Counts the results of a query decomposed into several z-ranges, cracking like adaptiveSearchRanges. With a
+           single range the pieces are counted like in adaptiveCount, otherwise the union of the candidates is.
+        """
+        if len(query_intervals) == 1:
+            return self.adaptiveCount(query_intervals[0], query, limit)
+
+        if self.stats is not None:
+            self.stats.beginQuery()
+        count = len(self.refineEntries(self.rangeCandidates(query_intervals), query))
+        if self.stats is not None:
+            self.stats.endQuery(count)
+        return count
+
+    def rangeCandidates(self, query_intervals):
+        """Cracks the tree on several z-ranges of a query and returns the (Interval, data) entries of the candidates."""
+        stats = self.stats
+        intervals = self.intervals
+        # Long intervals are few, they are searched once with the range covering all the z-ranges
+        covering_interval = Interval(min(interval.min_val for interval in query_intervals),
+                                     max(interval.max_val for interval in query_intervals))
+        entries = [] if self.long_store is None else \
+            [self.long_intervals[i] for i in self.long_store.search(covering_interval).tolist()]
+
+        queue = deque([(self.tree.root, query_intervals)])
+        while queue:
+            node, ranges = queue.popleft()
+            if stats is not None:
+                stats.nodes_visited += 1
 
-        this_piece_left = 0
-        this_piece_right = len(self.local_intervals)
+            if not node.is_leaf:
+                for entry in node.entries:
+                    overlapping = [query_interval for query_interval in ranges
+                                   if self.intervals_overlap(entry.interval, query_interval)]
+                    if entry.child and overlapping:
+                        queue.append((entry.child, overlapping))
+                continue
+
+            # A sorted leaf is answered with binary searches, a small one is taken whole like in crackLeaf
+            if node.max_order is not None:
+                for query_interval in ranges:
+                    entries.extend(intervals[i] for i in self.searchSortedPiece(node, query_interval))
+                continue
+            if node.end - node.start <= self.max_entries:
+                entries.extend(intervals[node.start:node.end])
+                self.recordScan(node)
+                continue
+
+            # Large piece: crack it on the first range and hand the others back, to the new pieces if it was cracked
+            for _, offsets in self.crackLeaf(ranges[0], node):
+                entries.extend(intervals[i] for i in offsets)
+            if len(ranges) > 1:
+                queue.append((node, ranges[1:]))
+        return entries
+
+    def refineEntries(self, entries, query):
+        """
+           Returns the data of the candidate entries that overlap the query MBR, each entry once: the (Interval, data)
+           entries move while cracking but stay the same objects, so duplicates share their id.
+        """
+        if self.tracer is not None:
+            span_start = self.tracer.startSpan()
+        xmin, ymin, xmax, ymax = query
+        query_results = []
+        seen = set()
+        for entry in entries:
+            if id(entry) in seen:
+                continue
+            seen.add(id(entry))
+            mbr = entry[1]
+            if mbr[2] > xmin and mbr[0] < xmax and mbr[3] > ymin and mbr[1] < ymax:
+                query_results.append(mbr)
+        if self.tracer is not None:
+            self.tracer.endSpan("refine", span_start)
+        if self.stats is not None:
+            self.stats.candidates_refined += len(seen)
+        return query_results
 
-        crack_index_min = self.crackOnAxisMax(self.local_intervals, this_piece_left, this_piece_right,
-                                              query_interval.min_val, Interval(self.FIRST_INIT, self.END_INIT),
-                                              Interval(self.FIRST_INIT, self.END_INIT), False)
+    def adaptiveCount(self, query_interval, query, limit=None):
+        """
+           Counts the results of a query without materializing them. Pieces are cracked like in adaptiveSearch,
+           a whole piece whose MBRs all overlap the query is counted by its size and one whose MBRs all miss the query
+           is skipped, both without touching its entries.
 
-        left_intervals = self.local_intervals[:crack_index_min]
+           :param limit: Stop counting once this many results are found
+        """
+        if self.stats is not None:
+            self.stats.beginQuery()
+        count = len(self.searchLongIntervals(query_interval, query))
 
-        crack_index_max = self.crackOnAxisMin(self.local_intervals, crack_index_min, this_piece_right,
-                                              query_interval.max_val, Interval(self.FIRST_INIT, self.END_INIT),
-                                              Interval(self.FIRST_INIT, self.END_INIT), True)
+        if limit is None or count < limit:
+            for leaf, offsets in self.crackTree(query_interval):
+                count += self.countMatches(leaf, offsets, query)
+                if limit is not None and count >= limit:
+                    break
 
-        right_intervals = self.local_intervals[crack_index_max:]
-        overlapped_intervals = self.local_intervals[crack_index_min:crack_index_max]
+        if self.stats is not None:
+            self.stats.endQuery(count)
+        return count
 
-        node.entries.clear()  # Clearing the current node entries
+    def adaptiveExists(self, query_interval, query):
+        return self.adaptiveCount(query_interval, query, limit=1) > 0
 
-        if left_intervals:
-            left_child = IntervalTreeNode(is_leaf=True, parent=node, level=node.level + 1)
-            left_child.entries = [IntervalTreeEntry(interval, data=data) for interval, data in left_intervals]
-            left_bounding_interval = self.calculate_bounding_interval(left_intervals)
-            node.is_leaf = False
-            node.entries.append(IntervalTreeEntry(left_bounding_interval, child=left_child))
 
-        if right_intervals:
-            right_child = IntervalTreeNode(is_leaf=True, parent=node, level=node.level + 1)
-            right_child.entries = [IntervalTreeEntry(interval, data=data) for interval, data in right_intervals]
-            right_bounding_interval = self.calculate_bounding_interval(right_intervals)
-            node.is_leaf = False
-            node.entries.append(IntervalTreeEntry(right_bounding_interval, child=right_child))
+    def crackTree(self, query_interval):
+        """Cracks every leaf the query interval reaches, yielding the candidate blocks (leaf, offsets) of crackLeaf."""
+        stats = self.stats
+        queue = deque([self.tree.root])
+        while queue:
+            node = queue.popleft()
+            if stats is not None:
+                stats.nodes_visited += 1
 
-        if overlapped_intervals:
-            overlapped_child = IntervalTreeNode(is_leaf=True, parent=node, level=node.level + 1)
-            overlapped_child.entries = [IntervalTreeEntry(interval, data=data) for interval, data in overlapped_intervals]
-            overlapped_bounding_interval = self.calculate_bounding_interval(overlapped_intervals)
-            node.is_leaf = False
-            node.entries.append(IntervalTreeEntry(overlapped_bounding_interval, child=overlapped_child))
+            if node.is_leaf:
+                yield from self.crackLeaf(query_interval, node)
+            else:
+                for entry in node.entries:
+                    if entry.child and self.intervals_overlap(entry.interval, query_interval):
+                        queue.append(entry.child)
 
-        for entry in overlapped_intervals:
-            mbr = entry[1]
+    def searchAndCrack(self, query_interval, query, node, data_driven=True):
+        """
+           Performing interval cracking and incremental build the tree data structure:
+            1- Left Node: Contains intervals strictly to the left of the query interval.
+            2- Right Node: Contains intervals strictly to the right of the query interval.
+            3- Overlapped Node: Contains intervals that overlap with the query interval.
+        """
+        xmin, ymin, xmax, ymax = query
+        query_results = []
+        intervals = self.intervals
+
+        for _, offsets in self.crackLeaf(query_interval, node, data_driven):
+            if self.stats is not None:
+                self.stats.candidates_refined += len(offsets)
+            if self.tracer is not None:
+                span_start = self.tracer.startSpan()
+            for i in offsets:
+                mbr = intervals[i][1]
+                if mbr[2] > xmin and mbr[0] < xmax and mbr[3] > ymin and mbr[1] < ymax:
+                    query_results.append(mbr)
+            if self.tracer is not None:
+                self.tracer.endSpan("refine", span_start)
+        return query_results
+
+    def searchLongIntervals(self, query_interval, query):
+        if self.long_store is None:
+            return []
+        xmin, ymin, xmax, ymax = query
+        query_results = []
+        candidates = self.long_store.search(query_interval).tolist()
+        if self.stats is not None:
+            self.stats.candidates_refined += len(candidates)
+        if self.tracer is not None:
+            span_start = self.tracer.startSpan()
+        for i in candidates:
+            mbr = self.long_intervals[i][1]
             if mbr[2] > xmin and mbr[0] < xmax and mbr[3] > ymin and mbr[1] < ymax:
                 query_results.append(mbr)
-
+        if self.tracer is not None:
+            self.tracer.endSpan("refine", span_start)
         return query_results
 
-    def calculate_bounding_interval(self, intervals):
-        min_val = min(interval[0].min_val for interval in intervals)
-        max_val = max(interval[0].max_val for interval in intervals)
+    def crackLeaf(self, query_interval, node, data_driven=True):
+        """
+           Cracks a leaf for a query and returns the candidates of the query as (leaf, offsets) blocks, where offsets
+           point to the intervals of the leaf's piece that overlap the query interval.
+
+           Large pieces may first get a data-driven crack chosen by the cracking policy, and the query then
+           continues into the new pieces it overlaps (see crackingPolicy.py).
+        """
+        # A sorted leaf is answered with binary searches
+        if node.max_order is not None:
+            return [(node, self.searchSortedPiece(node, query_interval))]
+
+        # If the number of intervals is small, no need to crack, just search
+        # (sorting the piece in recordScan only permutes the intervals of this whole-piece block)
+        if node.end - node.start <= self.max_entries:
+            self.recordScan(node)
+            return [(node, range(node.start, node.end))]
+
+        if data_driven and self.policy.needsDataDrivenCrack(node.end - node.start):
+            pivot = self.policy.choosePivot(self.midpoint_at, node.start, node.end)
+            _, _, cracked = self.crackPiece(node, Interval(pivot, pivot))
+            if cracked:
+                candidates = []
+                for entry in node.entries:
+                    if self.intervals_overlap(entry.interval, query_interval):
+                        candidates.extend(self.crackLeaf(query_interval, entry.child, self.policy.recursive))
+                return candidates
+
+        crack_index_min, crack_index_max, cracked = self.crackPiece(node, query_interval)
+        if not cracked:
+            # The piece went entirely to one side, so the candidates are either all of it or none
+            self.recordScan(node)
+            return [(node, range(crack_index_min, crack_index_max))]
+        if crack_index_min == crack_index_max:
+            return []
+        # The overlapped piece is the last child of a cracked node
+        return [(node.entries[-1].child, range(crack_index_min, crack_index_max))]
+
+    def crackPiece(self, node, crack_interval):
+        """
+           Cracks the piece of a leaf in place around crack_interval and turns the leaf into an internal node
+           with left, right and overlapped children.
+
+           :return: (crack_index_min, crack_index_max, cracked), where [crack_index_min, crack_index_max) holds
+                    the intervals overlapping crack_interval and cracked tells whether the piece was split
+        """
+        tracer = self.tracer
+        if tracer is not None:
+            span_start = tracer.startSpan()
+        this_piece_left = node.start
+        this_piece_right = node.end
+
+        crack_index_min, crack_index_max, piece_bounds = self.crackInThree(self.intervals, this_piece_left,
+                                                                           this_piece_right, crack_interval)
+
+        # The piece is now [left | overlapped | right], children only keep their offsets and bounds.
+        # A crack that does not split the piece would only add an identical child.
+        pieces = ((this_piece_left, crack_index_min), (crack_index_max, this_piece_right),
+                  (crack_index_min, crack_index_max))
+        if self.stats is not None:
+            self.stats.entries_partitioned += this_piece_right - this_piece_left
+        if tracer is not None:
+            tracer.endSpan("partition", span_start)
+        if any(piece_end - piece_start == this_piece_right - this_piece_left for piece_start, piece_end in pieces):
+            return crack_index_min, crack_index_max, False
+        if self.stats is not None:
+            self.stats.pieces_cracked += 1
+        if tracer is not None:
+            span_start = tracer.startSpan()
+
+        node.start = node.end = None
+        node.is_leaf = False
+        for (piece_start, piece_end), bounding_interval in zip(pieces, piece_bounds):
+            if piece_start < piece_end:
+                child = IntervalTreeNode(is_leaf=True, parent=node, level=node.level + 1)
+                child.start, child.end = piece_start, piece_end
+                node.entries.append(IntervalTreeEntry(bounding_interval, child=child))
+        if tracer is not None:
+            tracer.endSpan("build_children", span_start)
+        return crack_index_min, crack_index_max, True
+
+    def crackPieceOnBoundaries(self, node, boundaries):
+        """
+           Cracks the piece of a leaf in place on several sorted boundaries at once. Intervals lying between
+           two consecutive boundaries form one child each and intervals crossing a boundary form the last child.
+
+           :return: Whether the piece was split
+        """
+        tracer = self.tracer
+        if tracer is not None:
+            span_start = tracer.startSpan()
+        start, end = node.start, node.end
+        pieces = [[] for _ in range(len(boundaries) + 2)]
+        piece_bounds = [[math.inf, -math.inf] for _ in range(len(boundaries) + 2)]
+        for i in range(start, end):
+            entry = self.intervals[i]
+            min_val, max_val = entry[0].min_val, entry[0].max_val
+            key = bisect_left(boundaries, min_val)
+            if key != bisect_left(boundaries, max_val):
+                key = len(boundaries) + 1
+            pieces[key].append(entry)
+            bounds = piece_bounds[key]
+            if min_val < bounds[0]:
+                bounds[0] = min_val
+            if max_val > bounds[1]:
+                bounds[1] = max_val
+
+        if self.stats is not None:
+            self.stats.entries_partitioned += end - start
+        if max(len(piece) for piece in pieces) == end - start:
+            if tracer is not None:
+                tracer.endSpan("partition", span_start)
+            return False
+        if self.stats is not None:
+            self.stats.pieces_cracked += 1
+
+        self.intervals[start:end] = [entry for piece in pieces for entry in piece]
+        if tracer is not None:
+            tracer.endSpan("partition", span_start)
+            span_start = tracer.startSpan()
+
+        node.start = node.end = None
+        node.is_leaf = False
+        piece_start = start
+        for piece, (min_val, max_val) in zip(pieces, piece_bounds):
+            if piece:
+                child = IntervalTreeNode(is_leaf=True, parent=node, level=node.level + 1)
+                child.start, child.end = piece_start, piece_start + len(piece)
+                node.entries.append(IntervalTreeEntry(Interval(min_val, max_val), child=child))
+                piece_start += len(piece)
+        if tracer is not None:
+            tracer.endSpan("build_children", span_start)
+        return True
+
+    def countMatches(self, leaf, offsets, query):
+        xmin, ymin, xmax, ymax = query
+        if len(offsets) == leaf.end - leaf.start > 0:
+            (outer_xmin, outer_ymin, outer_xmax, outer_ymax), (inner_xmin, inner_ymin, inner_xmax, inner_ymax) = \
+                self.pieceMBRBounds(leaf)
+            if inner_xmax > xmin and inner_xmin < xmax and inner_ymax > ymin and inner_ymin < ymax:
+                return len(offsets)
+            if not (outer_xmax > xmin and outer_xmin < xmax and outer_ymax > ymin and outer_ymin < ymax):
+                return 0
+
+        if self.stats is not None:
+            self.stats.candidates_refined += len(offsets)
+        if self.tracer is not None:
+            span_start = self.tracer.startSpan()
+        count = 0
+        for i in offsets:
+            mbr = self.intervals[i][1]
+            if mbr[2] > xmin and mbr[0] < xmax and mbr[3] > ymin and mbr[1] < ymax:
+                count += 1
+        if self.tracer is not None:
+            self.tracer.endSpan("refine", span_start)
+        return count
+
+    def pieceMBRBounds(self, leaf):
+        """
+           Returns the outer bounds of the MBRs of a leaf's piece (min xmin, min ymin, max xmax, max ymax) and
+           their inner bounds (max xmin, max ymin, min xmax, min ymax), computed once per leaf.
+        """
+        if leaf.mbr_bounds is None:
+            mbrs = [self.intervals[i][1] for i in range(leaf.start, leaf.end)]
+            outer = (min(mbr[0] for mbr in mbrs), min(mbr[1] for mbr in mbrs),
+                     max(mbr[2] for mbr in mbrs), max(mbr[3] for mbr in mbrs))
+            inner = (max(mbr[0] for mbr in mbrs), max(mbr[1] for mbr in mbrs),
+                     min(mbr[2] for mbr in mbrs), min(mbr[3] for mbr in mbrs))
+            leaf.mbr_bounds = (outer, inner)
+        return leaf.mbr_bounds
+
+    def recordScan(self, node):
+        """Counts a scan of a leaf that was not cracked, and sorts its piece once it has been hit often enough."""
+        node.hits += 1
+        size = node.end - node.start
+        if self.stats is not None:
+            self.stats.entries_scanned += size
+        if not self.hybrid_sort:
+            return
+        sort_after_hits = self.sort_after_hits or max(1, math.ceil(math.log2(size)))
+        if node.hits >= sort_after_hits:
+            self.sortPiece(node)
+
+    def sortPiece(self, node):
+        start, end = node.start, node.end
+        self.intervals[start:end] = sorted(self.intervals[start:end], key=lambda entry: entry[0].min_val)
+        piece = self.intervals[start:end]
+        node.min_sorted = [entry[0].min_val for entry in piece]
+        node.max_order = sorted(range(end - start), key=lambda i: piece[i][0].max_val)
+        node.max_sorted = [piece[i][0].max_val for i in node.max_order]
+
+    def searchSortedPiece(self, node, query_interval):
+        """
+           Finds the offsets of the intervals of a sorted leaf that overlap the query interval. Binary searches give
+           the prefix with min_val <= query max and the suffix (in max_val order) with max_val >= query min; the
+           smaller one is filtered on the other bound.
+        """
+        start, size = node.start, node.end - node.start
+        min_before_max = bisect_right(node.min_sorted, query_interval.max_val)
+        max_before_min = bisect_left(node.max_sorted, query_interval.min_val)
+
+        if min_before_max == size and max_before_min == 0:
+            return range(start, start + size)
+        if self.stats is not None:
+            self.stats.entries_scanned += min(min_before_max, size - max_before_min)
+        if min_before_max <= size - max_before_min:
+            return [start + i for i in range(min_before_max)
+                    if self.intervals[start + i][0].max_val >= query_interval.min_val]
+        return [start + i for i in node.max_order[max_before_min:] if node.min_sorted[i] <= query_interval.max_val]
+
+    def midpoint_at(self, i):
+        interval = self.intervals[i][0]
+        return (interval.min_val + interval.max_val) // 2
+
+    def calculate_bounding_interval(self, intervals, start, end):
+        min_val = min(intervals[i][0].min_val for i in range(start, end))
+        max_val = max(intervals[i][0].max_val for i in range(start, end))
         return Interval(min_val, max_val)
 
     def intervals_overlap(self, interval1, interval2):
         return not (interval1.max_val < interval2.min_val or interval1.min_val > interval2.max_val)
 
-    def crackOnAxisMin(self, intervals, low, high, crack_value, left_rect, right_rect, check_min):
-        return self.partition(intervals, low, high, crack_value, left_rect, right_rect, check_min)
-
-    def crackOnAxisMax(self, intervals, low, high, crack_value, left_rect, right_rect, check_min):
-        return self.partition(intervals, low, high, crack_value, left_rect, right_rect, check_min)
-
-    def partition(self, intervals, low, high, crack_value, left_rect, right_rect, check_min):
+    def crackInThree(self, intervals, low, high, query_interval):
         """
-           Partitions MBR z-intervals around a pivot value.
+           Partitions the piece [low, high) into [left | overlapped | right] around the query interval
+           in a single pass (three-way / Dutch national flag partition), tracking the bounding interval
+           of each of the three pieces on the way.
 
            :param low: Lower index of the range to partition
            :param high: Upper index of the range to partition
-           :param pivot: The pivot value to partition around
-           :param left_rect: Interval representing the left boundary
-           :param right_rect: Interval representing the right boundary
-           :param check_min: Boolean flag to check against the minimum value of intervals
-        """
-        x1, x2 = low, high - 1
-
-        if check_min:
-            while x1 <= x2:
-                if intervals[x1][0].min_val < crack_value:
-                    if intervals[x1][0].max_val > left_rect.max_val:
-                        left_rect.max_val = intervals[x1][0].max_val
-                    x1 += 1
-                else:
-                    while x2 >= x1 and intervals[x2][0].min_val >= crack_value:
-                        if intervals[x2][0].min_val < right_rect.min_val:
-                            right_rect.min_val = intervals[x2][0].min_val
-                        if intervals[x2][0].max_val > right_rect.max_val:
-                            right_rect.max_val = intervals[x2][0].max_val
-                        x2 -= 1
-
-                    if x1 < x2:
-                        intervals[x1], intervals[x2] = intervals[x2], intervals[x1]
-                        if intervals[x1][0].max_val > left_rect.max_val:
-                            left_rect.max_val = intervals[x1][0].max_val
-                        if intervals[x2][0].min_val < right_rect.min_val:
-                            right_rect.min_val = intervals[x2][0].min_val
-                        if intervals[x2][0].max_val > right_rect.max_val:
-                            right_rect.max_val = intervals[x2][0].max_val
-                        x2 -= 1
-                        x1 += 1
-        else:
-            while x1 <= x2:
-                if intervals[x1][0].max_val < crack_value:
-                    if intervals[x1][0].min_val < left_rect.min_val:
-                        left_rect.min_val = intervals[x1][0].min_val
-                    if intervals[x1][0].max_val > left_rect.max_val:
-                        left_rect.max_val = intervals[x1][0].max_val
-                    x1 += 1
-                else:
-                    while x2 >= x1 and intervals[x2][0].max_val >= crack_value:
-                        if intervals[x2][0].min_val < right_rect.min_val:
-                            right_rect.min_val = intervals[x2][0].min_val
-                        if intervals[x2][0].max_val > right_rect.max_val:
-                            right_rect.max_val = intervals[x2][0].max_val
-                        x2 -= 1
-
-                    if x1 < x2:
-                        intervals[x1], intervals[x2] = intervals[x2], intervals[x1]
-                        if intervals[x1][0].min_val < left_rect.min_val:
-                            left_rect.min_val = intervals[x1][0].min_val
-                        if intervals[x1][0].max_val > left_rect.max_val:
-                            left_rect.max_val = intervals[x1][0].max_val
-                        if intervals[x2][0].min_val < right_rect.min_val:
-                            right_rect.min_val = intervals[x2][0].min_val
-                        if intervals[x2][0].max_val > right_rect.max_val:
-                            right_rect.max_val = intervals[x2][0].max_val
-                        x2 -= 1
-                        x1 += 1
-        return x1
+           :param query_interval: The z-interval of the query to crack on
+           :return: (crack_index_min, crack_index_max, (left_bounds, right_bounds, overlapped_bounds)),
+                    where [crack_index_min, crack_index_max) is the overlapped piece
+        """
+        crack_min, crack_max = query_interval.min_val, query_interval.max_val
+        left_min = overlapped_min = right_min = math.inf
+        left_max = overlapped_max = right_max = -math.inf
+
+        # [low, x1) is left, [x1, x2) is overlapped, [x2, x3] is not partitioned yet and (x3, high) is right
+        x1, x2, x3 = low, low, high - 1
+        while x2 <= x3:
+            entry = intervals[x2]
+            min_val, max_val = entry[0].min_val, entry[0].max_val
+            if max_val < crack_min:
+                if min_val < left_min:
+                    left_min = min_val
+                if max_val > left_max:
+                    left_max = max_val
+                intervals[x2] = intervals[x1]
+                intervals[x1] = entry
+                x1 += 1
+                x2 += 1
+            elif min_val > crack_max:
+                if min_val < right_min:
+                    right_min = min_val
+                if max_val > right_max:
+                    right_max = max_val
+                intervals[x2] = intervals[x3]
+                intervals[x3] = entry
+                x3 -= 1
+            else:
+                if min_val < overlapped_min:
+                    overlapped_min = min_val
+                if max_val > overlapped_max:
+                    overlapped_max = max_val
+                x2 += 1
+
+        piece_bounds = (Interval(left_min, left_max), Interval(right_min, right_max),
+                        Interval(overlapped_min, overlapped_max))
+        return x1, x2, piece_bounds
 
 
     def print_tree(self, node=None, level=0):
@@ -231,10 +760,11 @@ class IntervalCracking:
         queue = deque([(node, level)])
         while queue:
             node, level = queue.popleft()
+            if node.is_leaf:
+                for i in range(node.start, node.end):
+                    result.append(' ' * 4 * level + f'Leaf {level + 1}: {self.intervals[i][0]}')
+                continue
             for entry in node.entries:
-                if entry.child:
-                    result.append(' ' * 4 * level + f'Node {level}: Interval = {entry.interval}')
-                    queue.append((entry.child, level + 1))
-                else:
-                    result.append(' ' * 4 * level + f'Leaf {level + 1}: {entry.interval}')
+                result.append(' ' * 4 * level + f'Node {level}: Interval = {entry.interval}')
+                queue.append((entry.child, level + 1))
         return result
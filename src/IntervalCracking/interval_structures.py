@@ -1,10 +1,19 @@
 
 
+# ----------------------------------------------------------------------- #
+#   The classes below use __slots__: a converged index holds one Interval per
+#   interval of the data and many small nodes, and a per-instance __dict__
+#   would cost several times the size of the fields themselves.
+# ----------------------------------------------------------------------- #
+
+
 # ----------------------------------------------------------------------- #
 #                            Interval (range [min, max])
 # ----------------------------------------------------------------------- #
 
 class Interval:
+    __slots__ = ('min_val', 'max_val')
+
     def __init__(self, min_val, max_val):
         self.min_val = min_val
         self.max_val = max_val
@@ -18,6 +27,8 @@ class Interval:
 # ----------------------------------------------------------------------- #
 
 class IntervalTreeEntry:
+    __slots__ = ('interval', 'data', 'child')
+
     def __init__(self, interval, data=None, child=None):
         self.interval = interval
         self.data = data
@@ -32,11 +43,21 @@ class IntervalTreeEntry:
 # ----------------------------------------------------------------------- #
 
 class IntervalTreeNode:
+    __slots__ = ('entries', 'is_leaf', 'parent', 'level', 'start', 'end', 'hits',
+                 'min_sorted', 'max_sorted', 'max_order', 'mbr_bounds')
+
     def __init__(self, is_leaf=True, parent=None, level=0):
         self.entries = []
         self.is_leaf = is_leaf
         self.parent = parent
         self.level = level
+        self.start = None    # [start, end) offsets of a leaf's piece in the cracker array
+        self.end = None
+        self.hits = 0        # scans of a leaf that did not crack it
+        self.min_sorted = None    # a sorted leaf keeps its piece ordered by min_val, with these min_val values,
+        self.max_sorted = None    # its max_val values in ascending order
+        self.max_order = None     # and the positions in the piece that sort it by max_val
+        self.mbr_bounds = None    # outer and inner bounds of the MBRs of a leaf's piece, used to count results
 
     def __repr__(self):
         return f'IntervalNode(Level={self.level}, IsLeaf={self.is_leaf}, Entries={len(self.entries)})'
@@ -47,5 +68,7 @@ class IntervalTreeNode:
 # ----------------------------------------------------------------------- #
 
 class IntervalTree:
+    __slots__ = ('root',)
+
     def __init__(self):
         self.root = IntervalTreeNode(is_leaf=True, level=0)
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+    Long-interval side store of an interval cracking index.
+
+    A crack keeps every interval crossing a query bound in the overlapped piece, so the very long z-intervals of large
+    polygons end up in (and keep being rescanned with) the overlapped piece of nearly every crack. They are kept out of
+    the cracker array instead, in a static structure partitioned by length class (as the levels of HINT):
+
+        1- Length Classes: an interval of length l belongs to class floor(log2(l + 1)), so all lengths of a class are
+                           within a factor of two of each other. Each class keeps its intervals sorted by min.
+        2- Overlap Query:  an interval of a class whose lengths are at most L overlaps [qmin, qmax] only if its min lies
+                           in [qmin - L, qmax]. Two binary searches per class give that range, and only its intervals
+                           are checked against qmin. The intervals of the range that miss the query are within a factor
+                           of two of the query bound, so a query costs O(log n) per class plus the size of its output.
+"""
+
+
+import numpy as np
+
+
+
+def selectLongIntervals(zmin, zmax, max_entries, long_interval_length="auto"):
+    """
+       Returns a boolean mask of the intervals to keep in a LongIntervalStore, or None if they all stay in the
+       cracker array (a single small piece, no long intervals, or only long ones).
+
+       :param long_interval_length: Intervals longer than this are long. "auto" uses the average z-range covered by a
+                                    piece of max_entries intervals, longer intervals cross the bounds of most cracks.
+                                    None disables the side store.
+    """
+    if long_interval_length is None or len(zmin) <= max_entries:
+        return None
+    if long_interval_length == "auto":
+        long_interval_length = (int(zmax.max()) - int(zmin.min())) * max_entries // len(zmin)
+
+    is_long = (zmax - zmin) > long_interval_length
+    if not 0 < np.count_nonzero(is_long) < len(zmin):
+        return None
+    return is_long
+
+
+# ----------------------------------------------------------------------- #
+#                          Long Interval Store Class
+# ----------------------------------------------------------------------- #
+
+class LongIntervalStore:
+    def __init__(self, zmin, zmax, ids):
+        """
+           :param zmin: The min values of the long intervals
+           :param zmax: The max values of the long intervals
+           :param ids: What a query returns for each interval (e.g. row ids into the data of the index)
+        """
+        zmin, zmax, ids = np.asarray(zmin, dtype=np.int64), np.asarray(zmax, dtype=np.int64), np.asarray(ids)
+        length_classes = np.floor(np.log2(zmax - zmin + 1)).astype(np.int64)
+
+        # One (max length, zmin, zmax, ids) class per length class, sorted by zmin
+        self.classes = []
+        for length_class in np.unique(length_classes):
+            members = np.flatnonzero(length_classes == length_class)
+            members = members[np.argsort(zmin[members], kind="stable")]
+            max_length = int((zmax[members] - zmin[members]).max())
+            self.classes.append((max_length, zmin[members], zmax[members], ids[members]))
+        self.size = len(ids)
+
+    def search(self, query_interval):
+        """
+           Returns the ids of the stored intervals that overlap the query interval.
+        """
+        results = []
+        for max_length, zmin, zmax, ids in self.classes:
+            first = int(np.searchsorted(zmin, query_interval.min_val - max_length, side="left"))
+            last = int(np.searchsorted(zmin, query_interval.max_val, side="right"))
+            if first < last:
+                results.append(ids[first:last][zmax[first:last] >= query_interval.min_val])
+        if not results:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(results)
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f'LongIntervalStore(Size={self.size}, LengthClasses={len(self.classes)})'
@@ -0,0 +1,337 @@
+"""
+    Saving and restoring a cracked index, so a restarted process resumes with the pieces, trees and sorted leaves the
+    queries have built instead of going through the first-touch cracks again.
+
+    1- File Format (versioned, pickle-free):
+
+        - A preamble: the MAGIC bytes, the FORMAT_VERSION of the writer (uint32) and the length of the header (uint64).
+        - A JSON header: the metadata of the saved object and, for every array, its dtype, shape and offset.
+        - The arrays, raw and C-ordered, every one starting at a multiple of ALIGNMENT bytes.
+
+       A file is written next to its path and renamed over it, so a crash during a save never leaves a torn file.
+       Readers refuse files of a newer FORMAT_VERSION. Arrays larger than memory are written in place instead:
+       createArrays lays out the file and returns its arrays memory-mapped, to be filled chunk by chunk.
+
+    2- Memory-Mapped Loading:
+
+        - readArrays maps the whole file copy-on-write: the arrays are views into the page cache, pages are read on
+          first touch, and the cracks of the restored index go to private copies of the pages they reorder, never
+          back into the file.
+
+    3- Cracking Indexes (saveIndex / loadIndex, indexArrays / indexFromArrays):
+
+        - The cracker columns (z-intervals and data in their physical, cracked order), the tree in BFS order (node
+          arrays and entry arrays pointing to their node and child) with the piece offsets, hits and sorted flag of
+          every leaf, the sort order of the sorted leaves, the long interval store and the settings of the index.
+        - The data of the index must be numeric MBRs (e.g. the rows of CrackingSPLindex.X), it is stored as one
+          (n, 4) array. A restored columnar index answers with rows of that array, mapped from the file on first touch.
+"""
+
+
+import json
+import os
+import struct
+from collections import deque
+
+import numpy as np
+
+from .interval_structures import Interval, IntervalTree, IntervalTreeEntry, IntervalTreeNode
+from .intervalCracking import IntervalCracking
+from .columnarIntervalCracking import ColumnarIntervalCracking
+from .crackingPolicy import CrackingPolicy
+from .longIntervals import LongIntervalStore
+from .queryStats import QueryStats
+from .tracing import Tracer
+
+
+MAGIC = b"CRACKIDX"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<8sIQ")    # magic, format version, header length
+ALIGNMENT = 64
+
+ENGINES = {"columnar": ColumnarIntervalCracking, "list": IntervalCracking}
+
+
+
+# ----------------------------------------------------------------------- #
+#                                File Format
+# ----------------------------------------------------------------------- #
+
+def alignedOffset(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def fileLayout(specs, metadata):
+    """
+       :param specs: {name: (dtype, shape)} of the arrays
+       :return: (header bytes, offset of the first array, {name: (dtype, shape, offset)}, file size)
+    """
+    layout, offset = {}, 0
+    for name, (dtype, shape) in specs.items():
+        dtype = np.dtype(dtype)
+        if dtype.hasobject:
+            raise ValueError(f"Array {name!r} holds Python objects, only numeric arrays can be saved")
+        layout[name] = {"dtype": dtype.str, "shape": list(shape), "offset": offset}
+        offset = alignedOffset(offset + dtype.itemsize * int(np.prod(shape)))
+
+    header = json.dumps({"metadata": metadata, "arrays": layout}).encode("utf-8")
+    data_start = alignedOffset(PREAMBLE.size + len(header))
+    return header, data_start, layout, data_start + offset
+
+
+def writeArrays(path, arrays, metadata=None):
+    """
+       Writes named arrays and JSON metadata to a single file.
+
+       :param arrays: {name: ndarray}, arrays of numeric or bool dtypes
+       :param metadata: JSON-serializable object stored in the header
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    header, data_start, layout, size = fileLayout({name: (array.dtype, array.shape) for name, array in arrays.items()},
+                                                  metadata)
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as index_file:
+        index_file.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        index_file.write(header)
+        for name, array in arrays.items():
+            index_file.seek(data_start + layout[name]["offset"])
+            index_file.write(array.data)
+        index_file.truncate(size)
+    os.replace(temporary_path, path)
+    return path
+
+
+def createArrays(path, specs, metadata=None):
+    """
+       Creates a file of zero-filled arrays in the format of writeArrays, for arrays too large to build in memory:
+       they are returned memory-mapped for writing, and are on disk once flushed.
+
+       :param specs: {name: (dtype, shape)} of the arrays
+       :return: {name: writable memory-mapped array}
+    """
+    header, data_start, layout, size = fileLayout(specs, metadata)
+    with open(path, "wb") as index_file:
+        index_file.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        index_file.write(header)
+        index_file.truncate(size)
+    return mapArrays(np.memmap(path, dtype=np.uint8, mode="r+"), data_start, layout)
+
+
+def readArrays(path, mmap=True):
+    """
+       Reads a file written by writeArrays.
+
+       :param mmap: Map the file copy-on-write instead of reading it, the arrays can still be written to
+       :return: (arrays, metadata)
+    """
+    with open(path, "rb") as index_file:
+        magic, version, header_length = PREAMBLE.unpack(index_file.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a saved index")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}, this reader supports up to {FORMAT_VERSION}")
+        header = json.loads(index_file.read(header_length).decode("utf-8"))
+
+    data_start = alignedOffset(PREAMBLE.size + header_length)
+    if mmap and os.path.getsize(path) > data_start:
+        buffer = np.memmap(path, dtype=np.uint8, mode="c").view(np.ndarray)
+    else:
+        buffer = np.fromfile(path, dtype=np.uint8)
+
+    return mapArrays(buffer, data_start, header["arrays"]), header["metadata"]
+
+
+def mapArrays(buffer, data_start, layout):
+    arrays = {}
+    for name, array_layout in layout.items():
+        dtype, shape = np.dtype(array_layout["dtype"]), tuple(array_layout["shape"])
+        start = data_start + array_layout["offset"]
+        arrays[name] = buffer[start:start + dtype.itemsize * int(np.prod(shape))].view(dtype).reshape(shape)
+    return arrays
+
+
+
+# ----------------------------------------------------------------------- #
+#                              Cracking Indexes
+# ----------------------------------------------------------------------- #
+
+def saveIndex(path, index):
+    """Saves an IntervalCracking or ColumnarIntervalCracking with its current cracks."""
+    arrays, metadata = indexArrays(index)
+    return writeArrays(path, arrays, metadata)
+
+
+def loadIndex(path, mmap=True, stats=None, tracer=None):
+    """Restores an index saved by saveIndex, stats and tracer as for the constructors of the indexes."""
+    arrays, metadata = readArrays(path, mmap)
+    return indexFromArrays(arrays, metadata, stats, tracer)
+
+
+def indexArrays(index):
+    """
+       Returns the state of a cracking index as (arrays, metadata) for writeArrays.
+    """
+    if isinstance(index, ColumnarIntervalCracking):
+        engine = "columnar"
+        zmin, zmax, data = index.zmin, index.zmax, np.asarray(index.data)
+        arrays = {"row_ids": index.row_ids}
+    elif isinstance(index, IntervalCracking):
+        engine = "list"
+        zmin = np.fromiter((interval.min_val for interval, _ in index.intervals), dtype=np.int64,
+                           count=len(index.intervals))
+        zmax = np.fromiter((interval.max_val for interval, _ in index.intervals), dtype=np.int64,
+                           count=len(index.intervals))
+        data = np.asarray([mbr for _, mbr in index.intervals])
+        arrays = {"long_entry_zmin": np.array([interval.min_val for interval, _ in index.long_intervals], dtype=np.int64),
+                  "long_entry_zmax": np.array([interval.max_val for interval, _ in index.long_intervals], dtype=np.int64),
+                  "long_entry_data": np.asarray([mbr for _, mbr in index.long_intervals]).reshape(-1, 4)}
+    else:
+        raise TypeError(f"Cannot save a {type(index).__name__}, expected IntervalCracking or ColumnarIntervalCracking")
+
+    arrays.update(zmin=zmin, zmax=zmax, data=data.reshape(-1, 4))
+    arrays.update(treeArrays(index.tree))
+
+    # The sort order of every sorted leaf, at the offsets of its piece
+    sorted_order = np.zeros(len(zmin), dtype=np.int64)
+    sorted_max = zmax.copy()
+    for node in leaves(index.tree):
+        if node.max_order is not None:
+            sorted_order[node.start:node.end] = node.max_order
+            sorted_max[node.start:node.end] = node.max_sorted
+    arrays.update(sorted_order=sorted_order, sorted_max=sorted_max)
+
+    if index.long_store is not None:
+        arrays.update(longStoreArrays(index.long_store))
+
+    policy = index.policy
+    metadata = {"engine": engine, "max_entries": index.max_entries, "min_entries": index.min_entries,
+                "FIRST_INIT": index.FIRST_INIT, "END_INIT": index.END_INIT,
+                "cracking_policy": {"name": policy.name, "piece_threshold": policy.piece_threshold,
+                                    "sample_size": policy.sample_size},
+                "hybrid_sort": index.hybrid_sort, "sort_after_hits": index.sort_after_hits,
+                "calibration": index.calibration}
+    return arrays, metadata
+
+
+def indexFromArrays(arrays, metadata, stats=None, tracer=None):
+    """
+       Restores a cracking index from the (arrays, metadata) of indexArrays, without cracking or sorting anything.
+    """
+    index_class = ENGINES[metadata["engine"]]
+    index = index_class.__new__(index_class)
+    index.calibration = metadata["calibration"]
+    index.max_entries = metadata["max_entries"]
+    index.min_entries = metadata["min_entries"]
+    index.FIRST_INIT = metadata["FIRST_INIT"]
+    index.END_INIT = metadata["END_INIT"]
+    index.policy = CrackingPolicy(**metadata["cracking_policy"])
+    index.hybrid_sort = metadata["hybrid_sort"]
+    index.sort_after_hits = metadata["sort_after_hits"]
+    index.stats = QueryStats() if stats is True else stats
+    index.tracer = Tracer() if tracer is True else tracer
+
+    zmin, zmax, data = arrays["zmin"], arrays["zmax"], arrays["data"]
+    if index_class is ColumnarIntervalCracking:
+        index.zmin, index.zmax, index.row_ids = zmin, zmax, arrays["row_ids"]
+        # The results are rows of the data array itself, indexed by refine: no per-row object and no copy at load
+        index.data = index.mbrs = data
+    else:
+        index.intervals = [(Interval(low, high), mbr) for low, high, mbr in zip(zmin.tolist(), zmax.tolist(), data)]
+        index.long_intervals = [(Interval(low, high), mbr) for low, high, mbr in
+                                zip(arrays["long_entry_zmin"].tolist(), arrays["long_entry_zmax"].tolist(),
+                                    arrays["long_entry_data"])]
+
+    index.tree, nodes = treeFromArrays(arrays)
+    sorted_order, sorted_max = arrays["sorted_order"], arrays["sorted_max"]
+    for node, is_sorted in zip(nodes, arrays["node_sorted"].tolist()):
+        if is_sorted:
+            start, end = node.start, node.end
+            node.min_sorted, node.max_order, node.max_sorted = zmin[start:end], sorted_order[start:end], sorted_max[start:end]
+            if index_class is IntervalCracking:
+                node.min_sorted, node.max_order, node.max_sorted = \
+                    node.min_sorted.tolist(), node.max_order.tolist(), node.max_sorted.tolist()
+
+    index.long_store = longStoreFromArrays(arrays) if "long_max_lengths" in arrays else None
+    return index
+
+
+
+# ----------------------------------------------------------------------- #
+#                            Trees and Side Stores
+# ----------------------------------------------------------------------- #
+
+def leaves(tree):
+    queue = deque([tree.root])
+    while queue:
+        node = queue.popleft()
+        if node.is_leaf:
+            yield node
+        else:
+            queue.extend(entry.child for entry in node.entries if entry.child)
+
+
+def treeArrays(tree):
+    """Flattens a tree in BFS order. Nodes and entries refer to other nodes by their BFS position, -1 for none."""
+    nodes, positions = [tree.root], {id(tree.root): 0}
+    entry_nodes, entry_children, entry_bounds = [], [], []
+    # nodes is the BFS queue, it grows while it is walked
+    for position, node in enumerate(nodes):
+        for entry in node.entries:
+            child = -1
+            if entry.child is not None:
+                child = positions[id(entry.child)] = len(nodes)
+                nodes.append(entry.child)
+            entry_nodes.append(position)
+            entry_children.append(child)
+            entry_bounds.append((entry.interval.min_val, entry.interval.max_val))
+
+    return {"node_leaf": np.array([node.is_leaf for node in nodes], dtype=np.bool_),
+            "node_level": np.array([node.level for node in nodes], dtype=np.int64),
+            "node_parent": np.array([-1 if node.parent is None else positions[id(node.parent)] for node in nodes],
+                                    dtype=np.int64),
+            "node_start": np.array([-1 if node.start is None else node.start for node in nodes], dtype=np.int64),
+            "node_end": np.array([-1 if node.end is None else node.end for node in nodes], dtype=np.int64),
+            "node_hits": np.array([node.hits for node in nodes], dtype=np.int64),
+            "node_sorted": np.array([node.max_order is not None for node in nodes], dtype=np.bool_),
+            "entry_node": np.array(entry_nodes, dtype=np.int64),
+            "entry_child": np.array(entry_children, dtype=np.int64),
+            "entry_bounds": np.array(entry_bounds, dtype=np.int64).reshape(-1, 2)}
+
+
+def treeFromArrays(arrays):
+    """Rebuilds a tree flattened by treeArrays, returns (tree, nodes in BFS order)."""
+    tree = IntervalTree()
+    nodes = []
+    for is_leaf, level, parent, start, end, hits in zip(
+            arrays["node_leaf"].tolist(), arrays["node_level"].tolist(), arrays["node_parent"].tolist(),
+            arrays["node_start"].tolist(), arrays["node_end"].tolist(), arrays["node_hits"].tolist()):
+        node = IntervalTreeNode(is_leaf=is_leaf, parent=None if parent < 0 else nodes[parent], level=level)
+        if start >= 0:
+            node.start, node.end = start, end
+        node.hits = hits
+        nodes.append(node)
+
+    for node, child, (min_val, max_val) in zip(arrays["entry_node"].tolist(), arrays["entry_child"].tolist(),
+                                               arrays["entry_bounds"].tolist()):
+        nodes[node].entries.append(IntervalTreeEntry(Interval(min_val, max_val), child=None if child < 0 else nodes[child]))
+    tree.root = nodes[0]
+    return tree, nodes
+
+
+def longStoreArrays(long_store):
+    """The length classes of a LongIntervalStore, concatenated in class order."""
+    max_lengths, zmin, zmax, ids = zip(*long_store.classes)
+    return {"long_max_lengths": np.array(max_lengths, dtype=np.int64),
+            "long_class_offsets": np.cumsum([0] + [len(class_ids) for class_ids in ids]).astype(np.int64),
+            "long_zmin": np.concatenate(zmin), "long_zmax": np.concatenate(zmax), "long_ids": np.concatenate(ids)}
+
+
+def longStoreFromArrays(arrays):
+    long_store = LongIntervalStore.__new__(LongIntervalStore)
+    offsets = arrays["long_class_offsets"].tolist()
+    long_store.classes = [(max_length, arrays["long_zmin"][start:end], arrays["long_zmax"][start:end],
+                           arrays["long_ids"][start:end])
+                          for max_length, start, end in zip(arrays["long_max_lengths"].tolist(), offsets, offsets[1:])]
+    long_store.size = offsets[-1]
+    return long_store
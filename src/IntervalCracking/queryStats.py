@@ -0,0 +1,168 @@
+"""
+    Per-query counters of an interval cracking index, to find out what a query costs and why some queries regress.
+
+    An index (or CrackingSPLindex, which shares one QueryStats with all its cluster indexes) counts into the current
+    query's counters while it answers a query, and appends them as one record when the query ends. Nested queries
+    (SPLindex -> cluster index, adaptiveSearchRanges -> adaptiveSearch) add up into the record of the outermost one.
+
+        - nodes_visited:       tree nodes reached by the query
+        - pieces_cracked:      pieces that were split
+        - entries_partitioned: entries of the pieces that were partitioned (split or not)
+        - entries_scanned:     entries of leaves read without cracking (small, unsplittable or sorted pieces)
+        - candidates_refined:  candidates checked against the query MBR
+        - results:             results returned (or counted)
+        - clusters_predicted:  clusters predicted by the learned model (CrackingSPLindex only)
+        - clusters_nonempty:   predicted clusters that returned results (CrackingSPLindex only)
+        - time:                wall clock of the query in seconds
+
+    Counting is a few integer additions per node or piece, and nothing at all when an index has no QueryStats.
+
+    Batches (adaptiveSearchBatch, queryAdaptiveSPLindexBatch) are recorded one row per query as well. Between
+    beginBatch and endBatch the counters are charged to the queries that did the work: chargeQuery(i) for the work of
+    one query (e.g. answering it in a leaf), chargeQueries(ids) for the work shared by several (e.g. a node they all
+    reach, or a piece cracked on all their boundaries), spread evenly over them. The time between two charges goes to
+    the same queries. A batch nested in another one (a cluster index answering the queries of CrackingSPLindex that
+    were predicted in its cluster) charges the queries of the outer batch that mapBatch maps its own to.
+"""
+
+
+import csv
+import time
+from collections import deque
+
+import numpy as np
+
+
+COUNTERS = ("nodes_visited", "pieces_cracked", "entries_partitioned", "entries_scanned", "candidates_refined",
+            "results", "clusters_predicted", "clusters_nonempty")
+
+
+
+# ----------------------------------------------------------------------- #
+#                             Query Stats Class
+# ----------------------------------------------------------------------- #
+
+class QueryStats:
+    __slots__ = COUNTERS + ("records", "depth", "start_time", "batch", "batch_ids", "charged", "charge_time")
+
+    def __init__(self, max_records=None):
+        """
+           :param max_records: Keep only the records of the last max_records queries (None keeps all)
+        """
+        self.records = deque(maxlen=max_records)
+        self.depth = 0
+        self.start_time = 0.0
+        self.batch = None       # (n_queries, counters + time) of the current batch
+        self.batch_ids = None   # Queries of the batch the queries of a nested batch are, None for the whole batch
+        self.charged = None     # Queries of the batch the counters are charged to
+        self.charge_time = 0.0
+        self.resetCounters()
+
+    def resetCounters(self):
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+
+    def beginQuery(self):
+        if self.depth == 0:
+            self.resetCounters()
+            self.start_time = time.perf_counter()
+        self.depth += 1
+
+    def endQuery(self, results=None):
+        """
+           Ends a query, and records it if it is the outermost one.
+
+           :param results: Number of results of the query, added to the results counter
+        """
+        if results is not None:
+            self.results += results
+        self.depth -= 1
+        if self.depth == 0:
+            self.records.append(tuple(getattr(self, counter) for counter in COUNTERS) +
+                                (time.perf_counter() - self.start_time,))
+
+    # ------------------------------ Batches ------------------------------- #
+
+    def beginBatch(self, n_queries):
+        """Begins a batch of n_queries, or charges the queries mapBatch gave to a batch nested in the current one."""
+        if self.depth == 0:
+            self.resetCounters()
+            self.start_time = self.charge_time = time.perf_counter()
+            self.batch = np.zeros((n_queries, len(COUNTERS) + 1))
+            self.batch_ids = None
+            self.charged = np.arange(n_queries)
+        else:
+            self.chargeQueries(None)
+        self.depth += 1
+
+    def chargeQuery(self, query_id):
+        """Charges the following work to one query of the batch."""
+        if self.batch is not None:
+            self.flushBatch()
+            self.charged = query_id if self.batch_ids is None else self.batch_ids[query_id]
+
+    def chargeQueries(self, query_ids):
+        """Charges the following work to several queries of the batch (None for all of them), evenly."""
+        if self.batch is not None:
+            self.flushBatch()
+            if self.batch_ids is None:
+                self.charged = np.arange(len(self.batch)) if query_ids is None else np.asarray(query_ids)
+            else:
+                self.charged = self.batch_ids if query_ids is None else self.batch_ids[query_ids]
+
+    def mapBatch(self, query_ids):
+        """Maps the queries of the next nested batch to these queries of the batch (None ends the mapping)."""
+        if self.batch is not None:
+            self.batch_ids = None
+            self.chargeQueries(query_ids)
+            self.batch_ids = None if query_ids is None else np.asarray(query_ids)
+
+    def flushBatch(self):
+        now = time.perf_counter()
+        values = np.array([getattr(self, counter) for counter in COUNTERS] + [now - self.charge_time])
+        if np.ndim(self.charged) == 0:
+            self.batch[self.charged] += values
+        elif len(self.charged):
+            np.add.at(self.batch, self.charged, values / len(self.charged))
+        self.resetCounters()
+        self.charge_time = now
+
+    def endBatch(self, results=None):
+        """
+           Ends a batch, and records one row per query if it is the outermost one.
+
+           :param results: Number of results of every query of the batch, added to their results counters
+        """
+        self.flushBatch()
+        if results is not None:
+            rows = np.arange(len(results)) if self.batch_ids is None else self.batch_ids
+            np.add.at(self.batch[:, COUNTERS.index("results")], rows, results)
+        self.depth -= 1
+        if self.depth == 0:
+            # Shared work is spread in fractions, the counters of a query are rounded
+            counters = np.rint(self.batch[:, :-1]).astype(np.int64).tolist()
+            self.records.extend(tuple(row) + (query_time,) for row, query_time in zip(counters, self.batch[:, -1]))
+            self.batch = self.batch_ids = self.charged = None
+
+    def clear(self):
+        self.records.clear()
+        self.depth = 0
+        self.batch = self.batch_ids = self.charged = None
+        self.resetCounters()
+
+    def toNumpy(self):
+        """Returns the records as a structured array with one row per query."""
+        dtype = [(counter, np.int64) for counter in COUNTERS] + [("time", np.float64)]
+        return np.array(list(self.records), dtype=dtype)
+
+    def toCSV(self, path):
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(COUNTERS + ("time",))
+            writer.writerows(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __repr__(self):
+        return f'QueryStats(Queries={len(self.records)})'
@@ -0,0 +1,130 @@
+"""
+    Timing spans around the phases of a query, to find out which phase makes up the tail of a workload.
+
+    An index (or CrackingSPLindex, which shares one Tracer with all its cluster indexes) opens a span with startSpan()
+    and closes it with endSpan(name, start) around each phase:
+
+        - query:            a whole query of CrackingSPLindex, the other spans of the query nest in it
+        - cache_lookup:     lookup of the query in the result cache of CrackingSPLindex
+        - encode_query:     the space-filling curve keys (Z-ranges) of the query rectangle
+        - predict_clusters: predClusterIdsRangeQuery on the learned model
+        - build_index:      first-touch construction of the cracking index of a cluster
+        - partition:        partitioning the piece of a leaf (split or not)
+        - build_children:   building the child nodes of a split piece
+        - refine:           checking the candidates against the query MBR
+
+    Spans are kept two ways:
+
+        1- Trace:      the last max_events spans, exported with toChromeTrace(path) as Chrome trace / Perfetto JSON
+                       (chrome://tracing or ui.perfetto.dev).
+        2- Histograms: every span is also counted in a log-linear histogram of its phase (four buckets per power of
+                       two), so a replay of 100k queries is aggregated in constant memory (histograms(), summary()).
+"""
+
+
+import json
+import math
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+
+# Every power of two of seconds from 2^-31 (< 1ns) to 2^6 (64s) is split into SUB_BUCKETS buckets of equal width,
+# the first and last buckets also count the shorter and longer spans
+MIN_EXPONENT = -30
+SUB_BUCKETS = 4
+HISTOGRAM_BUCKETS = 37 * SUB_BUCKETS
+
+
+
+# ----------------------------------------------------------------------- #
+#                               Tracer Class
+# ----------------------------------------------------------------------- #
+
+class Tracer:
+    __slots__ = ("events", "counts", "totals", "maxima", "origin", "pid")
+
+    def __init__(self, max_events=None):
+        """
+           :param max_events: Keep only the last max_events spans for the trace (None keeps all), the histograms
+                              always count every span
+        """
+        self.events = deque(maxlen=max_events)
+        self.counts = {}     # phase -> list of HISTOGRAM_BUCKETS counts
+        self.totals = {}     # phase -> total seconds
+        self.maxima = {}     # phase -> longest span in seconds
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def startSpan(self):
+        return time.perf_counter()
+
+    def endSpan(self, name, start):
+        """Closes the span of phase name opened at start (a value returned by startSpan)."""
+        duration = time.perf_counter() - start
+        self.events.append((name, start, duration))
+
+        counts = self.counts.get(name)
+        if counts is None:
+            counts = self.counts[name] = [0] * HISTOGRAM_BUCKETS
+            self.totals[name] = self.maxima[name] = 0.0
+        # duration = mantissa * 2^exponent with mantissa in [0.5, 1)
+        mantissa, exponent = math.frexp(duration)
+        bucket = (exponent - MIN_EXPONENT) * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS) if duration > 0 else 0
+        counts[min(max(bucket, 0), HISTOGRAM_BUCKETS - 1)] += 1
+        self.totals[name] += duration
+        if duration > self.maxima[name]:
+            self.maxima[name] = duration
+
+    def clear(self):
+        self.events.clear()
+        self.counts.clear()
+        self.totals.clear()
+        self.maxima.clear()
+        self.origin = time.perf_counter()
+
+    def toChromeTrace(self, path):
+        """Writes the spans as complete ("X") events of the Chrome trace format, with timestamps in microseconds."""
+        trace_events = [{"name": name, "cat": "query" if name == "query" else "phase", "ph": "X",
+                         "ts": (start - self.origin) * 1e6, "dur": duration * 1e6, "pid": self.pid, "tid": 0}
+                        for name, start, duration in self.events]
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, trace_file)
+
+    def histograms(self):
+        """
+           Returns the duration histogram of every phase.
+
+           :return: (bucket_bounds, {phase: counts}), where counts[b] spans lasted between bucket_bounds[b] and
+                    bucket_bounds[b + 1] seconds
+        """
+        buckets = np.arange(HISTOGRAM_BUCKETS + 1)
+        bucket_bounds = np.ldexp(1.0 + (buckets % SUB_BUCKETS) / SUB_BUCKETS,
+                                 buckets // SUB_BUCKETS + MIN_EXPONENT - 1)
+        return bucket_bounds, {name: np.array(counts, dtype=np.int64) for name, counts in self.counts.items()}
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)):
+        """
+           Returns {phase: {"count", "total", "mean", "max", "p50", ...}} in seconds. Percentiles are the upper
+           bound of their histogram bucket, so they are over-estimated by at most 25%.
+        """
+        bucket_bounds, histograms = self.histograms()
+        summary = {}
+        for name, counts in histograms.items():
+            count = int(counts.sum())
+            phase = {"count": count, "total": self.totals[name], "mean": self.totals[name] / count,
+                     "max": self.maxima[name]}
+            cumulative = np.cumsum(counts)
+            for percentile in percentiles:
+                bucket = int(np.searchsorted(cumulative, math.ceil(count * percentile / 100)))
+                phase[f"p{percentile:g}"] = min(float(bucket_bounds[bucket + 1]), self.maxima[name])
+            summary[name] = phase
+        return summary
+
+    def __len__(self):
+        return len(self.events)
+
+    def __repr__(self):
+        return f'Tracer(Spans={len(self.events)}, Phases={len(self.counts)})'
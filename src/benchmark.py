@@ -0,0 +1,279 @@
+"""
+    One benchmark entry point for all the indexes of this repository, replaying a range query workload on a polygon
+    dataset and reporting, per engine:
+
+        1- Latency:      p50 / p95 / p99 / max per-query latency, mean and total time.
+        2- Convergence:  the cumulative time curve (at 1, 10, 100, ... queries), and the time to convergence: the first
+                         query from which the rolling median of the latency (over --window queries) stays within
+                         --tolerance of its final value.
+        3- Memory:       the peak of Python (and NumPy) allocations while building the index and answering the queries,
+                         measured with tracemalloc in a second, untimed replay (--memory), and the peak RSS of the run.
+
+    Engines: scan (NumPy scan of the MBRs), cracking (IntervalCracking), columnar (ColumnarIntervalCracking),
+    improved (improvedIntervalCracking), revised (generalCrackingIndex/revisedIntervalCracking, z-interval candidates
+    only, it does not check the MBRs) and splindex (CrackingSPLindex). Datasets are the four workloads of Workloads/
+    with their polygons from ConfigParam, or any polygons / queries .npy given with --polygons and --query-file,
+    such as the MBR datasets and query workloads of syntheticData.py.
+
+    Data loading, Z-address encoding of the data, result checks and all I/O happen outside of the measured region:
+    a run times the index build once and every query on its own, and only stores the latencies and result counts.
+
+    Example:
+        python benchmark.py --dataset water --engines scan columnar splindex --queries 10000 --output results/
+"""
+
+
+import argparse
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+sys.path.append(os.path.join(current_dir, 'CrackingSPLindex'))
+sys.path.append(os.path.join(current_dir, 'IntervalCracking'))
+sys.path.append(os.path.join(current_dir, 'generalCrackingIndex'))
+
+from IntervalCracking.interval_structures import Interval
+from IntervalCracking.intervalCracking import IntervalCracking
+from IntervalCracking.columnarIntervalCracking import ColumnarIntervalCracking
+
+from ConfigParam import Config
+from spaceFillingCurve import getCurveEncoder
+from datasetStore import loadDatasetMBRs
+
+
+workloads_dir = os.path.join(os.path.dirname(current_dir), 'Workloads')
+# Query workload -> Config attribute of the polygons it was generated for
+workloads = {"water": "water_polygon_name", "lakes": "lakes_polygon_name", "roads": "roads_polygon_name",
+             "poly5M": "uniform_polygon_name"}
+checkpoints = [10 ** i for i in range(6)]
+
+
+
+# ----------------------------------------------------------------------- #
+#                                 Engines
+# ----------------------------------------------------------------------- #
+# Every engine builds its index on (polygons, mbrs, mbr_z_intervals) and returns a function answering one query
+# rectangle (xmin, ymin, xmax, ymax) with the number of its results. Queries are encoded inside that function, as
+# the encoding is part of the cost of a query.
+
+def buildScan(polygons, mbrs, mbr_z_intervals, encoder):
+    def query(query_rect):
+        xmin, ymin, xmax, ymax = query_rect
+        return int(np.count_nonzero((mbrs[:, 2] > xmin) & (mbrs[:, 0] < xmax) &
+                                    (mbrs[:, 3] > ymin) & (mbrs[:, 1] < ymax)))
+    return query
+
+
+def buildCracking(polygons, mbrs, mbr_z_intervals, encoder, index_class=IntervalCracking):
+    index = index_class(mbr_z_intervals, max_entries=Config().cracking_max_entries,
+                        cracking_policy=Config().cracking_policy)
+
+    def query(query_rect):
+        return len(index.adaptiveSearch(Interval(*encoder.mbr_z_interval(query_rect)), query_rect))
+    return query
+
+
+def buildColumnar(polygons, mbrs, mbr_z_intervals, encoder):
+    return buildCracking(polygons, mbrs, mbr_z_intervals, encoder, index_class=ColumnarIntervalCracking)
+
+
+def buildImproved(polygons, mbrs, mbr_z_intervals, encoder):
+    from improvedIntervalCracking import IntervalCracking as ImprovedIntervalCracking
+    index = ImprovedIntervalCracking(mbr_z_intervals)
+
+    def query(query_rect):
+        return len(index.adaptiveSearch(Interval(*encoder.mbr_z_interval(query_rect)), query_rect))
+    return query
+
+
+def buildRevised(polygons, mbrs, mbr_z_intervals, encoder):
+    from revisedIntervalCracking import IntervalCracking as RevisedIntervalCracking
+    index = RevisedIntervalCracking(mbr_z_intervals)
+
+    def query(query_rect):
+        return len(index.adaptiveSearch(Interval(*encoder.mbr_z_interval(query_rect))))
+    return query
+
+
+def buildSPLindex(polygons, mbrs, mbr_z_intervals, encoder):
+    from crackingSPLindex import CrackingSPLindex
+    from treeModel import TreeBuilder
+
+    # CrackingSPLindex is a singleton sharing its cluster indexes, start from a new one
+    CrackingSPLindex._instance = None
+    CrackingSPLindex.cluster_indices = {}
+    spli = CrackingSPLindex(polygons)
+    z_ranges_sorted, sorted_clusters_IDs, sorted_clusters = spli.sortClustersZaddress(spli.clusters)
+    all_mbr_z_intervals = spli.getZAddressesForMBRsInCluster(sorted_clusters)
+    tree_model = TreeBuilder(global_percentage=0.05, capacity_node=100).buildTreeModel(z_ranges_sorted,
+                                                                                        sorted_clusters_IDs)
+
+    def query(query_rect):
+        return len(spli.queryAdaptiveSPLindex(all_mbr_z_intervals, tree_model, query_rect))
+    return query
+
+
+engines = {"scan": buildScan, "cracking": buildCracking, "columnar": buildColumnar, "improved": buildImproved,
+           "revised": buildRevised, "splindex": buildSPLindex}
+
+
+
+# ----------------------------------------------------------------------- #
+#                             Data and Replay
+# ----------------------------------------------------------------------- #
+
+def loadDataset(dataset, polygons_path=None, queries_path=None, data_dir="./"):
+    """Loads the polygons and the query rectangles of a workload of Workloads/ (or of the given .npy files)."""
+    if polygons_path is None:
+        polygons_path = os.path.join(data_dir, getattr(Config(), workloads[dataset]))
+    if queries_path is None:
+        queries_path = os.path.join(workloads_dir, f"query_ranges_{dataset}_100k.npy")
+    query_ranges = np.load(queries_path, allow_pickle=True)
+    # The MBRs stand in for the polygons, memory-mapped from their ingested file (see datasetStore.py)
+    mbrs = loadDatasetMBRs(polygons_path)
+    return mbrs, mbrs, np.asarray(query_ranges, dtype=np.float64)
+
+
+def mbrZIntervals(mbrs, encoder):
+    zmin, zmax = encoder.mbr_z_intervals(mbrs)
+    return [[(z_low, z_high), mbr] for z_low, z_high, mbr in zip(zmin.tolist(), zmax.tolist(), mbrs)]
+
+
+def replay(build_engine, polygons, mbrs, mbr_z_intervals, encoder, query_ranges):
+    """
+       Builds an index and answers the queries one by one, only the latencies and result counts are kept.
+
+       :return: (build_time, query_times, result_counts)
+    """
+    query_times = np.empty(len(query_ranges))
+    result_counts = np.empty(len(query_ranges), dtype=np.int64)
+
+    start_time = time.perf_counter()
+    query = build_engine(polygons, mbrs, mbr_z_intervals, encoder)
+    build_time = time.perf_counter() - start_time
+
+    for i, query_rect in enumerate(query_ranges):
+        start_time = time.perf_counter()
+        result_counts[i] = query(query_rect)
+        query_times[i] = time.perf_counter() - start_time
+    return build_time, query_times, result_counts
+
+
+def peakMemory(build_engine, polygons, mbrs, mbr_z_intervals, encoder, query_ranges):
+    """Replays the workload on a new index under tracemalloc, and returns the peak of its allocations in bytes."""
+    tracemalloc.start()
+    query = build_engine(polygons, mbrs, mbr_z_intervals, encoder)
+    for query_rect in query_ranges:
+        query(query_rect)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+
+# ----------------------------------------------------------------------- #
+#                                 Metrics
+# ----------------------------------------------------------------------- #
+
+def convergenceQuery(query_times, window=100, tolerance=0.5):
+    """
+       Returns the number of queries after which the index has converged: from then on, the rolling median of the
+       latency over window queries stays within tolerance of the median of the last window queries. Single query
+       latencies are mostly timer noise and outliers (e.g. garbage collections), which the median smooths out.
+    """
+    window = max(1, min(window, len(query_times) // 10))
+    windows = np.lib.stride_tricks.sliding_window_view(query_times, window)
+    # In chunks, np.median copies the windows
+    rolling_median = np.concatenate([np.median(windows[start:start + 2 ** 16], axis=1)
+                                     for start in range(0, len(windows), 2 ** 16)])
+    threshold = rolling_median[-1] * (1 + tolerance)
+    # The rolling median never exceeds the threshold again from the first window where its suffix maximum is below it
+    suffix_max = np.maximum.accumulate(rolling_median[::-1])[::-1]
+    return int(np.argmax(suffix_max <= threshold))
+
+
+def latencyReport(build_time, query_times, window=100, tolerance=0.5):
+    cumulative_time = np.cumsum(query_times)
+    converged = convergenceQuery(query_times, window, tolerance)
+    p50, p95, p99 = np.percentile(query_times, [50, 95, 99])
+    return {"build_time": build_time, "total_time": cumulative_time[-1], "mean": query_times.mean(),
+            "p50": p50, "p95": p95, "p99": p99, "max": query_times.max(), "converged_query": converged,
+            "converged_time": build_time + (cumulative_time[converged - 1] if converged else 0.0),
+            "cumulative_time": {n: build_time + cumulative_time[n - 1] for n in checkpoints if n <= len(query_times)}}
+
+
+def printReport(dataset, engine, report, peak_memory=None):
+    print(f"{dataset:>7} {engine:>9}: build = {report['build_time']:.3f} s, queries = {report['total_time']:.3f} s, "
+          f"mean = {report['mean'] * 1e3:.3f} ms, p50 = {report['p50'] * 1e3:.3f} ms, "
+          f"p95 = {report['p95'] * 1e3:.3f} ms, p99 = {report['p99'] * 1e3:.3f} ms, max = {report['max'] * 1e3:.3f} ms")
+    print(f"{'':>18} converged after {report['converged_query']} queries ({report['converged_time']:.3f} s), "
+          f"cumulative time: " + ", ".join(f"{n} = {t:.3f} s" for n, t in report['cumulative_time'].items()))
+    if peak_memory is not None:
+        print(f"{'':>18} peak memory = {peak_memory / 2 ** 20:.1f} MiB")
+
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Replays range query workloads on the indexes of this repository.")
+    parser.add_argument("--dataset", choices=list(workloads), nargs="+", default=["water"],
+                        help="Workloads of Workloads/ to replay (with the polygons of ConfigParam)")
+    parser.add_argument("--polygons", help="Polygons .npy to use instead of the one of the dataset")
+    parser.add_argument("--query-file", help="Query rectangles .npy to use instead of the one of the dataset")
+    parser.add_argument("--data-dir", default="./", help="Directory the ConfigParam polygon paths are relative to")
+    parser.add_argument("--engines", choices=list(engines), nargs="+", default=["scan", "columnar", "splindex"])
+    parser.add_argument("--queries", type=int, default=None, help="Replay only the first queries of the workload")
+    parser.add_argument("--window", type=int, default=100, help="Rolling median window for the convergence")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Convergence tolerance on the final latency")
+    parser.add_argument("--memory", action="store_true", help="Measure the peak memory in a second replay")
+    parser.add_argument("--output", help="Directory to save the latencies of every run to (<dataset>_<engine>.npz)")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArguments()
+    encoder = getCurveEncoder(Config().space_filling_curve, Config().morton_scale_factor, Config().morton_bits)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    for dataset in args.dataset:
+        polygons, mbrs, query_ranges = loadDataset(dataset, args.polygons, args.query_file, args.data_dir)
+        query_ranges = query_ranges[:args.queries]
+        mbr_z_intervals = mbrZIntervals(mbrs, encoder)
+        if args.polygons:
+            dataset = os.path.splitext(os.path.basename(args.polygons))[0]
+
+        reference_engine = reference_counts = None
+        for engine in args.engines:
+            build_time, query_times, result_counts = replay(engines[engine], polygons, mbrs, mbr_z_intervals,
+                                                            encoder, query_ranges)
+            peak_memory = None
+            if args.memory:
+                peak_memory = peakMemory(engines[engine], polygons, mbrs, mbr_z_intervals, encoder, query_ranges)
+
+            report = latencyReport(build_time, query_times, args.window, args.tolerance)
+            printReport(dataset, engine, report, peak_memory)
+            # revised returns the z-interval candidates, not the results
+            if engine != "revised":
+                if reference_counts is None:
+                    reference_engine, reference_counts = engine, result_counts
+                elif not np.array_equal(result_counts, reference_counts):
+                    mismatches = np.count_nonzero(result_counts != reference_counts)
+                    print(f"{'':>18} WARNING: {mismatches} queries differ from {reference_engine} in their results")
+
+            if args.output:
+                np.savez(os.path.join(args.output, f"{dataset}_{engine}.npz"), build_time=build_time,
+                         query_times=query_times, cumulative_time=build_time + np.cumsum(query_times),
+                         result_counts=result_counts)
+
+    # ru_maxrss is in KiB on Linux
+    print(f"Peak RSS of the run = {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
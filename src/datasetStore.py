@@ -0,0 +1,182 @@
+"""
+    Pickle-free, memory-mapped storage of polygon datasets, so the indexes start from MBR columns instead of
+    unpickling millions of shapely objects and asking each one for its bounds.
+
+    1- Ingestion (once per dataset): a pickled .npy of shapely polygons (as in ConfigParam) is converted chunk by chunk
+       into files next to it, with the same name and these suffixes:
+
+        - .mbrs.npy:        (n, 4) float64 MBRs (xmin, ymin, xmax, ymax) in column-major order, so that every
+                            coordinate is one contiguous column of the file.
+        - .wkb.npy:         the polygons as WKB, one uint8 blob (optional).
+        - .wkb_offsets.npy: (n + 1) int64 offsets of every polygon in the blob.
+
+    2- Loading: loadDatasetMBRs memory-maps the MBR file (converting the polygons first if it does not exist yet).
+       The MBR array stands in for the polygons in CrackingSPLindex, pureIntervalCracking/main.py and benchmark.py.
+       WKBGeometries decodes single polygons (or slices of them) from the memory-mapped blob when they are needed.
+
+    Example:
+        python datasetStore.py data/water_poly.npy data/lakes.npy
+"""
+
+
+import argparse
+import contextlib
+import os
+
+import numpy as np
+
+
+MBR_SUFFIX = ".mbrs.npy"
+WKB_SUFFIX = ".wkb.npy"
+WKB_OFFSETS_SUFFIX = ".wkb_offsets.npy"
+BLOB_HEADER_SIZE = 128    # .npy header of the WKB blob, written before the blob and rewritten once its size is known
+
+
+
+# ----------------------------------------------------------------------- #
+#                                Ingestion
+# ----------------------------------------------------------------------- #
+
+def storePaths(polygons_path):
+    """Paths of the MBR, WKB and WKB offsets files of a polygons .npy."""
+    prefix = polygons_path[:-len(".npy")] if polygons_path.endswith(".npy") else polygons_path
+    return prefix + MBR_SUFFIX, prefix + WKB_SUFFIX, prefix + WKB_OFFSETS_SUFFIX
+
+
+def polygonMBRs(polygons):
+    """(n, 4) float64 MBRs of an object array of shapely geometries, or of an (n, 4) array of MBRs."""
+    if isinstance(polygons, np.ndarray) and polygons.dtype != object:
+        return polygons.reshape(-1, 4).astype(np.float64, copy=False)
+    import shapely
+    return shapely.bounds(np.asarray(polygons, dtype=object)).reshape(-1, 4)
+
+
+def writeBlobHeader(blob_file, size):
+    """
+       Writes the .npy header of a uint8 blob of `size` bytes. It takes BLOB_HEADER_SIZE bytes for any size, so the
+       header of an empty blob reserves the room of the final one.
+    """
+    header_start = blob_file.tell()
+    np.lib.format.write_array_header_1_0(blob_file, {"descr": "|u1", "fortran_order": False, "shape": (size,)})
+    if blob_file.tell() - header_start != BLOB_HEADER_SIZE:
+        raise ValueError(f"Unexpected .npy header size for a blob of {size} bytes")
+
+
+def ingestPolygons(polygons_path, wkb=True, chunk_size=1_000_000):
+    """
+       Converts a pickled .npy of shapely polygons into the MBR (and WKB) files of storePaths.
+
+       :param wkb: Also write the polygons as WKB, for the code that needs the geometries and not only their MBRs
+       :return: The path of the MBR file
+    """
+    import shapely
+    mbr_path, wkb_path, wkb_offsets_path = storePaths(polygons_path)
+    polygons = np.load(polygons_path, allow_pickle=True)
+
+    mbrs = np.lib.format.open_memmap(mbr_path + ".tmp", mode="w+", dtype=np.float64, shape=(len(polygons), 4),
+                                     fortran_order=True)
+    lengths = np.zeros(len(polygons), dtype=np.int64)
+    with open(wkb_path + ".tmp", "wb") if wkb else contextlib.nullcontext() as blob_file:
+        if wkb:
+            # The size of the blob is only known at the end, its header is written again then
+            writeBlobHeader(blob_file, 0)
+        for start in range(0, len(polygons), chunk_size):
+            chunk = polygons[start:start + chunk_size]
+            mbrs[start:start + len(chunk)] = shapely.bounds(chunk)
+            if wkb:
+                # Every chunk is appended to the blob once encoded, only the lengths of its polygons are kept
+                chunk_wkb = shapely.to_wkb(chunk)
+                lengths[start:start + len(chunk)] = [len(geometry) for geometry in chunk_wkb]
+                blob_file.writelines(chunk_wkb)
+        if wkb:
+            blob_file.seek(0)
+            writeBlobHeader(blob_file, int(lengths.sum()))
+    mbrs.flush()
+    del mbrs
+
+    if wkb:
+        offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        np.save(wkb_offsets_path, offsets, allow_pickle=False)
+        os.replace(wkb_path + ".tmp", wkb_path)
+
+    # The MBR file is renamed last, its presence means the dataset is fully converted
+    os.replace(mbr_path + ".tmp", mbr_path)
+    return mbr_path
+
+
+
+# ----------------------------------------------------------------------- #
+#                                 Loading
+# ----------------------------------------------------------------------- #
+
+def loadDatasetMBRs(polygons_path, convert=True, mmap=True):
+    """
+       Returns the (n, 4) MBRs of a dataset, memory-mapped from its MBR file.
+
+       :param polygons_path: The polygons .npy of the dataset, its MBR file, or an (n, 4) MBR .npy (e.g. from
+                             syntheticData.py), which is loaded as it is
+       :param convert: Ingest the polygons if their MBR file does not exist yet, otherwise compute their MBRs in memory
+    """
+    mmap_mode = "r" if mmap else None
+    mbr_path = polygons_path if polygons_path.endswith(MBR_SUFFIX) else storePaths(polygons_path)[0]
+    if os.path.exists(mbr_path):
+        return np.load(mbr_path, mmap_mode=mmap_mode, allow_pickle=False)
+
+    try:
+        # Pickle-free .npy files hold MBRs already
+        return np.load(polygons_path, mmap_mode=mmap_mode, allow_pickle=False).reshape(-1, 4)
+    except ValueError:
+        pass
+    if convert:
+        return np.load(ingestPolygons(polygons_path), mmap_mode=mmap_mode, allow_pickle=False)
+    return polygonMBRs(np.load(polygons_path, allow_pickle=True))
+
+
+class WKBGeometries:
+    """
+       The polygons of an ingested dataset, decoded from the memory-mapped WKB blob on access:
+       geometries[i] is a shapely geometry, geometries[start:end] an object array of them.
+    """
+    def __init__(self, polygons_path):
+        _, wkb_path, wkb_offsets_path = storePaths(polygons_path)
+        self.blob = np.load(wkb_path, mmap_mode="r", allow_pickle=False)
+        self.offsets = np.load(wkb_offsets_path, mmap_mode="r", allow_pickle=False)
+
+    def __getitem__(self, index):
+        import shapely
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return shapely.from_wkb([self.wkb(i) for i in range(start, stop, step)])
+        return shapely.from_wkb(self.wkb(index))
+
+    def wkb(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.blob[start:end].tobytes()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __repr__(self):
+        return f'WKBGeometries(Size={len(self)}, Bytes={len(self.blob)})'
+
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Converts pickled polygon datasets into memory-mappable MBR and "
+                                                 "WKB files.")
+    parser.add_argument("polygons", nargs="+", help="Pickled .npy files of shapely polygons")
+    parser.add_argument("--no-wkb", action="store_true", help="Only write the MBRs")
+    parser.add_argument("--chunk-size", type=int, default=1_000_000, help="Polygons converted at a time")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArguments()
+    for polygons_path in args.polygons:
+        mbr_path = ingestPolygons(polygons_path, wkb=not args.no_wkb, chunk_size=args.chunk_size)
+        print(f"{polygons_path}: {len(np.load(mbr_path, mmap_mode='r'))} MBRs written to {mbr_path}")
+
+
+if __name__ == "__main__":
+    main()
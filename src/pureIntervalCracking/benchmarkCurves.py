@@ -0,0 +1,47 @@
+"""
+    Compares Morton (Z-order) and Hilbert keys on the range query workloads in Workloads/: candidates per query
+    (intervals overlapping the key interval of a query), results and latency of a ColumnarIntervalCracking index.
+"""
+
+
+import os
+import sys
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+cracking_splindex_dir = os.path.join(parent_dir, 'CrackingSPLindex')
+sys.path.append(cracking_splindex_dir)
+
+from ConfigParam import Config
+from spaceFillingCurve import getCurveEncoder
+from datasetStore import loadDatasetMBRs
+from benchmarkPolicies import workloads, workloads_dir
+from benchmarkResolution import runResolution
+
+
+curves = ["morton", "hilbert"]
+
+
+def main(num_queries=10000):
+    data_dir = "./"
+    for workload, polygon_name in workloads.items():
+        polygons_path = os.path.join(data_dir, getattr(Config(), polygon_name))
+        if not os.path.exists(polygons_path):
+            print(f"Skipping {workload}: {polygons_path} not found")
+            continue
+        mbrs = loadDatasetMBRs(polygons_path)
+        query_ranges = np.load(os.path.join(workloads_dir, f"query_ranges_{workload}_100k.npy"),
+                               allow_pickle=True)[:num_queries]
+
+        for curve in curves:
+            encoder = getCurveEncoder(curve, Config().morton_scale_factor, Config().morton_bits)
+            candidates, results, query_times = runResolution(mbrs, query_ranges, encoder)
+            print(f"{workload:>7} {curve:>8}: candidates/query = {candidates.mean():.1f}, "
+                  f"results/query = {results / len(query_ranges):.1f}, "
+                  f"total = {query_times.sum():.3f} s, last 1K = {query_times[-1000:].sum():.3f} s")
+
+
+if __name__ == "__main__":
+    main()
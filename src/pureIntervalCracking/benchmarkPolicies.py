@@ -0,0 +1,75 @@
+"""
+    Compares the cracking policies of crackingPolicy.py on the range query workloads in Workloads/,
+    both in their original (random) order and replayed as a sequential sweep sorted by the Z-address of the queries.
+"""
+
+
+import os
+import sys
+import time
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+cracking_splindex_dir = os.path.join(parent_dir, 'CrackingSPLindex')
+sys.path.append(cracking_splindex_dir)
+
+from IntervalCracking.interval_structures import Interval
+from IntervalCracking.columnarIntervalCracking import ColumnarIntervalCracking
+from IntervalCracking.crackingPolicy import CRACKING_POLICIES
+
+from ConfigParam import Config
+from main import getConfiguredEncoder, getZAddressesForMBRsInCluster
+from datasetStore import loadDatasetMBRs
+
+
+workloads_dir = os.path.join(os.path.dirname(parent_dir), 'Workloads')
+# Query workload -> Config attribute of the polygons it was generated for
+workloads = {"water": "water_polygon_name", "lakes": "lakes_polygon_name", "roads": "roads_polygon_name",
+             "poly5M": "uniform_polygon_name"}
+
+
+def queryIntervals(query_ranges, encoder=None):
+    encoder = encoder or getConfiguredEncoder()
+    return [Interval(*encoder.mbr_z_interval(query)) for query in query_ranges]
+
+
+def sequentialReplay(query_ranges, query_intervals):
+    order = sorted(range(len(query_intervals)), key=lambda i: query_intervals[i].min_val)
+    return query_ranges[order], [query_intervals[i] for i in order]
+
+
+def runPolicy(mbr_z_intervals, query_ranges, query_intervals, policy):
+    index = ColumnarIntervalCracking(mbr_z_intervals, cracking_policy=policy)
+    query_times = np.empty(len(query_ranges))
+    for i, (query, query_interval) in enumerate(zip(query_ranges, query_intervals)):
+        start_time = time.perf_counter()
+        index.adaptiveSearch(query_interval, query)
+        query_times[i] = time.perf_counter() - start_time
+    return query_times
+
+
+def main():
+    data_dir = "./"
+    for workload, polygon_name in workloads.items():
+        polygons_path = os.path.join(data_dir, getattr(Config(), polygon_name))
+        if not os.path.exists(polygons_path):
+            print(f"Skipping {workload}: {polygons_path} not found")
+            continue
+        mbr_z_intervals = getZAddressesForMBRsInCluster(loadDatasetMBRs(polygons_path))
+
+        query_ranges = np.load(os.path.join(workloads_dir, f"query_ranges_{workload}_100k.npy"), allow_pickle=True)
+        query_intervals = queryIntervals(query_ranges)
+        replays = {"random": (query_ranges, query_intervals),
+                   "sequential": sequentialReplay(query_ranges, query_intervals)}
+
+        for replay, (replay_ranges, replay_intervals) in replays.items():
+            for policy in CRACKING_POLICIES:
+                query_times = runPolicy(mbr_z_intervals, replay_ranges, replay_intervals, policy)
+                print(f"{workload:>7} {replay:>10} {policy:>8}: total = {query_times.sum():.3f} s, "
+                      f"first 1K = {query_times[:1000].sum():.3f} s, last 1K = {query_times[-1000:].sum():.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+    Reports how the resolution of the Z-addresses changes the candidates and the latency of the range query workloads
+    in Workloads/. A finer grid gives narrower z-intervals, so fewer intervals overlap the z-interval of a query
+    (candidates) and fewer of them are discarded by the MBR refinement, the results stay the same.
+"""
+
+
+import os
+import sys
+import time
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+cracking_splindex_dir = os.path.join(parent_dir, 'CrackingSPLindex')
+sys.path.append(cracking_splindex_dir)
+
+from IntervalCracking.columnarIntervalCracking import ColumnarIntervalCracking
+
+from ConfigParam import Config
+from ZAdress import MortonCode
+from datasetStore import loadDatasetMBRs
+from benchmarkPolicies import workloads, workloads_dir, queryIntervals
+
+
+# (scaleFactor, bits per axis) of the Z-addresses, from the default 16-bit grid to the finest 32-bit one
+resolutions = [(100, 16), (1000, 32), (10000, 32), (100000, 32), (10000000, 32)]
+
+
+def countCandidates(zmin, zmax, query_intervals):
+    # Intervals with zmin <= query max, minus those with zmax < query min (they all have zmin <= query max too)
+    zmin, zmax = np.sort(zmin), np.sort(zmax)
+    query_min = np.array([query_interval.min_val for query_interval in query_intervals], dtype=np.int64)
+    query_max = np.array([query_interval.max_val for query_interval in query_intervals], dtype=np.int64)
+    return np.searchsorted(zmin, query_max, side="right") - np.searchsorted(zmax, query_min, side="left")
+
+
+def runResolution(mbrs, query_ranges, encoder):
+    zmin, zmax = encoder.mbr_z_intervals(mbrs)
+    query_intervals = queryIntervals(query_ranges, encoder)
+    candidates = countCandidates(zmin, zmax, query_intervals)
+
+    index = ColumnarIntervalCracking([[(z_low, z_high), mbr] for z_low, z_high, mbr in zip(zmin.tolist(), zmax.tolist(), mbrs)])
+    query_times = np.empty(len(query_ranges))
+    results = 0
+    for i, (query, query_interval) in enumerate(zip(query_ranges, query_intervals)):
+        start_time = time.perf_counter()
+        results += len(index.adaptiveSearch(query_interval, query))
+        query_times[i] = time.perf_counter() - start_time
+    return candidates, results, query_times
+
+
+def main(num_queries=10000):
+    data_dir = "./"
+    for workload, polygon_name in workloads.items():
+        polygons_path = os.path.join(data_dir, getattr(Config(), polygon_name))
+        if not os.path.exists(polygons_path):
+            print(f"Skipping {workload}: {polygons_path} not found")
+            continue
+        mbrs = loadDatasetMBRs(polygons_path)
+        query_ranges = np.load(os.path.join(workloads_dir, f"query_ranges_{workload}_100k.npy"),
+                               allow_pickle=True)[:num_queries]
+
+        for scale_factor, bits in resolutions:
+            candidates, results, query_times = runResolution(mbrs, query_ranges, MortonCode(scale_factor, bits))
+            print(f"{workload:>7} scale = {scale_factor:>8} ({bits} bits): "
+                  f"candidates/query = {candidates.mean():.1f}, results/query = {results / len(query_ranges):.1f}, "
+                  f"total = {query_times.sum():.3f} s, last 1K = {query_times[-1000:].sum():.3f} s")
+
+
+if __name__ == "__main__":
+    main()
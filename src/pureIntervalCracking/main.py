@@ -13,32 +13,29 @@ from IntervalCracking.interval_structures import Interval
 from IntervalCracking.intervalCracking import IntervalCracking
 
 from ConfigParam import Config
-from ZAdress import MortonCode
+from spaceFillingCurve import getCurveEncoder
+from datasetStore import loadDatasetMBRs, polygonMBRs
 
 
 
-def getMBR(polygon):
-    return np.array(polygon.bounds)
 
+def getConfiguredEncoder():
+    return getCurveEncoder(Config().space_filling_curve, Config().morton_scale_factor, Config().morton_bits)
 
-def getZAddressesForMBRsInCluster(polygons):
-    X = np.array([getMBR(polygon) for polygon in polygons])
-    data = [(polygon, mbr) for polygon, mbr in zip(polygons, X)]
-    mbr_z_intervals = []
-    for original_polygon, mbr in data:
-        zmin = MortonCode().interleave_latlng(mbr[1], mbr[0])  # miny, minx
-        zmax = MortonCode().interleave_latlng(mbr[3], mbr[2])  # maxy, maxx
-        if zmin > zmax:
-            zmin, zmax = zmax, zmin
-        mbr_z_intervals.append([(zmin, zmax), mbr])
-    return mbr_z_intervals
+
+def getZAddressesForMBRsInCluster(polygons, curve_encoder=None):
+    # polygons: shapely polygons or their (n, 4) MBRs
+    X = polygonMBRs(polygons)
+    zmin, zmax = (curve_encoder or getConfiguredEncoder()).mbr_z_intervals(X)
+    return [[(z_low, z_high), mbr] for z_low, z_high, mbr in zip(zmin.tolist(), zmax.tolist(), X)]
 
 
 def main():
     data_dir = "./"
     polygons_path = os.path.join(data_dir, Config().water_polygon_name)
-    polygons = np.load(polygons_path, allow_pickle=True)
-    
+    # Memory-mapped MBRs of the polygons, converted from the pickled polygons on the first run (see datasetStore.py)
+    polygons = loadDatasetMBRs(polygons_path)
+
     range_query_path = "./"
     query_path = os.path.join(range_query_path, Config().water_query_range_path)
     query_ranges = np.load(query_path, allow_pickle=True)
@@ -48,13 +45,22 @@ def main():
     index = IntervalCracking(mbr_z_intervals)
 
     ######## Range Query ##########
-    for i, query in enumerate(query_ranges):
-        zmin = MortonCode().interleave_latlng(query[1], query[0])
-        zmax = MortonCode().interleave_latlng(query[3], query[2])
-        query_interval = Interval(zmin, zmax)
-
-        results = index.adaptiveSearch(query_interval, query)
-        print(f"Query {i} results: {len(results)}")
+    curve_encoder = getConfiguredEncoder()
+    batch_size = Config().query_batch_size
+    if batch_size:
+        # Each batch traverses the index once, a touched piece is cracked once on the boundaries of its queries
+        for start in range(0, len(query_ranges), batch_size):
+            batch = query_ranges[start:start + batch_size]
+            query_intervals = [Interval(*curve_encoder.mbr_z_interval(query)) for query in batch]
+
+            batch_results = index.adaptiveSearchBatch(query_intervals, batch)
+            print(f"Queries {start}-{start + len(batch) - 1} results: {sum(len(results) for results in batch_results)}")
+    else:
+        for i, query in enumerate(query_ranges):
+            query_interval = Interval(*curve_encoder.mbr_z_interval(query))
+
+            results = index.adaptiveSearch(query_interval, query)
+            print(f"Query {i} results: {len(results)}")
 
 
     end_cpu_time = time.time()
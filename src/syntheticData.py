@@ -0,0 +1,224 @@
+"""
+    Synthetic MBR datasets and range query workloads, generated offline and saved as plain (pickle-free) .npy arrays,
+    to benchmark the indexes at any scale without the datasets of ConfigParam.
+
+    1- Datasets: (n, 4) float arrays of MBRs (xmin, ymin, xmax, ymax) in longitude / latitude degrees.
+        - uniform:   centers uniform over the extent, log-normal sizes.
+        - gaussian:  centers drawn around Gaussian cluster centers (cities), log-normal sizes.
+        - zipf:      the extent is a grid of cells, a cell is picked with a Zipf-distributed popularity and the center
+                     is uniform in it, so a few cells hold most of the data.
+        - roads:     long and thin MBRs of road segments, mostly axis-parallel, around Gaussian cluster centers.
+
+       Large datasets are generated and written in chunks (saveDataset), so 100M MBRs never need more than one chunk
+       of temporary memory. CrackingSPLindex and benchmark.py accept the MBR arrays in place of polygons.
+
+    2- Queries: (q, 4) arrays of query rectangles returning a target fraction (selectivity) of the data, fitted on a
+       sample of the data by WorkloadGenerator (workloadGenerator.py). Centers are either drawn from the data (queries
+       follow the data, like the workloads of Workloads/) or uniform. The fit depends on the size of the sample, not of
+       the data: 100k queries take about 6 s from 10M or 100M MBRs, and the example below about 10 s in all.
+
+    Example:
+        python syntheticData.py --distribution zipf --size 10000000 --queries 100000 --selectivity 0.0001 --output data/
+"""
+
+
+import argparse
+import os
+
+import numpy as np
+
+from workloadGenerator import WorkloadGenerator
+
+
+EXTENT = (-180.0, -90.0, 180.0, 90.0)
+DISTRIBUTIONS = ("uniform", "gaussian", "zipf", "roads")
+
+
+
+# ----------------------------------------------------------------------- #
+#                                 Datasets
+# ----------------------------------------------------------------------- #
+
+def mbrsAround(centers, widths, heights, extent=EXTENT):
+    xmin, ymin, xmax, ymax = extent
+    mbrs = np.empty((len(centers), 4))
+    mbrs[:, 0] = centers[:, 0] - widths / 2
+    mbrs[:, 1] = centers[:, 1] - heights / 2
+    mbrs[:, 2] = centers[:, 0] + widths / 2
+    mbrs[:, 3] = centers[:, 1] + heights / 2
+    np.clip(mbrs[:, 0::2], xmin, xmax, out=mbrs[:, 0::2])
+    np.clip(mbrs[:, 1::2], ymin, ymax, out=mbrs[:, 1::2])
+    return mbrs
+
+
+def logNormalSizes(rng, n, mean_size):
+    # Sizes spread over about two orders of magnitude, with a mean of mean_size degrees
+    sigma = 1.0
+    return rng.lognormal(np.log(mean_size) - sigma ** 2 / 2, sigma, size=(n, 2))
+
+
+def uniformMBRs(rng, n, mean_size=0.01, extent=EXTENT):
+    xmin, ymin, xmax, ymax = extent
+    centers = rng.uniform((xmin, ymin), (xmax, ymax), size=(n, 2))
+    sizes = logNormalSizes(rng, n, mean_size)
+    return mbrsAround(centers, sizes[:, 0], sizes[:, 1], extent)
+
+
+def clusterCenters(seed, n_clusters, extent=EXTENT):
+    # Cluster centers are drawn from their own seed, so that every chunk of a dataset shares them
+    xmin, ymin, xmax, ymax = extent
+    return np.random.default_rng([seed, n_clusters]).uniform((xmin, ymin), (xmax, ymax), size=(n_clusters, 2))
+
+
+def gaussianMBRs(rng, n, mean_size=0.01, extent=EXTENT, seed=0, n_clusters=100, spread=2.0):
+    """:param spread: Standard deviation of the centers around their cluster center, in degrees"""
+    cluster_centers = clusterCenters(seed, n_clusters, extent)
+    centers = cluster_centers[rng.integers(n_clusters, size=n)] + rng.normal(0.0, spread, size=(n, 2))
+    sizes = logNormalSizes(rng, n, mean_size)
+    return mbrsAround(centers, sizes[:, 0], sizes[:, 1], extent)
+
+
+def zipfMBRs(rng, n, mean_size=0.01, extent=EXTENT, seed=0, grid_size=256, exponent=1.2):
+    """
+       :param grid_size: The extent is split into grid_size x grid_size cells
+       :param exponent: Zipf exponent of the popularity of the cells, larger is more skewed
+    """
+    xmin, ymin, xmax, ymax = extent
+    n_cells = grid_size * grid_size
+    popularity = np.arange(1, n_cells + 1, dtype=np.float64) ** -exponent
+    # The most popular cells are scattered over the extent
+    cell_ranks = np.random.default_rng([seed, n_cells]).permutation(n_cells)
+    cells = cell_ranks[np.searchsorted(np.cumsum(popularity / popularity.sum()), rng.random(n), side="right")
+                       .clip(0, n_cells - 1)]
+
+    cell_width, cell_height = (xmax - xmin) / grid_size, (ymax - ymin) / grid_size
+    centers = np.empty((n, 2))
+    centers[:, 0] = xmin + (cells % grid_size + rng.random(n)) * cell_width
+    centers[:, 1] = ymin + (cells // grid_size + rng.random(n)) * cell_height
+    sizes = logNormalSizes(rng, n, mean_size)
+    return mbrsAround(centers, sizes[:, 0], sizes[:, 1], extent)
+
+
+def roadMBRs(rng, n, mean_size=0.01, extent=EXTENT, seed=0, n_clusters=100, spread=2.0, axis_parallel=0.7):
+    """
+       MBRs of straight road segments: a length (mean_size * 5 on average) and a direction, close to one of the axes
+       for a fraction axis_parallel of the segments, so most MBRs are long and thin.
+    """
+    cluster_centers = clusterCenters(seed, n_clusters, extent)
+    centers = cluster_centers[rng.integers(n_clusters, size=n)] + rng.normal(0.0, spread, size=(n, 2))
+    lengths = logNormalSizes(rng, n, 5 * mean_size)[:, 0]
+    angles = np.where(rng.random(n) < axis_parallel,
+                      rng.integers(2, size=n) * (np.pi / 2) + rng.normal(0.0, 0.02, size=n),
+                      rng.uniform(0.0, np.pi, size=n))
+    widths = np.abs(lengths * np.cos(angles))
+    heights = np.abs(lengths * np.sin(angles))
+    return mbrsAround(centers, widths, heights, extent)
+
+
+generators = {"uniform": uniformMBRs, "gaussian": gaussianMBRs, "zipf": zipfMBRs, "roads": roadMBRs}
+
+
+def generateMBRs(distribution, n, seed=0, mean_size=0.01, dtype=np.float64, **kwargs):
+    """
+       Returns an (n, 4) array of MBRs of the given distribution.
+
+       :param kwargs: Parameters of the distribution (n_clusters, spread, grid_size, exponent, axis_parallel)
+    """
+    if distribution not in generators:
+        raise ValueError(f"Unknown distribution {distribution!r}, expected one of {DISTRIBUTIONS}")
+    return generateChunk(distribution, np.random.default_rng(seed), n, seed, mean_size, kwargs).astype(dtype, copy=False)
+
+
+def generateChunk(distribution, rng, n, seed, mean_size, kwargs):
+    # Cluster centers and popular cells come from the dataset seed, the MBRs from rng
+    if distribution != "uniform":
+        kwargs = dict(kwargs, seed=seed)
+    return generators[distribution](rng, n, mean_size, **kwargs)
+
+
+def saveDataset(path, distribution, n, seed=0, mean_size=0.01, dtype=np.float64, chunk_size=10_000_000, **kwargs):
+    """
+       Generates n MBRs chunk by chunk straight into the .npy file at path (a memory-mapped array), every chunk from
+       its own seed, so a dataset only depends on (distribution, n, seed, chunk_size, parameters).
+    """
+    if distribution not in generators:
+        raise ValueError(f"Unknown distribution {distribution!r}, expected one of {DISTRIBUTIONS}")
+    mbrs = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(n, 4))
+    for chunk, start in enumerate(range(0, n, chunk_size)):
+        end = min(start + chunk_size, n)
+        rng = np.random.default_rng([seed, chunk])
+        mbrs[start:end] = generateChunk(distribution, rng, end - start, seed, mean_size, kwargs)
+    mbrs.flush()
+    return path
+
+
+def loadMBRs(path, mmap=False):
+    return np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+
+
+def toPolygons(mbrs):
+    """Shapely rectangles of the MBRs, for the code that needs polygons (an object array, not pickle-free)."""
+    import shapely
+    return shapely.box(mbrs[:, 0], mbrs[:, 1], mbrs[:, 2], mbrs[:, 3])
+
+
+
+# ----------------------------------------------------------------------- #
+#                                 Queries
+# ----------------------------------------------------------------------- #
+
+def generateQueries(mbrs, n_queries, selectivity, seed=0, centers="data", aspect_ratio=1.0, sample_size=100_000,
+                    extent=EXTENT):
+    """
+       Returns an (n_queries, 4) array of uniformly placed query rectangles that each return about
+       selectivity * len(mbrs) MBRs (see workloadGenerator.py for skewed and sequential patterns).
+
+       :param centers: "data" draws the query centers from the centers of the MBRs, "uniform" from the extent
+       :param aspect_ratio: Width / height of the queries, or a (low, high) range to draw it from log-uniformly
+       :param sample_size: The query sizes are fitted on a sample of this many MBRs, which sets their precision
+    """
+    generator = WorkloadGenerator(extent, mbrs, seed, sample_size)
+    return generator.generate("uniform", n_queries, selectivity=selectivity, centers=centers, aspect_ratio=aspect_ratio)
+
+
+def querySelectivity(mbrs, queries):
+    """The fraction of the MBRs returned by every query, by a scan."""
+    return np.array([np.count_nonzero((mbrs[:, 2] > xmin) & (mbrs[:, 0] < xmax) &
+                                      (mbrs[:, 3] > ymin) & (mbrs[:, 1] < ymax))
+                     for xmin, ymin, xmax, ymax in queries]) / len(mbrs)
+
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Generates synthetic MBR datasets and range query workloads.")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--size", type=int, default=1_000_000, help="Number of MBRs")
+    parser.add_argument("--mean-size", type=float, default=0.01, help="Mean width / height of an MBR in degrees")
+    parser.add_argument("--queries", type=int, default=100_000, help="Number of queries (0 for none)")
+    parser.add_argument("--selectivity", type=float, default=0.0001, help="Fraction of the MBRs a query returns")
+    parser.add_argument("--query-centers", choices=("data", "uniform"), default="data")
+    parser.add_argument("--float32", action="store_true", help="Store the MBRs as float32 (half the size)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="data/", help="Directory of the generated .npy files")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArguments()
+    os.makedirs(args.output, exist_ok=True)
+    dtype = np.float32 if args.float32 else np.float64
+
+    dataset_path = os.path.join(args.output, f"{args.distribution}_{args.size}.npy")
+    saveDataset(dataset_path, args.distribution, args.size, args.seed, args.mean_size, dtype)
+    print(f"{args.size} {args.distribution} MBRs written to {dataset_path}")
+
+    if args.queries:
+        mbrs = loadMBRs(dataset_path, mmap=True)
+        queries = generateQueries(mbrs, args.queries, args.selectivity, args.seed, args.query_centers)
+        queries_path = os.path.join(args.output, f"query_ranges_{args.distribution}_{args.size}_{args.selectivity:g}.npy")
+        np.save(queries_path, queries, allow_pickle=False)
+        print(f"{args.queries} queries of selectivity {args.selectivity:g} written to {queries_path}")
+
+
+if __name__ == "__main__":
+    main()
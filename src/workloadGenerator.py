@@ -0,0 +1,329 @@
+"""
+    Query workload generator for the temporal (HDHI admissions, 1-D intervals) and the spatial (MBRs, 2-D rectangles)
+    indexes. A query is a box in d dimensions, (low_1, ..., low_d, high_1, ..., high_d): (start, end) in days or
+    (xmin, ymin, xmax, ymax) in degrees, and a workload is a (q, 2d) array of queries saved as a plain .npy file.
+
+    1- Patterns (where the queries are):
+        - uniform:    centers uniform over the extent, or drawn from the data.
+        - hotspots:   a few hot regions with Zipf-distributed popularity, queries scattered around them.
+        - sequential: a sweep over the extent, along the time axis, or in a serpentine of rows in 2-D.
+        - zoom:       sessions around a focus point, zooming in (the queries shrink), out (they grow) or in and out.
+        - shifting:   a single hot region that moves to a new place every period queries.
+
+    2- Sizes (how large they are), either:
+        - widths:      absolute widths (e.g. 1, 7 or 30 days), or
+        - selectivity: fractions of the data to return. With data, the half-size of a query around its center is
+                       fitted on a sample of the data (the half-size at which the k-th box of the sample overlaps it).
+                       Without data, a selectivity is read as a fraction of the volume of the extent.
+       A single value gives fixed-size queries and a list of values a mix, each query drawing one of them. Zoom
+       sessions go from the largest to the smallest value of the list (and back).
+
+    Cracking adapts to the queries it sees, so these patterns stress the cases that uniform-random queries miss:
+    converging on hot regions, sweeping through the data, and the hot region moving away from the cracked pieces.
+
+    Example:
+        python workloadGenerator.py --data data/zipf_1000000.npy --pattern shifting --queries 100000 \\
+                                    --selectivity 0.0001 0.001 --output data/query_ranges_zipf_shifting.npy
+"""
+
+
+import argparse
+from itertools import chain
+
+import numpy as np
+
+
+PATTERNS = ("uniform", "hotspots", "sequential", "zoom", "shifting")
+
+# Quantiles of the half-sizes of the sample boxes splitting them into the bands of candidateBoxes, the boxes above the
+# last one are candidates of every query
+BAND_QUANTILES = (0.9, 0.99, 0.999)
+
+
+
+# ----------------------------------------------------------------------- #
+#                         Workload Generator Class
+# ----------------------------------------------------------------------- #
+
+class WorkloadGenerator:
+    def __init__(self, extent, data=None, seed=0, sample_size=100_000):
+        """
+           :param extent: The domain of the queries, (low_1, ..., low_d, high_1, ..., high_d)
+           :param data: Optional (n, 2d) array of the boxes of the data (e.g. MBRs, or [start, end] intervals), to
+                        draw query centers from and to fit query sizes to selectivities
+           :param sample_size: Query sizes are fitted on a sample of this many boxes, which sets their precision
+        """
+        extent = np.asarray(extent, dtype=np.float64)
+        self.dimensions = len(extent) // 2
+        self.lows, self.highs = extent[:self.dimensions], extent[self.dimensions:]
+        self.rng = np.random.default_rng(seed)
+
+        self.data = data
+        if data is not None:
+            sample = np.asarray(data[np.sort(self.rng.choice(len(data), size=min(sample_size, len(data)),
+                                                             replace=False))], dtype=np.float64)
+            sample = sample.reshape(len(sample), 2 * self.dimensions)
+            # Column-major, the distances to the sample are computed one axis at a time
+            self.sample_centers = np.asfortranarray((sample[:, :self.dimensions] + sample[:, self.dimensions:]) / 2)
+            self.sample_half_sizes = np.asfortranarray((sample[:, self.dimensions:] - sample[:, :self.dimensions]) / 2)
+            self.sample_bands = None    # KD-trees of the sample centers, built on the first fit (see candidateBoxes)
+
+    def generate(self, pattern, n_queries, selectivity=None, widths=None, centers=None, aspect_ratio=1.0,
+                 resolution=None, **pattern_params):
+        """
+           Returns an (n_queries, 2d) array of queries.
+
+           :param pattern: One of PATTERNS, pattern_params are passed to its method (e.g. n_hotspots, period)
+           :param selectivity: Fraction(s) of the data a query returns
+           :param widths: Absolute width(s) of the queries, instead of a selectivity
+           :param centers: "data" or "uniform" query centers (and hotspots, focus points), "data" if there is data
+           :param aspect_ratio: Width / height of 2-D queries, or a (low, high) range to draw it from log-uniformly
+           :param resolution: Snap the low corners of the queries down to multiples of it (e.g. 1 for whole days),
+                              the widths are kept
+        """
+        if pattern not in PATTERNS:
+            raise ValueError(f"Unknown pattern {pattern!r}, expected one of {PATTERNS}")
+        if (selectivity is None) == (widths is None):
+            raise ValueError("Give either a selectivity or widths")
+        centers = centers or ("data" if self.data is not None else "uniform")
+        if centers == "data" and self.data is None:
+            raise ValueError("Query centers can only be drawn from the data if there is data")
+
+        sizes = np.atleast_1d(np.asarray(selectivity if widths is None else widths, dtype=np.float64))
+        if pattern == "zoom":
+            query_centers, scales = self.zoomCenters(n_queries, centers, **pattern_params)
+            # Geometric steps from the largest to the smallest size
+            size_values = sizes.max() * (sizes.min() / sizes.max()) ** scales
+        else:
+            query_centers = getattr(self, f"{pattern}Centers")(n_queries, centers, **pattern_params)
+            size_values = sizes[self.rng.integers(len(sizes), size=n_queries)]
+
+        # Half-size of every axis relative to the last one, per query
+        ratios = np.ones((n_queries, self.dimensions))
+        if self.dimensions > 1:
+            if np.isscalar(aspect_ratio):
+                ratios[:, 0] = aspect_ratio
+            else:
+                low, high = aspect_ratio
+                ratios[:, 0] = np.exp(self.rng.uniform(np.log(low), np.log(high), size=n_queries))
+        if widths is None:
+            half_sizes = self.fitHalfSizes(query_centers, size_values, ratios)
+        else:
+            half_sizes = (size_values / 2)[:, None] * ratios / ratios.max(axis=1, keepdims=True)
+
+        lows, highs = query_centers - half_sizes, query_centers + half_sizes
+        if resolution is not None:
+            lows = np.floor(lows / resolution) * resolution
+            highs = lows + 2 * half_sizes
+        # Keep the queries in the extent (the Z-address grid wraps coordinates outside of it around)
+        return np.concatenate((np.clip(lows, self.lows, self.highs), np.clip(highs, self.lows, self.highs)), axis=1)
+
+    # ------------------------------ Patterns ------------------------------ #
+    # Every pattern returns the (n_queries, d) centers of the queries
+
+    def randomPoints(self, n, centers):
+        if centers == "data":
+            data = self.data
+            boxes = np.asarray(data[np.sort(self.rng.integers(len(data), size=n))], dtype=np.float64)
+            boxes = boxes.reshape(n, 2 * self.dimensions)
+            return self.rng.permutation((boxes[:, :self.dimensions] + boxes[:, self.dimensions:]) / 2)
+        return self.rng.uniform(self.lows, self.highs, size=(n, self.dimensions))
+
+    def uniformCenters(self, n_queries, centers):
+        return self.randomPoints(n_queries, centers)
+
+    def hotspotsCenters(self, n_queries, centers, n_hotspots=10, exponent=1.0, spread=0.01):
+        """
+           :param exponent: Zipf exponent of the popularity of the hotspots
+           :param spread: Standard deviation of the queries around their hotspot, as a fraction of the extent
+        """
+        hotspots = self.randomPoints(n_hotspots, centers)
+        popularity = np.arange(1, n_hotspots + 1, dtype=np.float64) ** -exponent
+        chosen = self.rng.choice(n_hotspots, size=n_queries, p=popularity / popularity.sum())
+        return self.scatter(hotspots[chosen], spread)
+
+    def sequentialCenters(self, n_queries, centers, rows=None):
+        """
+           Sweeps the extent in order of the first axis, and in 2-D in a serpentine of rows along the second axis.
+
+           :param rows: Number of rows of the sweep in 2-D (sqrt(n_queries) by default)
+        """
+        points = self.randomPoints(n_queries, centers)
+        if self.dimensions == 1:
+            return points[np.argsort(points[:, 0], kind="stable")]
+        rows = rows or max(1, int(np.sqrt(n_queries)))
+        row = np.clip(((points[:, 1] - self.lows[1]) / (self.highs[1] - self.lows[1]) * rows).astype(np.int64),
+                      0, rows - 1)
+        # Even rows go along the first axis, odd rows back
+        along = np.where(row % 2 == 0, points[:, 0], -points[:, 0])
+        return points[np.lexsort((along, row))]
+
+    def zoomCenters(self, n_queries, centers, steps=10, direction="in", spread=0.001):
+        """
+           Sessions of steps queries around a focus point, with the scale of the queries going from 0 (largest) to 1
+           (smallest) to zoom in, from 1 to 0 to zoom out, or both ("inout").
+
+           :return: (centers, scales)
+        """
+        if direction not in ("in", "out", "inout"):
+            raise ValueError(f"Unknown zoom direction {direction!r}, expected 'in', 'out' or 'inout'")
+        session = np.linspace(0.0, 1.0, steps)
+        if direction == "out":
+            session = session[::-1]
+        elif direction == "inout":
+            session = np.concatenate((session, session[-2:0:-1]))
+
+        n_sessions = -(-n_queries // len(session))
+        focus_points = self.randomPoints(n_sessions, centers)
+        query_centers = self.scatter(np.repeat(focus_points, len(session), axis=0)[:n_queries], spread)
+        return query_centers, np.tile(session, n_sessions)[:n_queries]
+
+    def shiftingCenters(self, n_queries, centers, period=1000, spread=0.01):
+        """The hot region moves to a new random place every period queries."""
+        n_periods = -(-n_queries // period)
+        hot_regions = self.randomPoints(n_periods, centers)
+        return self.scatter(np.repeat(hot_regions, period, axis=0)[:n_queries], spread)
+
+    def scatter(self, points, spread):
+        # Gaussian noise of spread times the extent, kept in the extent
+        noise = self.rng.normal(0.0, spread, size=points.shape) * (self.highs - self.lows)
+        return np.clip(points + noise, self.lows, self.highs)
+
+    # ------------------------------- Sizes -------------------------------- #
+
+    def fitHalfSizes(self, query_centers, selectivities, ratios):
+        """
+           Returns the (n_queries, d) half-sizes of the queries returning about the given fractions of the data,
+           with the (n_queries, d) ratios between their axes.
+
+           A query of half-sizes h * ratios around a center overlaps a box iff h is above their Chebyshev distance
+           (scaled by ratios), so the h returning k boxes of the sample lies between its k-th and next distances.
+           The distances are computed for blocks of queries at once, to the candidate boxes of candidateBoxes only.
+        """
+        if self.data is None:
+            # Uniform data: the selectivity is the fraction of the volume of the extent
+            volume_fraction = selectivities[:, None] ** (1 / self.dimensions)
+            return volume_fraction * (self.highs - self.lows) / 2 * ratios / \
+                np.prod(ratios, axis=1, keepdims=True) ** (1 / self.dimensions)
+
+        n_sample = len(self.sample_centers)
+        ks = np.clip(np.round(selectivities * n_sample).astype(np.int64), 1, n_sample)
+        half_sizes = np.empty((len(query_centers), self.dimensions))
+        # Blocks of queries with about a million (query, box) pairs
+        pairs_per_query = int(ks.max(initial=0)) + 1 + int((1 - BAND_QUANTILES[-1]) * n_sample)
+        block_size = max(1, min(4096, 2 ** 20 // pairs_per_query))
+        for start in range(0, len(query_centers), block_size):
+            centers, block_ks, block_ratios = (array[start:start + block_size]
+                                               for array in (query_centers, ks, ratios))
+            queries, boxes = self.candidateBoxes(centers, block_ks, block_ratios)
+            distances = np.full(len(queries), -np.inf)
+            for axis in range(self.dimensions):
+                axis_distances = np.abs(self.sample_centers[:, axis].take(boxes) - centers[:, axis].take(queries))
+                axis_distances -= self.sample_half_sizes[:, axis].take(boxes)
+                axis_distances /= block_ratios[:, axis].take(queries)
+                np.maximum(distances, axis_distances, out=distances)
+            # The distances of every query in increasing order, one query after the other (a stable sort of the small
+            # query numbers after the sort of the distances is a lot faster than np.lexsort)
+            order = np.argsort(distances)
+            distances = distances[order[np.argsort(queries[order].astype(np.int16), kind="stable")]]
+            counts = np.bincount(queries, minlength=len(centers))
+            starts = np.cumsum(counts) - counts
+
+            kth = distances[starts + block_ks - 1]
+            next_kth = distances[np.minimum(starts + block_ks, starts + counts - 1)]
+            # Halfway between the k-th and the next box, so that rounding (e.g. to float32) keeps the count
+            half_size = np.where(block_ks < n_sample, np.maximum((kth + next_kth) / 2, 0.0),
+                                 np.maximum(kth, 0.0) * 2 + 1e-9)
+            half_sizes[start:start + len(centers)] = half_size[:, None] * block_ratios
+        return half_sizes
+
+    def candidateBoxes(self, centers, ks, ratios):
+        """
+           Returns the (query, box) pairs of the sample boxes that may be among the k + 1 nearest of every query, as
+           two arrays of indices of the queries and of the sample.
+
+           The distance of a box is at most the scaled Chebyshev distance of its center, itself at most their distance
+           / min(ratios), so the k + 1 nearest centers bound the (k + 1)-th distance by R. A box within R has its
+           center within max(ratios) * (R + half-size / min(ratios)) of the query. The sample is split into bands of
+           half-sizes (BAND_QUANTILES), each with a KD-tree of its centers searched with its largest half-size, and
+           the widest boxes are candidates of every query.
+        """
+        if self.sample_bands is None:
+            from scipy.spatial import cKDTree
+            extents = self.sample_half_sizes.max(axis=1)
+            band_extents = np.quantile(extents, BAND_QUANTILES)
+            bands = np.searchsorted(band_extents, extents)
+            self.sample_bands = []      # (tree, boxes, largest half-size) of every non-empty band
+            for band, band_extent in enumerate(band_extents):
+                band_boxes = np.flatnonzero(bands == band)
+                if len(band_boxes):
+                    self.sample_bands.append((cKDTree(self.sample_centers[band_boxes]), band_boxes, band_extent))
+            self.widest_boxes = np.flatnonzero(bands == len(band_extents))
+
+        n_sample = len(self.sample_centers)
+        narrowest_tree, narrowest_boxes, _ = self.sample_bands[0]
+        queries, boxes = [], []
+        # Queries with more than the narrowest band to choose from take the whole sample
+        whole = np.flatnonzero(ks >= len(narrowest_boxes))
+        queries.append(np.repeat(whole, n_sample))
+        boxes.append(np.tile(np.arange(n_sample), len(whole)))
+
+        searched = np.flatnonzero(ks < len(narrowest_boxes))
+        min_ratios, max_ratios = ratios[searched].min(axis=1), ratios[searched].max(axis=1)
+        bounds = np.empty(len(searched))
+        for k in np.unique(ks[searched]):
+            with_k = ks[searched] == k
+            bounds[with_k] = narrowest_tree.query(centers[searched[with_k]], k=[k + 1], p=np.inf)[0][:, 0]
+        bounds /= min_ratios
+
+        for tree, band_boxes, band_extent in self.sample_bands:
+            # The slack covers rounding errors of the radii
+            radii = max_ratios * (bounds + band_extent / min_ratios) * (1 + 1e-9) + 1e-12
+            neighbours = tree.query_ball_point(centers[searched], radii, p=np.inf, return_sorted=False)
+            lengths = np.fromiter(map(len, neighbours), dtype=np.int64, count=len(neighbours))
+            queries.append(np.repeat(searched, lengths))
+            boxes.append(band_boxes[np.fromiter(chain.from_iterable(neighbours), dtype=np.int64,
+                                                count=int(lengths.sum()))])
+        queries.append(np.repeat(searched, len(self.widest_boxes)))
+        boxes.append(np.tile(self.widest_boxes, len(searched)))
+        return np.concatenate(queries), np.concatenate(boxes)
+
+
+def saveWorkload(path, queries, dtype=None):
+    """Saves a workload as a plain .npy file (dtype=np.float32 halves it, np.int32 suits whole days)."""
+    np.save(path, queries if dtype is None else queries.astype(dtype), allow_pickle=False)
+
+
+def loadWorkload(path):
+    return np.load(path, allow_pickle=False)
+
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Generates range query workloads with skew and query patterns.")
+    parser.add_argument("--data", help="(n, 2d) .npy of the data boxes, e.g. MBRs of syntheticData.py")
+    parser.add_argument("--extent", type=float, nargs="+", default=[-180.0, -90.0, 180.0, 90.0],
+                        help="Domain of the queries, lows then highs")
+    parser.add_argument("--pattern", choices=PATTERNS, default="uniform")
+    parser.add_argument("--queries", type=int, default=100_000)
+    parser.add_argument("--selectivity", type=float, nargs="+", help="Fraction(s) of the data a query returns")
+    parser.add_argument("--widths", type=float, nargs="+", help="Absolute width(s) of the queries")
+    parser.add_argument("--centers", choices=("data", "uniform"))
+    parser.add_argument("--float32", action="store_true", help="Store the queries as float32 (half the size)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="Path of the .npy workload")
+    return parser.parse_args()
+
+
+def main():
+    args = parseArguments()
+    data = np.load(args.data, mmap_mode="r", allow_pickle=False) if args.data else None
+    generator = WorkloadGenerator(args.extent, data, args.seed)
+    queries = generator.generate(args.pattern, args.queries, selectivity=args.selectivity, widths=args.widths,
+                                 centers=args.centers)
+    saveWorkload(args.output, queries, np.float32 if args.float32 else None)
+    print(f"{len(queries)} {args.pattern} queries written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()